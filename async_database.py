@@ -0,0 +1,143 @@
+"""Mặt tiền bất đồng bộ cho database.py.
+
+Các hàm có cùng tên và tham số với database.py nhưng chạy trên thread riêng để
+không chặn event loop: mọi thao tác ghi đi qua một thread ghi duy nhất (ghi tuần
+tự, khớp với kết nối ghi của pool), còn các truy vấn đọc dùng chung một thread pool.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from src.utils.history_cache import HistoryCache
+
+READ_WORKERS = 4
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-read")
+
+# Lịch sử gần nhất của các thread đang hoạt động, cập nhật ngay trên thread ghi sau mỗi add_message
+history_cache = HistoryCache()
+
+async def run_write(func, *args, **kwargs):
+    """Chạy hàm ghi trên thread ghi của cơ sở dữ liệu."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, functools.partial(func, *args, **kwargs))
+
+async def run_read(func, *args, **kwargs):
+    """Chạy hàm chỉ đọc trên thread pool đọc dùng chung."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+async def execute(sql, params=()):
+    """Thực thi một câu lệnh ghi trong transaction riêng, trả về số dòng bị ảnh hưởng."""
+    def _execute():
+        with database.get_pool().transaction() as c:
+            c.execute(sql, params)
+            return c.rowcount
+    return await run_write(_execute)
+
+async def fetch_all(sql, params=()):
+    """Thực thi một truy vấn đọc và trả về toàn bộ kết quả."""
+    def _fetch_all():
+        with database.get_pool().reader() as c:
+            c.execute(sql, params)
+            return c.fetchall()
+    return await run_read(_fetch_all)
+
+def shutdown():
+    """Dừng các thread cơ sở dữ liệu sau khi hoàn tất công việc đang chờ."""
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    logging.info("Shut down async database executors")
+
+async def init_db():
+    return await run_write(database.init_db)
+
+async def add_gpt_batch_job(batch_id, thread_id, user_id, request_data):
+    return await run_write(database.add_gpt_batch_job, batch_id, thread_id, user_id, request_data)
+
+async def update_gpt_batch_job(batch_id, status, response_data=None, completed_at=None):
+    return await run_write(database.update_gpt_batch_job, batch_id, status, response_data, completed_at)
+
+async def get_gpt_batch_job(batch_id):
+    return await run_read(database.get_gpt_batch_job, batch_id)
+
+async def get_pending_gpt_batch_jobs():
+    return await run_read(database.get_pending_gpt_batch_jobs)
+
+async def add_message(thread_id, message_id, role, content, db_type, mode=None, user_id=None, batch_id=None):
+    def _add_message():
+        added = database.add_message(thread_id, message_id, role, content, db_type,
+                                     mode=mode, user_id=user_id, batch_id=batch_id)
+        if added:
+            history_cache.append(database.chat_table(db_type), thread_id, user_id, role, content)
+        return added
+    return await run_write(_add_message)
+
+async def get_history(thread_id, limit=20, db_type='mental', user_id=None):
+    """Lịch sử từ ``history_cache``; thread chưa có trong cache được nạp ``capacity`` tin gần nhất từ đĩa."""
+    table = database.chat_table(db_type)
+    history = history_cache.get(table, thread_id, user_id, limit)
+    if history is not None:
+        return history
+    if limit > history_cache.capacity:
+        return await run_read(database.get_history, thread_id, limit=limit, db_type=db_type, user_id=user_id)
+    def _load_history():
+        history_cache.begin_load(table, thread_id)
+        messages = []
+        try:
+            messages = database.get_history(thread_id, limit=history_cache.capacity, db_type=db_type, user_id=user_id)
+        finally:
+            history_cache.finish_load(table, thread_id, user_id, messages)
+        return messages[-limit:] if limit > 0 else []
+    return await run_read(_load_history)
+
+async def is_message_exists(message_id, db_type):
+    return await run_read(database.is_message_exists, message_id, db_type)
+
+async def get_thread_summary(db_type, thread_id, user_id=None):
+    return await run_read(database.get_thread_summary, db_type, thread_id, user_id)
+
+async def save_thread_summary(db_type, thread_id, user_id, summary, through_id):
+    return await run_write(database.save_thread_summary, db_type, thread_id, user_id, summary, through_id)
+
+async def get_messages_to_summarize(db_type, thread_id, user_id=None, after_id=0, keep_recent=0, limit=200):
+    return await run_read(database.get_messages_to_summarize, db_type, thread_id, user_id, after_id, keep_recent, limit)
+
+def _pruned(db_type, deleted):
+    # Tin trong cache có thể vừa bị xóa khỏi đĩa
+    if deleted:
+        history_cache.invalidate(database.chat_table(db_type))
+    return deleted
+
+async def delete_expired_messages(db_type, max_age_days, limit=database.PRUNE_BATCH_SIZE):
+    return await run_write(lambda: _pruned(db_type, database.delete_expired_messages(db_type, max_age_days, limit)))
+
+async def trim_thread_history(db_type, max_per_thread, max_threads=database.PRUNE_BATCH_SIZE):
+    return await run_write(lambda: _pruned(db_type, database.trim_thread_history(db_type, max_per_thread, max_threads)))
+
+async def compact_db(min_free_ratio=database.COMPACT_FREE_RATIO):
+    return await run_write(database.compact_db, min_free_ratio)
+
+async def add_news_article(article_id, title, published):
+    return await run_write(database.add_news_article, article_id, title, published)
+
+async def is_article_sent(article_id):
+    return await run_read(database.is_article_sent, article_id)
+
+async def add_reddit_post(post_id, subreddit, title, posted_at):
+    return await run_write(database.add_reddit_post, post_id, subreddit, title, posted_at)
+
+async def is_reddit_post_sent(post_id, subreddit):
+    return await run_read(database.is_reddit_post_sent, post_id, subreddit)
+
+async def get_queue(guild_id):
+    return await run_read(database.get_queue, guild_id)
+
+async def add_x_user(username):
+    return await run_write(database.add_x_user, username)
+
+async def clear_news_articles():
+    return await run_write(database.clear_news_articles)
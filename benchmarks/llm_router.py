@@ -0,0 +1,149 @@
+"""Kiểm tra LLMRouter với một server giả lập API chat completions (SSE) chạy tại localhost.
+
+Mỗi model trên server giả có độ trễ token đầu / mã lỗi cấu hình được; các kịch bản kiểm tra
+hedging, fallback khi lỗi, circuit breaker và định tuyến theo độ trễ, rồi in PASS/FAIL.
+
+Chạy: python benchmarks/llm_router.py
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.http import close_sessions
+from src.utils.llm_providers import OpenAICompatibleProvider, ProviderError
+from src.utils.llm_router import LLMRouter
+
+class StubServer:
+    """Server SSE giả: ``models[name] = {"ttft": giây, "status": mã lỗi hoặc None, "tokens": số token}``."""
+
+    def __init__(self):
+        self.models = {}
+        self.calls = {}
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        body = await request.json()
+        model = body["model"]
+        config = self.models[model]
+        self.calls[model] = self.calls.get(model, 0) + 1
+        await asyncio.sleep(config.get("ttft", 0))
+        if config.get("status"):
+            return web.json_response({"error": {"message": "stub error"}}, status=config["status"])
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(config.get("tokens", 5)):
+            chunk = {"choices": [{"index": 0, "delta": {"content": f"{model}-{i} "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(config.get("token_interval", 0.01))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+class Collector:
+    """Thay cho DiscordStreamWriter: ghi lại text được stream và số lần reset."""
+
+    def __init__(self):
+        self.text = ""
+        self.resets = 0
+
+    async def write(self, text):
+        self.text += text
+
+    async def reset(self):
+        self.text = ""
+        self.resets += 1
+
+def make_router(server, names, **kwargs):
+    providers = [OpenAICompatibleProvider(name, name, server.url, "stub-key") for name in names]
+    return LLMRouter("stub", providers, **kwargs)
+
+MESSAGES = [{"role": "user", "content": "xin chào"}]
+
+async def scenario_hedge(server):
+    server.models = {"primary": {"ttft": 2.0}, "fallback": {"ttft": 0.1}}
+    router = make_router(server, ["primary", "fallback"], hedge_delay=0.3)
+    stream = Collector()
+    start = time.monotonic()
+    text = await router.complete(MESSAGES, stream=stream)
+    elapsed = time.monotonic() - start
+    ok = text.startswith("fallback-0") and stream.text == text and elapsed < 1.5
+    return ok, f"primary chậm 2s, hedge sau 0.3s -> {text.split()[0]} trong {elapsed:.2f}s"
+
+async def scenario_fallback_on_error(server):
+    server.models = {"primary": {"ttft": 0.05, "status": 500}, "fallback": {"ttft": 0.05}}
+    router = make_router(server, ["primary", "fallback"])
+    start = time.monotonic()
+    text = await router.complete(MESSAGES)
+    elapsed = time.monotonic() - start
+    ok = text.startswith("fallback-0") and elapsed < 1.0
+    return ok, f"primary trả 500 -> chuyển ngay sang fallback trong {elapsed:.2f}s (cách cũ ngủ 5s)"
+
+async def scenario_circuit_breaker(server):
+    server.models = {"primary": {"ttft": 0.01, "status": 429}, "fallback": {"ttft": 0.01}}
+    server.calls = {}
+    router = make_router(server, ["primary", "fallback"], failure_threshold=3, open_seconds=60)
+    for _ in range(10):
+        await router.complete(MESSAGES)
+    primary_calls = server.calls.get("primary", 0)
+    ok = primary_calls == 3 and router.breakers["primary"].state == "open"
+    return ok, f"10 request, primary 429 -> primary chỉ bị gọi {primary_calls} lần, breaker {router.breakers['primary'].state}"
+
+async def scenario_latency_routing(server):
+    server.models = {"slow": {"ttft": 0.4}, "fast": {"ttft": 0.05}}
+    server.calls = {}
+    router = make_router(server, ["slow", "fast"], hedge_delay=5.0)
+    for _ in range(6):
+        await router.complete(MESSAGES)
+    ranked = [p.name for p in router.ranked()]
+    fast_calls = server.calls.get("fast", 0)
+    ok = ranked[0] == "fast" and fast_calls >= 5
+    return ok, f"thứ tự sau khi đo: {ranked}, fast được gọi {fast_calls}/6 lần"
+
+async def scenario_all_down(server):
+    server.models = {"primary": {"ttft": 0.01, "status": 503}, "fallback": {"ttft": 0.01, "status": 503}}
+    router = make_router(server, ["primary", "fallback"])
+    try:
+        await router.complete(MESSAGES, retries=2)
+    except ProviderError as e:
+        return e.status == 503, f"mọi model lỗi -> ProviderError({e.status})"
+    return False, "không raise lỗi"
+
+SCENARIOS = [scenario_hedge, scenario_fallback_on_error, scenario_circuit_breaker, scenario_latency_routing, scenario_all_down]
+
+async def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    server = StubServer()
+    await server.start()
+    failed = 0
+    try:
+        for scenario in SCENARIOS:
+            ok, detail = await scenario(server)
+            failed += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {scenario.__name__[9:]:<22} {detail}")
+    finally:
+        await close_sessions()
+        await server.stop()
+    return failed
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,99 @@
+"""Đánh giá truy vấn RAG: recall@k, MRR và độ trễ (trung bình, p95) cho dense, BM25, hybrid (RRF) và hybrid + rerank.
+
+Bộ câu hỏi: ``--eval-file`` JSONL, mỗi dòng ``{"query": "...", "expected": ["đoạn văn bản", ...]}``; một kết quả được
+tính là đúng nếu chunk chứa một trong các đoạn ``expected`` (không phân biệt hoa thường). Không có file thì
+sinh ``--samples`` câu hỏi từ chính corpus: lấy ngẫu nhiên một cụm từ trong một chunk, một nửa bị bỏ dấu
+(mô phỏng người dùng gõ không dấu), và chunk chứa cụm từ đó là đáp án.
+
+Chạy: python benchmarks/rag_eval.py [--index-path data/rag_index/mental] [--doc-dir data/documents/mental_counseling]
+      [--eval-file eval.jsonl] [--k 3] [--rerank-model cross-encoder/mmarco-mMiniLMv2-L12-H384-v1]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.rag import RAG
+
+def strip_diacritics(text):
+    text = text.replace("đ", "d").replace("Đ", "D")
+    return "".join(ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn")
+
+def load_eval_set(args, rag):
+    if args.eval_file:
+        with open(args.eval_file, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(0)
+    with rag.store.pool.reader() as c:
+        c.execute("SELECT id FROM chunks")
+        ids = [row[0] for row in c.fetchall()]
+    samples = []
+    for doc_id in rng.sample(ids, min(args.samples, len(ids))):
+        words = rag.store.get([doc_id])[doc_id].split()
+        if len(words) < 6:
+            continue
+        size = rng.randint(4, 8)
+        start = rng.randint(0, len(words) - size)
+        phrase = " ".join(words[start:start + size])
+        query = strip_diacritics(phrase) if rng.random() < 0.5 else phrase
+        samples.append({"query": query, "expected": [phrase]})
+    return samples
+
+def evaluate(rag, samples, k, mode, rerank):
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    for sample in samples:
+        start = time.perf_counter()
+        results = rag.search_batch([sample["query"]], k, mode=mode, rerank=rerank)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        expected = [fragment.lower() for fragment in sample["expected"]]
+        for rank, text in enumerate(results, 1):
+            if any(fragment in text.lower() for fragment in expected):
+                hits += 1
+                reciprocal_ranks += 1 / rank
+                break
+    latencies.sort()
+    return (hits / len(samples), reciprocal_ranks / len(samples), statistics.mean(latencies),
+            latencies[max(0, int(len(latencies) * 0.95) - 1)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", default="./data/rag_index/mental")
+    parser.add_argument("--doc-dir", default="./data/documents/mental_counseling")
+    parser.add_argument("--embed-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--eval-file", help="JSONL {query, expected}")
+    parser.add_argument("--samples", type=int, default=200, help="Số câu hỏi tự sinh khi không có --eval-file")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rerank-model", help="CrossEncoder để đo thêm hybrid + rerank")
+    parser.add_argument("--rerank-budget-ms", type=int, default=150)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rag = RAG(embed_model=args.embed_model, index_path=args.index_path, doc_dir=args.doc_dir,
+              rerank_model=args.rerank_model, rerank_budget_ms=args.rerank_budget_ms)
+    samples = load_eval_set(args, rag)
+    if not samples:
+        print("No evaluation queries (empty corpus?)")
+        return
+    print(f"index: {rag.index_path} ({rag.index.ntotal} chunks), queries: {len(samples)}, k={args.k}")
+
+    configs = [("dense", "dense", False), ("bm25", "bm25", False), ("hybrid (RRF)", "hybrid", False)]
+    if rag.reranker is not None:
+        configs.append((f"hybrid + rerank ({args.rerank_budget_ms}ms)", "hybrid", True))
+    print(f"{'retriever':<28} {'recall@k':>9} {'MRR':>6} {'mean ms':>8} {'p95 ms':>8}")
+    for name, mode, rerank in configs:
+        recall, mrr, mean_ms, p95_ms = evaluate(rag, samples, args.k, mode, rerank)
+        print(f"{name:<28} {recall:9.3f} {mrr:6.3f} {mean_ms:8.2f} {p95_ms:8.2f}")
+    if rag.reranker is not None:
+        print(f"rerank: {rag.reranker.stats()}")
+
+if __name__ == "__main__":
+    main()
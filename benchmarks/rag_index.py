@@ -0,0 +1,107 @@
+"""So sánh recall@k và độ trễ tìm kiếm giữa các loại index FAISS (flat, IVF-Flat, IVF-PQ, HNSW).
+
+Vector corpus lấy từ index RAG đã dựng của bot (mặc định ``data/rag_index/mental``, tức corpus
+``data/documents/mental_counseling``) nên không cần tải model embedding. Truy vấn:
+- nếu có sentence-transformers và ``--queries`` (file mỗi dòng một câu hỏi): embed câu hỏi thật;
+- nếu không: lấy mẫu vector trong corpus rồi cộng nhiễu (mô phỏng câu hỏi gần nghĩa).
+Ground truth là kết quả chính xác của flat inner product. Nếu chưa có index thật thì dùng
+``--synthetic N`` vector phân cụm ngẫu nhiên.
+
+Chạy: python benchmarks/rag_index.py [--index-path data/rag_index/mental] [--k 3] [--queries q.txt]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.rag import build_index, index_vectors, normalize, tune_index
+
+def load_corpus(args):
+    index_file = os.path.join(args.index_path, "faiss_index.bin")
+    if not args.synthetic and os.path.exists(index_file):
+        index = faiss.read_index(index_file)
+        if isinstance(index, faiss.IndexIDMap):
+            ids, vectors = index_vectors(index)
+            return ids, normalize(vectors), f"{index_file} ({len(ids)} vectors)"
+        if isinstance(index, faiss.IndexFlat) and index.ntotal:
+            # Index cũ (IndexFlatL2, chưa có ID)
+            vectors = index.reconstruct_n(0, index.ntotal)
+            return np.arange(index.ntotal, dtype="int64"), normalize(vectors), f"{index_file} ({index.ntotal} vectors, legacy)"
+        print(f"{index_file} is not a flat/HNSW index, falling back to synthetic data")
+    count = args.synthetic or 50000
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(count // 200, 8), args.dimension))
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.normal(scale=0.6, size=(count, args.dimension))
+    return np.arange(count, dtype="int64"), normalize(vectors), f"synthetic ({count} vectors, d={args.dimension})"
+
+def load_queries(args, vectors):
+    if args.queries:
+        from sentence_transformers import SentenceTransformer
+        with open(args.queries, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        model = SentenceTransformer(args.embed_model)
+        return normalize(model.encode(texts, show_progress_bar=False))
+    rng = np.random.default_rng(1)
+    sample = vectors[rng.integers(0, len(vectors), args.num_queries)]
+    return normalize(sample + rng.normal(scale=args.noise, size=sample.shape))
+
+def evaluate(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0]) & set(expected))
+    return hits / (len(queries) * k), statistics.mean(latencies), sorted(latencies)[int(len(latencies) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index-path", default="./data/rag_index/mental")
+    parser.add_argument("--synthetic", type=int, default=0, help="Dùng N vector ngẫu nhiên thay cho corpus thật")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", help="File câu hỏi (cần sentence-transformers)")
+    parser.add_argument("--embed-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    ids, vectors, source = load_corpus(args)
+    queries = load_queries(args, vectors)
+    dimension = vectors.shape[1]
+    print(f"corpus: {source}, queries: {len(queries)}, k={args.k}")
+
+    exact = build_index("flat", dimension, vectors, ids)
+    _, truth = exact.search(queries, args.k)
+
+    configs = [("flat", {})]
+    configs += [("ivf_flat", {"nprobe": nprobe}) for nprobe in (4, 16, 64)]
+    if len(vectors) >= 256 * 39:
+        configs += [("ivf_pq", {"nprobe": nprobe}) for nprobe in (16, 64)]
+    else:
+        print(f"skipping ivf_pq: needs at least {256 * 39} vectors to train")
+    configs += [("hnsw", {"ef_search": ef}) for ef in (32, 64, 128)]
+
+    built = {}
+    print(f"{'index':<10} {'params':<14} {'build s':>8} {'recall@k':>9} {'mean ms':>8} {'p95 ms':>8}")
+    for kind, params in configs:
+        if kind not in built:
+            start = time.perf_counter()
+            built[kind] = (build_index(kind, dimension, vectors, ids), time.perf_counter() - start)
+        index, build_seconds = built[kind]
+        tune_index(index, **params)
+        recall, mean_ms, p95_ms = evaluate(index, queries, truth, args.k)
+        label = ", ".join(f"{key}={value}" for key, value in params.items()) or "-"
+        print(f"{kind:<10} {label:<14} {build_seconds:8.2f} {recall:9.3f} {mean_ms:8.3f} {p95_ms:8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Đo RAM (RssAnon/RssFile, Linux) khi mở index RAG: documents.json + index nạp hết vào RAM (trước) với ChunkStore SQLite + index mmap (sau).
+
+Dựng một corpus tổng hợp N chunk (text ~``--chunk-chars`` ký tự, vector ``--dimension`` chiều) ở cả hai
+định dạng, rồi mở từng định dạng trong một tiến trình Python mới, đo RSS tăng thêm và thời gian lấy text
+top-k cho một lô truy vấn.
+
+Chạy: python benchmarks/rag_memory.py [--chunks 200000] [--dimension 384] [--work-dir /tmp/rag_memory]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.utils.chunk_store import ChunkStore
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+import faiss, numpy as np
+
+def rss_mb():
+    # RssAnon: bộ nhớ riêng của tiến trình; RssFile: trang file được map (page cache, hệ điều hành thu hồi được)
+    with open("/proc/self/status") as f:
+        status = f.read()
+    return [int(status.split(key)[1].split()[0]) / 1024 for key in ("RssAnon:", "RssFile:")]
+
+mode, work_dir, dimension = sys.argv[2], sys.argv[3], int(sys.argv[4])
+queries = np.random.default_rng(1).random((32, dimension), dtype="float32")
+before = rss_mb()
+start = time.perf_counter()
+if mode == "json":
+    index = faiss.read_index(f"{work_dir}/faiss_index.bin")
+    with open(f"{work_dir}/documents.json", encoding="utf-8") as f:
+        documents = {int(k): v for k, v in json.load(f).items()}
+    fetch = lambda ids: {i: documents[i] for i in ids}
+else:
+    from src.utils.rag import read_index
+    from src.utils.chunk_store import ChunkStore
+    index = read_index(f"{work_dir}/faiss_index.bin", "flat")
+    store = ChunkStore(f"{work_dir}/chunks.db")
+    fetch = store.get
+opened = time.perf_counter() - start
+start = time.perf_counter()
+_, ids = index.search(queries, 3)
+texts = fetch(int(i) for i in ids.ravel())
+query_ms = (time.perf_counter() - start) * 1000
+after = rss_mb()
+print(json.dumps({"anon_mb": after[0] - before[0], "file_mb": after[1] - before[1], "open_s": opened, "query_ms": query_ms, "texts": len(texts)}))
+"""
+
+def build_corpus(args):
+    os.makedirs(args.work_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(args.dimension))
+    store_path = os.path.join(args.work_dir, "chunks.db")
+    if os.path.exists(store_path):
+        os.remove(store_path)
+    store = ChunkStore(store_path)
+    documents = {}
+    words = ["tâm", "lý", "giấc", "ngủ", "lo", "âu", "thư", "giãn", "cảm", "xúc", "hỗ", "trợ"]
+    for start in range(0, args.chunks, 10000):
+        ids = np.arange(start, min(start + 10000, args.chunks), dtype="int64")
+        vectors = rng.random((len(ids), args.dimension), dtype="float32")
+        faiss.normalize_L2(vectors)
+        index.add_with_ids(vectors, ids)
+        texts = [f"{i}: " + " ".join(rng.choice(words, args.chunk_chars // 4)) for i in ids]
+        store.add(ids, "synthetic", texts)
+        documents.update((str(i), text) for i, text in zip(ids, texts))
+    store.close()
+    faiss.write_index(index, os.path.join(args.work_dir, "faiss_index.bin"))
+    with open(os.path.join(args.work_dir, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--chunk-chars", type=int, default=800)
+    parser.add_argument("--work-dir", default="/tmp/rag_memory")
+    args = parser.parse_args()
+
+    build_corpus(args)
+    print(f"corpus: {args.chunks} chunks, d={args.dimension}, ~{args.chunk_chars} chars/chunk")
+    for name, mode in (("documents.json + read_index (before)", "json"), ("ChunkStore + mmap index (after)", "store")):
+        result = subprocess.run([sys.executable, "-c", PROBE, ROOT, mode, args.work_dir, str(args.dimension)],
+                                capture_output=True, text=True, check=True)
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{name:<38} +{stats['anon_mb']:7.1f} MB anon  +{stats['file_mb']:7.1f} MB mapped   open {stats['open_s']:6.2f}s   "
+              f"32 queries top-3 {stats['query_ms']:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
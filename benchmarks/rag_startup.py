@@ -0,0 +1,67 @@
+"""Đo phần thời gian khởi động bị RAG chặn trước khi bot kết nối Discord (trước/sau khi nạp nền).
+
+Trước: ``helpers`` tạo ``RAG(...)`` lúc import nên on_ready phải chờ import torch/SentenceTransformer
+và đồng bộ index. Sau: ``LazyRAG`` chỉ tạo object, việc nạp chạy trong thread nền sau khi đăng nhập.
+Mỗi cách được đo trong một tiến trình Python mới (import lạnh); thời gian đăng nhập Discord như nhau
+ở cả hai nên không tính.
+
+Chạy: python benchmarks/rag_startup.py [--runs 3] [--doc-dir ...] [--index-path ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER = """
+import json, sys, time
+start = time.perf_counter()
+from src.utils.rag import RAG
+rag = RAG(embed_model=sys.argv[1], index_path=sys.argv[2], doc_dir=sys.argv[3])
+blocking = time.perf_counter() - start
+print(json.dumps({"blocking": blocking, "ready": blocking}))
+"""
+
+LAZY = """
+import json, sys, time
+start = time.perf_counter()
+from src.utils.lazy_rag import LazyRAG
+rag = LazyRAG(embed_model=sys.argv[1], index_path=sys.argv[2], doc_dir=sys.argv[3])
+rag.start()
+blocking = time.perf_counter() - start
+rag.wait()
+print(json.dumps({"blocking": blocking, "ready": time.perf_counter() - start, "error": str(rag.error) if rag.error else None}))
+"""
+
+def measure(code, args):
+    result = subprocess.run([sys.executable, "-c", code] + args, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--embed-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--index-path", default="./data/rag_index/mental")
+    parser.add_argument("--doc-dir", default="./data/documents/mental_counseling")
+    args = parser.parse_args()
+    script_args = [args.embed_model, args.index_path, args.doc_dir]
+
+    # Lần đầu có thể phải dựng index; chạy một lần để cả hai cách đo trên index đã có sẵn
+    measure(EAGER, script_args)
+    rows = {"eager RAG() at import (before)": [], "LazyRAG.start() (after)": []}
+    for _ in range(args.runs):
+        rows["eager RAG() at import (before)"].append(measure(EAGER, script_args))
+        rows["LazyRAG.start() (after)"].append(measure(LAZY, script_args))
+
+    for name, runs in rows.items():
+        blocking = statistics.median(run["blocking"] for run in runs)
+        ready = statistics.median(run["ready"] for run in runs)
+        print(f"{name:<32} blocks startup {blocking:7.3f}s   RAG ready after {ready:7.3f}s")
+
+if __name__ == "__main__":
+    main()
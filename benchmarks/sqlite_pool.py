@@ -0,0 +1,85 @@
+"""So sánh thông lượng giữa kiểu mở kết nối SQLite mỗi lần gọi (cũ) và pool kết nối dùng chung.
+
+Chạy: python benchmarks/sqlite_pool.py [--ops 2000]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+def legacy_add_message(db_path, thread_id, message_id, content):
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("INSERT INTO messages (thread_id, user_id, message_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, datetime('now'))",
+                  (str(thread_id), "user", str(message_id), "user", content))
+        conn.commit()
+    finally:
+        conn.close()
+
+def legacy_get_history(db_path, thread_id, limit=20):
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT role, content FROM messages WHERE thread_id = ? ORDER BY timestamp ASC LIMIT ?", (str(thread_id), limit))
+        return c.fetchall()
+    finally:
+        conn.close()
+
+def legacy_is_message_exists(db_path, message_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM messages WHERE message_id = ?", (str(message_id),))
+        return c.fetchone() is not None
+    finally:
+        conn.close()
+
+def run_legacy(db_path, ops):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, role TEXT, content TEXT, timestamp DATETIME)")
+    conn.commit()
+    conn.close()
+    start = time.perf_counter()
+    for i in range(ops):
+        legacy_is_message_exists(db_path, i)
+        legacy_add_message(db_path, i % 50, i, f"message {i}")
+        legacy_get_history(db_path, i % 50)
+    return time.perf_counter() - start
+
+def run_pooled(data_dir, ops):
+    database.DATA_DIR = data_dir
+    database.init_db()
+    start = time.perf_counter()
+    for i in range(ops):
+        database.is_message_exists(i, 'general')
+        database.add_message(i % 50, i, "user", f"message {i}", 'general', user_id="user")
+        database.get_history(i % 50, limit=20, db_type='general')
+    elapsed = time.perf_counter() - start
+    database.close_pools()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=2000, help="Số vòng (mỗi vòng = 1 kiểm tra + 1 ghi + 1 đọc lịch sử)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as pooled_dir:
+        legacy = run_legacy(os.path.join(legacy_dir, "general_chat_history.db"), args.ops)
+        pooled = run_pooled(pooled_dir, args.ops)
+
+    total_ops = args.ops * 3
+    print(f"legacy (connect per call): {total_ops / legacy:10.0f} ops/s  ({legacy:.2f}s)")
+    print(f"pooled (WAL, shared conns): {total_ops / pooled:10.0f} ops/s  ({pooled:.2f}s)")
+    print(f"speedup: {legacy / pooled:.1f}x")
+
+if __name__ == "__main__":
+    main()
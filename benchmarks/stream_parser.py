@@ -0,0 +1,132 @@
+"""So sánh cách parse stream Gemini cũ (nối buffer rồi json.loads lại mỗi dòng) với bộ giải mã SSE tăng dần.
+
+Cách cũ đọc mảng JSON pretty-print của ``streamGenerateContent``; cách mới đọc cùng các payload đó qua
+``alt=sse``. Fixture được sinh theo đúng định dạng ghi lại từ API; có thể truyền file SSE ghi thật
+(Gemini alt=sse, Groq, xAI) bằng ``--sse-fixture``.
+
+Cách cũ tăng siêu tuyến tính theo kích thước nên chỉ chạy trên fixture nhỏ hơn (``--legacy-size-mb``);
+bộ giải mã mới được đo trên cả hai kích thước.
+
+Chạy: python benchmarks/stream_parser.py [--size-mb 4] [--legacy-size-mb 0.1] [--read-size 8192]
+"""
+import argparse
+import codecs
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.stream_parser import SSEDecoder, decode_json_events, gemini_text, openai_delta_text
+
+WORDS = "Xin chào, đây là một đoạn phản hồi mẫu với \"trích dẫn\", ký tự \\ và {ngoặc} [vuông] để kiểm tra parser. ".split(" ")
+
+def _chunk_text(i):
+    return " ".join(WORDS[(i + j) % len(WORDS)] for j in range(12)) + " "
+
+def make_gemini_items(size_bytes):
+    items = []
+    total = 0
+    while total < size_bytes:
+        item = {
+            "candidates": [{"content": {"parts": [{"text": _chunk_text(len(items))}], "role": "model"}, "index": 0}],
+            "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": len(items) + 1},
+            "modelVersion": "gemini-2.5-pro",
+        }
+        items.append(item)
+        total += len(json.dumps(item, ensure_ascii=False).encode("utf-8")) + 8
+    return items
+
+def make_array_fixture(items):
+    pieces = [json.dumps(item, indent=2, ensure_ascii=False).encode("utf-8") for item in items]
+    return b"[" + b",\r\n".join(pieces) + b"]"
+
+def make_gemini_sse_fixture(items):
+    return b"".join(b"data: " + json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\r\n\r\n" for item in items)
+
+def make_sse_fixture(size_bytes):
+    lines = []
+    total = 0
+    while total < size_bytes:
+        payload = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": _chunk_text(len(lines))}}]}
+        lines.append(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        total += len(lines[-1])
+    lines.append(b"data: [DONE]\n\n")
+    return b"".join(lines)
+
+def iter_reads(raw, read_size):
+    """Mô phỏng ``response.content``: đọc theo dòng (cách cũ) hoặc theo khối bất kỳ (``iter_any``)."""
+    for i in range(0, len(raw), read_size):
+        yield raw[i:i + read_size]
+
+def legacy_gemini(raw):
+    """Thuật toán cũ trong get_gemini_response: mỗi dòng thất bại được nối vào buffer và parse lại toàn bộ."""
+    api_response = ""
+    buffer = ""
+    for line_bytes in raw.splitlines(keepends=True):
+        line = line_bytes.decode("utf-8").strip()
+        if not line:
+            continue
+        try:
+            chunk_data_list = json.loads(line)
+        except json.JSONDecodeError:
+            buffer += line
+            try:
+                chunk_data_list = json.loads(buffer)
+            except json.JSONDecodeError:
+                continue
+        for chunk_data in chunk_data_list:
+            api_response += gemini_text(chunk_data)
+        buffer = ""
+    return api_response
+
+def incremental_sse(raw, read_size, extract):
+    decoder = SSEDecoder()
+    parts = []
+    for chunk in iter_reads(raw, read_size):
+        for chunk_data in decode_json_events(decoder.feed(chunk)):
+            parts.append(extract(chunk_data))
+    for chunk_data in decode_json_events(decoder.close()):
+        parts.append(extract(chunk_data))
+    return "".join(parts)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=4, help="Kích thước fixture sinh ra (MB)")
+    parser.add_argument("--legacy-size-mb", type=float, default=0.1, help="Kích thước fixture cho cách parse cũ (MB)")
+    parser.add_argument("--read-size", type=int, default=8192, help="Kích thước mỗi khối đọc cho bộ giải mã tăng dần")
+    parser.add_argument("--sse-fixture", help="File ghi lại từ một API SSE (Gemini alt=sse, Groq, xAI)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    size = int(args.size_mb * 1024 * 1024)
+    if args.sse_fixture:
+        with open(args.sse_fixture, "rb") as f:
+            sse_raw = f.read()
+    else:
+        sse_raw = make_sse_fixture(size)
+    extract = gemini_text if b'"candidates"' in sse_raw[:4096] else openai_delta_text
+
+    legacy_items = make_gemini_items(int(args.legacy_size_mb * 1024 * 1024))
+    legacy_raw = make_array_fixture(legacy_items)
+    small_raw = make_gemini_sse_fixture(legacy_items)
+    legacy_text, legacy = timed(legacy_gemini, legacy_raw)
+    small_text, small = timed(incremental_sse, small_raw, args.read_size, gemini_text)
+    sse_text, sse = timed(incremental_sse, sse_raw, args.read_size, extract)
+
+    small_mb = len(legacy_raw) / 1024 / 1024
+    sse_mb = len(sse_raw) / 1024 / 1024
+    print(f"{small_mb:5.2f} MB Gemini  legacy buffer re-parse: {small_mb / legacy:8.2f} MB/s  ({legacy:.2f}s)")
+    print(f"{small_mb:5.2f} MB Gemini  incremental SSE decoder: {small_mb / small:8.2f} MB/s  ({small:.2f}s)  same text: {small_text == legacy_text}")
+    print(f"{sse_mb:5.2f} MB SSE     incremental SSE decoder: {sse_mb / sse:8.2f} MB/s  ({sse:.2f}s)  chars: {len(sse_text)}")
+    print(f"speedup at {small_mb:.2f} MB: {legacy / small:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Dựng index RAG offline: trích PDF song song bằng process pool, embed theo lô, rồi công bố bản build mới.
+
+Mỗi lần chạy tạo một bản build trong ``<index-path>/builds/<thời gian>/`` (sao chép từ bản đang dùng rồi chỉ
+embed file mới/đổi, hoặc dựng lại toàn bộ với ``--full``), sau đó ghi ``<index-path>/CURRENT`` trỏ tới bản đó.
+Lần chạy đầu (chưa có ``CURRENT``) bắt đầu từ index bot tự dựng trong ``<index-path>`` nếu có; nếu index đó
+không dùng được (khác model/cấu hình chunk) thì toàn bộ corpus được embed lại.
+Bot đang chạy tự chuyển sang bản build mới ở lần truy vấn kế tiếp, không cần khởi động lại. Khi đã có
+``CURRENT``, bot chỉ đọc bản build và không tự embed tài liệu lúc khởi động nữa.
+
+Chạy: python build_index.py [--doc-dir data/documents/mental_counseling] [--index-path data/rag_index/mental]
+      [--workers 4] [--batch-size 256] [--threads 4] [--full]
+"""
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from dotenv import load_dotenv
+from threadpoolctl import threadpool_limits
+
+from src.utils.chunking import extract_pdf_pages, iter_file_chunks, pdf_page_count
+
+PAGES_PER_TASK = 16
+KEEP_BUILDS = 3
+
+def copy_build(source, target):
+    """Sao chép bản build đang dùng làm điểm xuất phát (chunks.db qua backup API vì bot có thể đang đọc)."""
+    os.makedirs(target)
+    for name in ("faiss_index.bin", "manifest.json"):
+        if os.path.exists(os.path.join(source, name)):
+            shutil.copy2(os.path.join(source, name), os.path.join(target, name))
+    source_db = sqlite3.connect(os.path.join(source, "chunks.db"))
+    target_db = sqlite3.connect(os.path.join(target, "chunks.db"))
+    try:
+        source_db.backup(target_db)
+    finally:
+        source_db.close()
+        target_db.close()
+
+def prune_builds(builds_dir, current, keep=KEEP_BUILDS):
+    """Xóa các bản build cũ, giữ ``keep`` bản mới nhất (luôn giữ bản đang dùng)."""
+    names = sorted(os.listdir(builds_dir), reverse=True)
+    for name in names[keep:]:
+        path = os.path.join(builds_dir, name)
+        if os.path.abspath(path) != os.path.abspath(current):
+            shutil.rmtree(path, ignore_errors=True)
+
+class ParallelExtractor:
+    """Nguồn chunk cho ``RAG.sync``: trang PDF được trích trong process pool, chunk + embed ở tiến trình chính.
+
+    Mỗi PDF được chia thành các tác vụ ``PAGES_PER_TASK`` trang; ``imap`` trả kết quả đúng thứ tự nên các trang
+    vẫn được chunk tuần tự trong khi các worker trích trước những trang/file tiếp theo.
+    """
+
+    def __init__(self, pool, chunker, pages_per_task=PAGES_PER_TASK):
+        self.pool = pool
+        self.chunker = chunker
+        self.pages_per_task = pages_per_task
+        self.pages = 0
+        self.files = 0
+
+    def _plan(self, filepaths):
+        tasks, counts = [], {}
+        for filepath in filepaths:
+            if not filepath.endswith(".pdf"):
+                continue
+            try:
+                total = pdf_page_count(filepath)
+            except Exception as e:
+                logging.error(f"Error reading {filepath}: {str(e)}")
+                total = 1  # một tác vụ để worker báo lỗi đúng chỗ
+            ranges = [(filepath, start, start + self.pages_per_task) for start in range(0, total, self.pages_per_task)]
+            tasks.extend(ranges)
+            counts[filepath] = len(ranges)
+        return tasks, counts
+
+    def _pages(self, results, count, filepath):
+        remaining = count
+        try:
+            while remaining:
+                pages, error = next(results)
+                remaining -= 1
+                if error:
+                    raise RuntimeError(f"cannot extract {filepath}: {error}")
+                self.pages += len(pages)
+                yield from pages
+        finally:
+            # File bị bỏ dở (lỗi/embed thất bại): bỏ qua phần còn lại để kết quả của file sau không bị lệch
+            for _ in range(remaining):
+                next(results)
+
+    def __call__(self, filepaths):
+        tasks, counts = self._plan(filepaths)
+        results = self.pool.imap(extract_pdf_pages, tasks)
+        for filepath in filepaths:
+            self.files += 1
+            if filepath not in counts:
+                yield filepath, iter_file_chunks(filepath, self.chunker)
+                continue
+            pages = self._pages(results, counts[filepath], filepath)
+            try:
+                yield filepath, self.chunker.chunk_pages(pages)
+            finally:
+                pages.close()
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc-dir", default="./data/documents/mental_counseling")
+    parser.add_argument("--index-path", default="./data/rag_index/mental")
+    parser.add_argument("--embed-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--index-type", default=os.getenv("RAG_INDEX_TYPE", "auto").lower())
+    parser.add_argument("--chunk-tokens", type=int, default=int(os.getenv("RAG_CHUNK_TOKENS", "200")))
+    parser.add_argument("--chunk-overlap", type=int, default=int(os.getenv("RAG_CHUNK_OVERLAP", "40")))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Số tiến trình trích PDF")
+    parser.add_argument("--batch-size", type=int, default=256, help="Số chunk mỗi lần encode")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Giới hạn thread BLAS/OpenMP khi embed")
+    parser.add_argument("--full", action="store_true", help="Dựng lại toàn bộ thay vì bắt đầu từ bản build đang dùng")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Import sau khi parse: worker (spawn) import lại module này, không cần nạp torch/SentenceTransformer
+    from src.utils.rag import RAG, BUILDS_DIR, current_build, publish_build
+
+    builds_dir = os.path.join(args.index_path, BUILDS_DIR)
+    current = current_build(args.index_path)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    target = os.path.join(builds_dir, name)
+    # Chưa có bản build offline: index bot tự dựng tại chỗ (nếu có) là điểm xuất phát
+    seed = current or (args.index_path if os.path.exists(os.path.join(args.index_path, "chunks.db")) else None)
+    if seed and not args.full:
+        copy_build(seed, target)
+        logging.info(f"Starting from {'build' if current else 'in-place index'} {seed}")
+    else:
+        os.makedirs(target)
+
+    start = time.perf_counter()
+    try:
+        rag = RAG(embed_model=args.embed_model, index_path=target, doc_dir=args.doc_dir, index_type=args.index_type,
+                  chunk_tokens=args.chunk_tokens, chunk_overlap=args.chunk_overlap, sync=False, embed_batch=args.batch_size)
+        before = rag.manifest["next_id"]
+        with threadpool_limits(limits=args.threads), Pool(args.workers) as pool:
+            extractor = ParallelExtractor(pool, rag.chunker)
+            changed = rag.sync(chunk_files=extractor)
+        rag.store.close()
+    except BaseException:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    elapsed = time.perf_counter() - start
+    chunks = rag.manifest["next_id"] - before
+
+    if not changed and current:
+        shutil.rmtree(target, ignore_errors=True)
+        print(f"No document changes, keeping build {current}")
+        return
+    publish_build(args.index_path, name)
+    prune_builds(builds_dir, target)
+    print(f"Published build {name}: {rag.index.ntotal} vectors, {len(rag.manifest['files'])} files")
+    print(f"Processed {extractor.files} new/changed files, {extractor.pages} PDF pages, {chunks} chunks in {elapsed:.1f}s "
+          f"({extractor.pages / elapsed:.1f} pages/s, {chunks / elapsed:.1f} chunks/s)")
+
+if __name__ == "__main__":
+    main()
@@ -74,4 +74,47 @@ try:
     GEMINI_CHANNEL_ID = int(os.getenv('GEMINI_CHANNEL_ID'))
 except (TypeError, ValueError) as e:
     logging.error(f"Error converting environment variables to integers: {str(e)}")
-    raise ValueError("Channel IDs and ADMIN_ROLE_ID must be valid numbers")
\ No newline at end of file
+    raise ValueError("Channel IDs and ADMIN_ROLE_ID must be valid numbers")
+# Tùy chọn phát nhạc (không bắt buộc)
+try:
+    PLAYLIST_MAX_ENTRIES = int(os.getenv('PLAYLIST_MAX_ENTRIES', '1000'))
+except ValueError:
+    logging.error("PLAYLIST_MAX_ENTRIES must be a number, using 1000")
+    PLAYLIST_MAX_ENTRIES = 1000
+# Tùy chọn RAG (không bắt buộc): auto | flat | ivf_flat | ivf_pq | hnsw
+RAG_INDEX_TYPE = os.getenv('RAG_INDEX_TYPE', 'auto').lower()
+try:
+    RAG_CHUNK_TOKENS = int(os.getenv('RAG_CHUNK_TOKENS', '200'))
+    RAG_CHUNK_OVERLAP = int(os.getenv('RAG_CHUNK_OVERLAP', '40'))
+except ValueError:
+    logging.error("RAG_CHUNK_TOKENS and RAG_CHUNK_OVERLAP must be numbers, using 200/40")
+    RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP = 200, 40
+RAG_HYBRID = os.getenv('RAG_HYBRID', 'true').lower() in ('1', 'true', 'yes')
+RAG_RERANK_MODEL = os.getenv('RAG_RERANK_MODEL', '')
+try:
+    RAG_RERANK_BUDGET_MS = int(os.getenv('RAG_RERANK_BUDGET_MS', '150'))
+except ValueError:
+    logging.error("RAG_RERANK_BUDGET_MS must be a number, using 150")
+    RAG_RERANK_BUDGET_MS = 150
+RAG_ANSWER_CACHE = os.getenv('RAG_ANSWER_CACHE', 'false').lower() in ('1', 'true', 'yes')
+try:
+    RAG_ANSWER_CACHE_THRESHOLD = float(os.getenv('RAG_ANSWER_CACHE_THRESHOLD', '0.92'))
+    RAG_ANSWER_CACHE_TTL = int(os.getenv('RAG_ANSWER_CACHE_TTL', '3600'))
+    RAG_ANSWER_CACHE_SIZE = int(os.getenv('RAG_ANSWER_CACHE_SIZE', '500'))
+except ValueError:
+    logging.error("RAG_ANSWER_CACHE_THRESHOLD/TTL/SIZE must be numbers, using 0.92/3600/500")
+    RAG_ANSWER_CACHE_THRESHOLD, RAG_ANSWER_CACHE_TTL, RAG_ANSWER_CACHE_SIZE = 0.92, 3600, 500
+# Giới hạn lịch sử trò chuyện (không bắt buộc, 0 = không giới hạn)
+try:
+    CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '0'))
+    CHAT_MAX_MESSAGES_PER_THREAD = int(os.getenv('CHAT_MAX_MESSAGES_PER_THREAD', '0'))
+except ValueError:
+    logging.error("CHAT_RETENTION_DAYS and CHAT_MAX_MESSAGES_PER_THREAD must be numbers, retention disabled")
+    CHAT_RETENTION_DAYS, CHAT_MAX_MESSAGES_PER_THREAD = 0, 0
+# Ngân sách token cho lịch sử gửi kèm mỗi câu hỏi; phần cũ hơn được tóm tắt (HISTORY_SUMMARY)
+try:
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '2000'))
+except ValueError:
+    logging.error("HISTORY_TOKEN_BUDGET must be a number, using 2000")
+    HISTORY_TOKEN_BUDGET = 2000
+HISTORY_SUMMARY = os.getenv('HISTORY_SUMMARY', 'true').lower() in ('1', 'true', 'yes')
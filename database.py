@@ -1,266 +1,290 @@
+import os
 import sqlite3
 import logging
+import threading
+from queue import LifoQueue, Empty
+from contextlib import contextmanager
 from datetime import datetime
 
-def init_db():
-    """Khởi tạo tất cả các cơ sở dữ liệu và bảng cần thiết."""
-    def ensure_columns(db_path, table_name):
-        """Kiểm tra và thêm cột thread_id và user_id nếu chưa tồn tại."""
-        try:
-            conn = sqlite3.connect(db_path)
-            c = conn.cursor()
-            c.execute(f"PRAGMA table_info({table_name})")
-            columns = [info[1] for info in c.fetchall()]
-            if 'thread_id' not in columns:
-                c.execute(f"ALTER TABLE {table_name} ADD COLUMN thread_id TEXT")
-                conn.commit()
-                logging.info(f"Added thread_id column to {table_name} in {db_path}")
-            if 'user_id' not in columns:
-                c.execute(f"ALTER TABLE {table_name} ADD COLUMN user_id TEXT")
-                conn.commit()
-                logging.info(f"Added user_id column to {table_name} in {db_path}")
-            conn.close()
-        except Exception as e:
-            logging.error(f"Error checking/adding columns in {db_path}: {str(e)}")
-
-    def migrate_user_id(db_path, table_name):
-        """Populate user_id for existing messages if missing."""
-        try:
-            conn = sqlite3.connect(db_path)
-            c = conn.cursor()
-            c.execute(f"UPDATE {table_name} SET user_id = 'unknown' WHERE user_id IS NULL")
-            conn.commit()
-            logging.info(f"Migrated user_id for {table_name} in {db_path}")
-            conn.close()
-        except Exception as e:
-            logging.error(f"Error migrating user_id in {db_path}: {str(e)}")
-
-    # Initialize mental_chat_history.db
-    try:
-        conn = sqlite3.connect(r'.\data\mental_chat_history.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS messages
-                     (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, role TEXT, content TEXT, timestamp DATETIME)''')
-        conn.commit()
-        logging.info("Initialized mental_chat_history.db")
-        ensure_columns(r'.\data\mental_chat_history.db', 'messages')
-        migrate_user_id(r'.\data\mental_chat_history.db', 'messages')
-    except Exception as e:
-        logging.error(f"Error initializing mental_chat_history.db: {str(e)}")
-    finally:
-        conn.close()
+DATA_DIR = os.path.join(".", "data")
 
-    # Initialize general_chat_history.db
-    try:
-        conn = sqlite3.connect(r'.\data\general_chat_history.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS messages
-                     (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, role TEXT, content TEXT, timestamp DATETIME)''')
-        conn.commit()
-        logging.info("Initialized general_chat_history.db")
-        ensure_columns(r'.\data\general_chat_history.db', 'messages')
-        migrate_user_id(r'.\data\general_chat_history.db', 'messages')
-    except Exception as e:
-        logging.error(f"Error initializing general_chat_history.db: {str(e)}")
-    finally:
-        conn.close()
+# Pragma áp dụng cho mọi kết nối trong pool: WAL cho phép đọc song song với ghi,
+# synchronous=NORMAL chỉ fsync khi checkpoint thay vì mỗi lần commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+STATEMENT_CACHE_SIZE = 128
+MAX_IDLE_READERS = 4
 
-    # Initialize grok4_chat_history.db
-    try:
-        conn = sqlite3.connect(r'.\data\grok4_chat_history.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS messages
-                     (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, role TEXT, content TEXT, mode TEXT, timestamp DATETIME)''')
-        conn.commit()
-        logging.info("Initialized grok4_chat_history.db")
-        ensure_columns(r'.\data\grok4_chat_history.db', 'messages')
-        migrate_user_id(r'.\data\grok4_chat_history.db', 'messages')
-    except Exception as e:
-        logging.error(f"Error initializing grok4_chat_history.db: {str(e)}")
-    finally:
-        conn.close()
+PRUNE_BATCH_SIZE = 500
+COMPACT_FREE_RATIO = 0.25
 
-    # Initialize gpt_chat_history.db
-    try:
-        conn = sqlite3.connect(r'.\data\gpt_chat_history.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS messages
-                     (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, role TEXT, content TEXT, batch_id TEXT, timestamp DATETIME)''')
-        conn.commit()
-        logging.info("Initialized gpt_chat_history.db")
-        ensure_columns(r'.\data\gpt_chat_history.db', 'messages')
-        migrate_user_id(r'.\data\gpt_chat_history.db', 'messages')
-    except Exception as e:
-        logging.error(f"Error initializing gpt_chat_history.db: {str(e)}")
-    finally:
-        conn.close()
+DB_NAME = "yoombot.db"
 
-    # Initialize gpt_batch_jobs.db
-    try:
-        conn = sqlite3.connect(r'.\data\gpt_batch_jobs.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS batch_jobs
-                     (batch_id TEXT PRIMARY KEY, thread_id TEXT, user_id TEXT, status TEXT, request_data TEXT, response_data TEXT, created_at DATETIME, completed_at DATETIME)''')
-        conn.commit()
-        logging.info("Initialized gpt_batch_jobs.db")
-    except Exception as e:
-        logging.error(f"Error initializing gpt_batch_jobs.db: {str(e)}")
-    finally:
-        conn.close()
+# Mỗi kênh chat có bảng lịch sử riêng trong file cơ sở dữ liệu chung
+CHAT_TABLES = {
+    'mental': 'mental_messages',
+    'general': 'general_messages',
+    'grok4': 'grok4_messages',
+    'gpt': 'gpt_messages'
+}
+# Kênh có lịch sử đọc riêng cho từng người trong thread (get_history với user_id)
+PER_USER_CHATS = {'grok4', 'gpt'}
 
-    # Initialize queues.db
-    try:
-        conn = sqlite3.connect(r'.\data\queues.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS queues
-                     (id INTEGER PRIMARY KEY, guild_id TEXT, url TEXT, audio_url TEXT, title TEXT, duration INTEGER, position INTEGER)''')
-        conn.commit()
-        logging.info("Initialized queues.db")
-    except Exception as e:
-        logging.error(f"Error initializing queues.db: {str(e)}")
-    finally:
-        conn.close()
+# File cũ (mỗi tính năng một file) -> [(bảng cũ, bảng mới)], chỉ dùng khi nhập dữ liệu lần đầu
+LEGACY_DATABASES = {
+    'mental_chat_history.db': [('messages', 'mental_messages')],
+    'general_chat_history.db': [('messages', 'general_messages')],
+    'grok4_chat_history.db': [('messages', 'grok4_messages')],
+    'gpt_chat_history.db': [('messages', 'gpt_messages')],
+    'gpt_batch_jobs.db': [('batch_jobs', 'batch_jobs')],
+    'queues.db': [('queues', 'queues')],
+    'news.db': [('news_articles', 'news_articles')],
+    'pixiv.db': [('pixiv_priorities', 'pixiv_priorities')],
+    'x_users.db': [('x_users', 'x_users')],
+    'reddit.db': [('reddit_priorities', 'reddit_priorities'), ('reddit_posts', 'reddit_posts'),
+                  ('reddit_subreddits', 'reddit_subreddits')],
+}
 
-    # Initialize news.db
-    try:
-        conn = sqlite3.connect(r'.\data\news.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS news_articles
-                     (id INTEGER PRIMARY KEY, article_id TEXT UNIQUE, title TEXT, published DATETIME)''')
-        conn.commit()
-        logging.info("Initialized news.db")
-    except Exception as e:
-        logging.error(f"Error initializing news.db: {str(e)}")
-    finally:
-        conn.close()
+class ConnectionPool:
+    """Giữ một kết nối ghi và các kết nối đọc dùng lâu dài cho một file SQLite."""
 
-    # Initialize pixiv.db
-    try:
-        conn = sqlite3.connect(r'.\data\pixiv.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS pixiv_priorities
-                     (type TEXT, value TEXT, PRIMARY KEY (type, value))''')
-        conn.commit()
-        logging.info("Initialized pixiv.db")
-    except Exception as e:
-        logging.error(f"Error initializing pixiv.db: {str(e)}")
-    finally:
-        conn.close()
+    def __init__(self, db_path, max_idle_readers=MAX_IDLE_READERS):
+        self.db_path = db_path
+        self.max_idle_readers = max_idle_readers
+        self._write_lock = threading.RLock()
+        self._idle_readers = LifoQueue()
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
 
-    # Initialize x_users.db
-    try:
-        conn = sqlite3.connect(r'.\data\x_users.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS x_users
-                     (username TEXT PRIMARY KEY)''')
-        conn.commit()
-        logging.info("Initialized x_users.db")
-    except Exception as e:
-        logging.error(f"Error initializing x_users.db: {str(e)}")
-    finally:
-        conn.close()
+    def _connect(self, query_only=False):
+        # isolation_level=None: tự quản lý BEGIN/COMMIT; cached_statements giữ
+        # các câu lệnh đã prepare để tái sử dụng giữa các lần gọi.
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if query_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
 
-    # Initialize reddit.db
-    try:
-        conn = sqlite3.connect(r'.\data\reddit.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS reddit_priorities
-                     (type TEXT, value TEXT, PRIMARY KEY (type, value))''')
-        c.execute('''CREATE TABLE IF NOT EXISTS reddit_posts
-                     (post_id TEXT, subreddit TEXT, title TEXT, posted_at DATETIME, PRIMARY KEY (post_id, subreddit))''')
-        c.execute('''CREATE TABLE IF NOT EXISTS reddit_subreddits
-                     (subreddit_name TEXT PRIMARY KEY)''')
-        conn.commit()
-        logging.info("Initialized reddit.db")
-    except Exception as e:
-        logging.error(f"Error initializing reddit.db: {str(e)}")
-    finally:
-        conn.close()
+    @contextmanager
+    def transaction(self):
+        """Mở transaction trên kết nối ghi; commit khi thoát, rollback khi lỗi."""
+        with self._write_lock:
+            c = self._writer.cursor()
+            if self._writer.in_transaction:
+                # Transaction lồng nhau dùng chung transaction bên ngoài
+                try:
+                    yield c
+                finally:
+                    c.close()
+                return
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                yield c
+                c.execute("COMMIT")
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            finally:
+                c.close()
 
-def migrate_reddit_db():
-    """Di chuyển cơ sở dữ liệu reddit.db để thêm cột subreddit nếu chưa tồn tại."""
-    try:
-        conn = sqlite3.connect(r'.\data\reddit.db')
+    @contextmanager
+    def reader(self):
+        """Mượn một kết nối chỉ đọc từ pool và trả lại sau khi dùng xong."""
+        try:
+            conn = self._idle_readers.get_nowait()
+        except Empty:
+            conn = self._connect(query_only=True)
         c = conn.cursor()
-        c.execute("PRAGMA table_info(reddit_posts)")
-        columns = [info[1] for info in c.fetchall()]
-        if 'subreddit' not in columns:
-            c.execute('''CREATE TABLE reddit_posts_new
-                         (post_id TEXT, subreddit TEXT, title TEXT, posted_at DATETIME, PRIMARY KEY (post_id, subreddit))''')
-            c.execute('''INSERT INTO reddit_posts_new (post_id, subreddit, title, posted_at)
-                         SELECT post_id, 'hentai', title, posted_at FROM reddit_posts''')
-            c.execute("DROP TABLE reddit_posts")
-            c.execute("ALTER TABLE reddit_posts_new RENAME TO reddit_posts")
-            conn.commit()
-            logging.info("Migrated reddit_posts table to include subreddit column")
-        else:
-            logging.info("reddit_posts table already has subreddit column, no migration needed")
-    except Exception as e:
-        logging.error(f"Error migrating reddit.db: {str(e)}")
-    finally:
-        conn.close()
+        try:
+            yield c
+        finally:
+            c.close()
+            if self._idle_readers.qsize() < self.max_idle_readers:
+                self._idle_readers.put(conn)
+            else:
+                conn.close()
+
+    def vacuum(self):
+        """VACUUM rồi checkpoint WAL để trả dung lượng trống về hệ điều hành (chạy ngoài transaction)."""
+        with self._write_lock:
+            self._writer.execute("VACUUM")
+            self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
 
-def get_db_connection(db_name="queues.db"):
-    """Trả về kết nối đến cơ sở dữ liệu được chỉ định."""
+    def close(self):
+        """Đóng toàn bộ kết nối của pool."""
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_name=DB_NAME):
+    """Trả về pool kết nối dùng chung cho file cơ sở dữ liệu, tạo mới ở lần gọi đầu tiên."""
+    db_path = db_name if os.path.isabs(db_name) else os.path.join(DATA_DIR, db_name)
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+            logging.info(f"Opened connection pool for database {db_name}")
+        return pool
+
+def close_pools():
+    """Đóng tất cả pool kết nối (gọi khi tắt bot)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    logging.info("Closed all database connection pools")
+
+def _create_schema(c):
+    """Phiên bản 1: toàn bộ bảng và index."""
+    extra_chat_columns = {'grok4': 'mode TEXT, ', 'gpt': 'batch_id TEXT, '}
+    for db_type, table in CHAT_TABLES.items():
+        c.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, thread_id TEXT, user_id TEXT, message_id TEXT, "
+                  f"role TEXT, content TEXT, {extra_chat_columns.get(db_type, '')}timestamp DATETIME)")
+        c.execute(f"CREATE UNIQUE INDEX idx_{table}_message_id ON {table} (message_id)")
+        c.execute(f"CREATE INDEX idx_{table}_thread_user_time ON {table} (thread_id, user_id, timestamp)")
+        c.execute(f"CREATE INDEX idx_{table}_thread_time ON {table} (thread_id, timestamp)")
+    c.execute('''CREATE TABLE batch_jobs
+                 (batch_id TEXT PRIMARY KEY, thread_id TEXT, user_id TEXT, status TEXT, request_data TEXT, response_data TEXT, created_at DATETIME, completed_at DATETIME)''')
+    c.execute('''CREATE TABLE queues
+                 (id INTEGER PRIMARY KEY, guild_id TEXT, url TEXT, audio_url TEXT, title TEXT, duration INTEGER, position REAL)''')
+    c.execute("CREATE INDEX idx_queues_guild_position ON queues (guild_id, position)")
+    c.execute('''CREATE TABLE news_articles
+                 (id INTEGER PRIMARY KEY, article_id TEXT UNIQUE, title TEXT, published DATETIME)''')
+    c.execute('''CREATE TABLE pixiv_priorities
+                 (type TEXT, value TEXT, PRIMARY KEY (type, value))''')
+    c.execute('''CREATE TABLE x_users
+                 (username TEXT PRIMARY KEY)''')
+    c.execute('''CREATE TABLE reddit_priorities
+                 (type TEXT, value TEXT, PRIMARY KEY (type, value))''')
+    c.execute('''CREATE TABLE reddit_posts
+                 (post_id TEXT, subreddit TEXT, title TEXT, posted_at DATETIME, PRIMARY KEY (post_id, subreddit))''')
+    c.execute('''CREATE TABLE reddit_subreddits
+                 (subreddit_name TEXT PRIMARY KEY)''')
+
+def _import_legacy_databases(c):
+    """Phiên bản 2: chép dữ liệu từ các file .db cũ (nếu có) vào file chung; file cũ được giữ nguyên."""
+    # Tin nhắn của bot từng được lưu với message_id = 'None'; tin rất cũ chưa có user_id
+    chat_conversions = {'message_id': "NULLIF(message_id, 'None')", 'user_id': "COALESCE(user_id, 'unknown')"}
+    for db_name, tables in LEGACY_DATABASES.items():
+        path = os.path.join(DATA_DIR, db_name)
+        if not os.path.exists(path):
+            continue
+        legacy = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            for old_table, new_table in tables:
+                c.execute(f"PRAGMA table_info({new_table})")
+                new_columns = {info[1] for info in c.fetchall()}
+                columns = [info[1] for info in legacy.execute(f"PRAGMA table_info({old_table})") if info[1] in new_columns]
+                if not columns:
+                    continue
+                conversions = chat_conversions if new_table in CHAT_TABLES.values() else {}
+                select = ", ".join(conversions.get(column, column) for column in columns)
+                # OR IGNORE: bản ghi trùng khóa (message_id, article_id, ...) chỉ giữ bản đầu tiên
+                c.executemany(f"INSERT OR IGNORE INTO {new_table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                              legacy.execute(f"SELECT {select} FROM {old_table} ORDER BY rowid"))
+                logging.info(f"Imported {c.rowcount} rows from {db_name}:{old_table} into {new_table}")
+        finally:
+            legacy.close()
+        logging.info(f"Imported legacy database {db_name}; the file is no longer used and can be removed")
+
+def _create_thread_summaries(c):
+    """Phiên bản 3: tóm tắt cuốn chiếu của phần hội thoại cũ (user_id '' = không lọc theo người dùng)."""
+    c.execute("""CREATE TABLE thread_summaries
+                 (chat_table TEXT, thread_id TEXT, user_id TEXT NOT NULL DEFAULT '', summary TEXT, through_id INTEGER,
+                  updated_at DATETIME, PRIMARY KEY (chat_table, thread_id, user_id))""")
+
+# Migration chỉ tiến: mỗi phiên bản chạy đúng một lần, trong cùng transaction với dòng schema_version của nó.
+# Thay đổi schema mới được nối vào cuối danh sách; không sửa các phiên bản đã phát hành.
+SCHEMA_MIGRATIONS = [
+    (1, "create schema", _create_schema),
+    (2, "import legacy per-feature databases", _import_legacy_databases),
+    (3, "create thread_summaries", _create_thread_summaries),
+]
+
+def init_db():
+    """Mở cơ sở dữ liệu chung và chạy các migration chưa được áp dụng."""
+    pool = get_pool()
     try:
-        conn = sqlite3.connect(rf'.\data\{db_name}')
-        logging.info(f"Connected to database {db_name}")
-        return conn
+        with pool.transaction() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at DATETIME)")
+            c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current = c.fetchone()[0]
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= current:
+                continue
+            with pool.transaction() as c:
+                migrate(c)
+                c.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, datetime('now'))",
+                          (version, description))
+            current = version
+            logging.info(f"Applied schema migration {version}: {description}")
+        logging.info(f"Initialized {DB_NAME} at schema version {current}")
     except Exception as e:
-        logging.error(f"Error connecting to database {db_name}: {str(e)}")
-        raise
+        logging.error(f"Error initializing {DB_NAME}: {str(e)}")
 
 def add_gpt_batch_job(batch_id, thread_id, user_id, request_data):
     """Thêm công việc batch GPT-4.1 vào cơ sở dữ liệu."""
     try:
-        conn = sqlite3.connect(r'.\data\gpt_batch_jobs.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO batch_jobs (batch_id, thread_id, user_id, status, request_data, created_at) VALUES (?, ?, ?, ?, ?, datetime('now'))",
-                  (batch_id, str(thread_id), str(user_id), 'pending', request_data))
-        conn.commit()
+        with get_pool().transaction() as c:
+            c.execute("INSERT INTO batch_jobs (batch_id, thread_id, user_id, status, request_data, created_at) VALUES (?, ?, ?, ?, ?, datetime('now'))",
+                      (batch_id, str(thread_id), str(user_id), 'pending', request_data))
         logging.info(f"Added GPT-4.1 batch job {batch_id} for thread {thread_id}, user {user_id}")
     except Exception as e:
         logging.error(f"Error adding GPT-4.1 batch job {batch_id}: {str(e)}")
-    finally:
-        conn.close()
 
 def update_gpt_batch_job(batch_id, status, response_data=None, completed_at=None):
     """Cập nhật trạng thái và dữ liệu phản hồi của công việc batch."""
     try:
-        conn = sqlite3.connect(r'.\data\gpt_batch_jobs.db')
-        c = conn.cursor()
-        if response_data and completed_at:
-            c.execute("UPDATE batch_jobs SET status = ?, response_data = ?, completed_at = ? WHERE batch_id = ?",
-                      (status, response_data, completed_at, batch_id))
-        else:
-            c.execute("UPDATE batch_jobs SET status = ? WHERE batch_id = ?", (status, batch_id))
-        conn.commit()
+        with get_pool().transaction() as c:
+            if response_data and completed_at:
+                c.execute("UPDATE batch_jobs SET status = ?, response_data = ?, completed_at = ? WHERE batch_id = ?",
+                          (status, response_data, completed_at, batch_id))
+            else:
+                c.execute("UPDATE batch_jobs SET status = ? WHERE batch_id = ?", (status, batch_id))
         logging.info(f"Updated GPT-4.1 batch job {batch_id} to status {status}")
     except Exception as e:
         logging.error(f"Error updating GPT-4.1 batch job {batch_id}: {str(e)}")
-    finally:
-        conn.close()
+
+def _batch_job_from_row(job):
+    return {
+        'batch_id': job[0],
+        'thread_id': job[1],
+        'user_id': job[2],
+        'status': job[3],
+        'request_data': job[4],
+        'response_data': job[5],
+        'created_at': job[6],
+        'completed_at': job[7]
+    }
 
 def get_gpt_batch_job(batch_id):
     """Lấy thông tin công việc batch theo batch_id."""
     try:
-        conn = sqlite3.connect(r'.\data\gpt_batch_jobs.db')
-        c = conn.cursor()
-        c.execute("SELECT batch_id, thread_id, user_id, status, request_data, response_data, created_at, completed_at FROM batch_jobs WHERE batch_id = ?", (batch_id,))
-        job = c.fetchone()
-        conn.close()
+        with get_pool().reader() as c:
+            c.execute("SELECT batch_id, thread_id, user_id, status, request_data, response_data, created_at, completed_at FROM batch_jobs WHERE batch_id = ?", (batch_id,))
+            job = c.fetchone()
         if job:
             logging.info(f"Retrieved GPT-4.1 batch job {batch_id}")
-            return {
-                'batch_id': job[0],
-                'thread_id': job[1],
-                'user_id': job[2],
-                'status': job[3],
-                'request_data': job[4],
-                'response_data': job[5],
-                'created_at': job[6],
-                'completed_at': job[7]
-            }
+            return _batch_job_from_row(job)
         return None
     except Exception as e:
         logging.error(f"Error retrieving GPT-4.1 batch job {batch_id}: {str(e)}")
@@ -269,125 +293,205 @@ def get_gpt_batch_job(batch_id):
 def get_pending_gpt_batch_jobs():
     """Lấy tất cả các công việc batch đang chờ xử lý."""
     try:
-        conn = sqlite3.connect(r'.\data\gpt_batch_jobs.db')
-        c = conn.cursor()
-        c.execute("SELECT batch_id, thread_id, user_id, status, request_data, response_data, created_at, completed_at FROM batch_jobs WHERE status = 'pending'")
-        jobs = c.fetchall()
-        conn.close()
+        with get_pool().reader() as c:
+            c.execute("SELECT batch_id, thread_id, user_id, status, request_data, response_data, created_at, completed_at FROM batch_jobs WHERE status = 'pending'")
+            jobs = c.fetchall()
         logging.info(f"Retrieved {len(jobs)} pending GPT-4.1 batch jobs")
-        return [{
-            'batch_id': job[0],
-            'thread_id': job[1],
-            'user_id': job[2],
-            'status': job[3],
-            'request_data': job[4],
-            'response_data': job[5],
-            'created_at': job[6],
-            'completed_at': job[7]
-        } for job in jobs]
+        return [_batch_job_from_row(job) for job in jobs]
     except Exception as e:
         logging.error(f"Error retrieving pending GPT-4.1 batch jobs: {str(e)}")
         return []
 
+def chat_table(db_type):
+    """Bảng lịch sử của kênh; kênh không có bảng riêng dùng chung bảng của kênh mental."""
+    return CHAT_TABLES.get(db_type, CHAT_TABLES['mental'])
+
 def add_message(thread_id, message_id, role, content, db_type, mode=None, user_id=None, batch_id=None):
-    """Thêm tin nhắn vào lịch sử trò chuyện."""
-    db_path = {
-        'mental': r'.\data\mental_chat_history.db',
-        'general': r'.\data\general_chat_history.db',
-        'grok4': r'.\data\grok4_chat_history.db',
-        'gpt': r'.\data\gpt_chat_history.db'
-    }.get(db_type, r'.\data\mental_chat_history.db')
+    """Thêm tin nhắn vào lịch sử trò chuyện, trả về True nếu đã lưu."""
+    table = chat_table(db_type)
+    message_id = None if message_id is None else str(message_id)
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        if db_type == 'grok4':
-            c.execute("INSERT INTO messages (thread_id, user_id, message_id, role, content, mode, timestamp) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
-                      (str(thread_id), str(user_id), str(message_id), role, content, mode))
-        elif db_type == 'gpt':
-            c.execute("INSERT INTO messages (thread_id, user_id, message_id, role, content, batch_id, timestamp) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
-                      (str(thread_id), str(user_id), str(message_id), role, content, batch_id))
-        else:
-            c.execute("INSERT INTO messages (thread_id, user_id, message_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, datetime('now'))",
-                      (str(thread_id), str(user_id), str(message_id), role, content))
-        conn.commit()
+        with get_pool().transaction() as c:
+            if db_type == 'grok4':
+                c.execute(f"INSERT INTO {table} (thread_id, user_id, message_id, role, content, mode, timestamp) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
+                          (str(thread_id), str(user_id), message_id, role, content, mode))
+            elif db_type == 'gpt':
+                c.execute(f"INSERT INTO {table} (thread_id, user_id, message_id, role, content, batch_id, timestamp) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
+                          (str(thread_id), str(user_id), message_id, role, content, batch_id))
+            else:
+                c.execute(f"INSERT INTO {table} (thread_id, user_id, message_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, datetime('now'))",
+                          (str(thread_id), str(user_id), message_id, role, content))
         logging.info(f"Added message to {db_type} database for thread {thread_id}, user {user_id}")
+        return True
+    except sqlite3.IntegrityError:
+        logging.info(f"Message {message_id} already exists in {db_type} database")
+        return False
     except Exception as e:
         logging.error(f"Error adding message to {db_type} database for thread {thread_id}: {str(e)}")
-    finally:
-        conn.close()
+        return False
 
 def get_history(thread_id, limit=20, db_type='mental', user_id=None):
-    """Lấy lịch sử trò chuyện."""
-    db_path = {
-        'mental': r'.\data\mental_chat_history.db',
-        'general': r'.\data\general_chat_history.db',
-        'grok4': r'.\data\grok4_chat_history.db',
-        'gpt': r'.\data\gpt_chat_history.db'
-    }.get(db_type, r'.\data\mental_chat_history.db')
+    """Lấy ``limit`` tin nhắn gần nhất của thread, theo thứ tự thời gian."""
+    table = chat_table(db_type)
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        query = "SELECT role, content FROM messages WHERE thread_id = ?"
+        query = f"SELECT id, role, content, timestamp FROM {table} WHERE thread_id = ?"
         params = [str(thread_id)]
         if user_id:
             query += " AND user_id = ?"
             params.append(str(user_id))
-        query += " ORDER BY timestamp ASC LIMIT ?"
+        # Đọc ngược theo index (thread_id[, user_id], timestamp) rồi đảo lại cho đúng thứ tự hội thoại
+        query = f"SELECT role, content FROM ({query} ORDER BY timestamp DESC, id DESC LIMIT ?) ORDER BY timestamp ASC, id ASC"
         params.append(limit)
-        c.execute(query, params)
-        history = [{"role": row[0], "content": row[1]} for row in c.fetchall()]
+        with get_pool().reader() as c:
+            c.execute(query, params)
+            history = [{"role": row[0], "content": row[1]} for row in c.fetchall()]
         logging.debug(f"Query: {query}, params: {params}, retrieved {len(history)} messages: {history}")
         logging.info(f"Retrieved {len(history)} messages from {db_type} database for thread {thread_id}, user {user_id or 'all'}")
         return history
     except Exception as e:
         logging.error(f"Error retrieving history from {db_type} database for thread {thread_id}: {str(e)}")
         return []
-    finally:
-        conn.close()
 
 def is_message_exists(message_id, db_type):
     """Kiểm tra message_id đã tồn tại chưa để tránh xử lý trùng."""
-    db_path = {
-        'mental': r'.\data\mental_chat_history.db',
-        'general': r'.\data\general_chat_history.db',
-        'grok4': r'.\data\grok4_chat_history.db',
-        'gpt': r'.\data\gpt_chat_history.db'
-    }.get(db_type)
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute("SELECT 1 FROM messages WHERE message_id = ?", (str(message_id),))
-        exists = c.fetchone() is not None
-        conn.close()
-        return exists
+        table = CHAT_TABLES[db_type]
+        with get_pool().reader() as c:
+            c.execute(f"SELECT 1 FROM {table} WHERE message_id = ?", (str(message_id),))
+            return c.fetchone() is not None
     except Exception as e:
         logging.error(f"Error checking message existence in {db_type} database: {str(e)}")
         return False
 
+def get_thread_summary(db_type, thread_id, user_id=None):
+    """Trả về (summary, through_id) của thread, hoặc None nếu chưa có tóm tắt."""
+    try:
+        with get_pool().reader() as c:
+            c.execute("SELECT summary, through_id FROM thread_summaries WHERE chat_table = ? AND thread_id = ? AND user_id = ?",
+                      (chat_table(db_type), str(thread_id), str(user_id) if user_id else ''))
+            return c.fetchone()
+    except Exception as e:
+        logging.error(f"Error retrieving summary from {db_type} database for thread {thread_id}: {str(e)}")
+        return None
+
+def save_thread_summary(db_type, thread_id, user_id, summary, through_id):
+    """Lưu tóm tắt bao phủ các tin có id <= ``through_id``."""
+    try:
+        with get_pool().transaction() as c:
+            c.execute("INSERT INTO thread_summaries (chat_table, thread_id, user_id, summary, through_id, updated_at) "
+                      "VALUES (?, ?, ?, ?, ?, datetime('now')) ON CONFLICT (chat_table, thread_id, user_id) DO UPDATE SET "
+                      "summary = excluded.summary, through_id = excluded.through_id, updated_at = excluded.updated_at",
+                      (chat_table(db_type), str(thread_id), str(user_id) if user_id else '', summary, through_id))
+        logging.info(f"Saved summary for thread {thread_id} in {db_type} database through message {through_id}")
+    except Exception as e:
+        logging.error(f"Error saving summary to {db_type} database for thread {thread_id}: {str(e)}")
+
+def get_messages_to_summarize(db_type, thread_id, user_id=None, after_id=0, keep_recent=0, limit=200):
+    """Các tin (id, role, content) có id > ``after_id``, trừ ``keep_recent`` tin gần nhất, cũ nhất trước."""
+    table = chat_table(db_type)
+    try:
+        where = "thread_id = ?"
+        params = [str(thread_id)]
+        if user_id:
+            where += " AND user_id = ?"
+            params.append(str(user_id))
+        query = (f"SELECT id, role, content FROM {table} WHERE {where} AND id > ? AND id NOT IN "
+                 f"(SELECT id FROM {table} WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?) "
+                 "ORDER BY timestamp ASC, id ASC LIMIT ?")
+        with get_pool().reader() as c:
+            c.execute(query, params + [after_id or 0] + params + [keep_recent, limit])
+            return c.fetchall()
+    except Exception as e:
+        logging.error(f"Error retrieving messages to summarize from {db_type} database for thread {thread_id}: {str(e)}")
+        return []
+
+def delete_expired_messages(db_type, max_age_days, limit=PRUNE_BATCH_SIZE):
+    """Xóa tối đa ``limit`` tin nhắn cũ hơn ``max_age_days`` ngày, trả về số dòng đã xóa."""
+    table = CHAT_TABLES[db_type]
+    try:
+        with get_pool().transaction() as c:
+            # id tăng theo thời gian ghi: tin cũ nằm đầu bảng nên chỉ cần tìm tin đầu tiên còn hạn
+            c.execute(f"SELECT id FROM {table} WHERE timestamp >= datetime('now', ?) ORDER BY id LIMIT 1",
+                      (f"-{max_age_days} days",))
+            row = c.fetchone()
+            if row is None:
+                c.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} ORDER BY id LIMIT ?)", (limit,))
+            else:
+                c.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE id < ? ORDER BY id LIMIT ?)",
+                          (row[0], limit))
+            deleted = c.rowcount
+            # Tóm tắt của thread không còn hoạt động cũng hết hạn theo
+            c.execute("DELETE FROM thread_summaries WHERE chat_table = ? AND updated_at < datetime('now', ?)",
+                      (table, f"-{max_age_days} days"))
+            return deleted
+    except Exception as e:
+        logging.error(f"Error deleting expired messages from {db_type} database: {str(e)}")
+        return 0
+
+def trim_thread_history(db_type, max_per_thread, max_threads=PRUNE_BATCH_SIZE):
+    """Giữ ``max_per_thread`` tin gần nhất cho tối đa ``max_threads`` thread vượt giới hạn, trả về số dòng đã xóa.
+
+    Với các kênh trong ``PER_USER_CHATS`` giới hạn áp dụng cho từng (thread, người dùng), khớp cách đọc lịch sử,
+    để một người nhắn nhiều không đẩy hết ngữ cảnh của người khác trong cùng thread.
+    """
+    table = CHAT_TABLES[db_type]
+    partition = "thread_id, user_id" if db_type in PER_USER_CHATS else "thread_id"
+    match = "thread_id = ? AND user_id IS ?" if db_type in PER_USER_CHATS else "thread_id = ?"
+    pool = get_pool()
+    deleted = 0
+    try:
+        with pool.reader() as c:
+            c.execute(f"SELECT {partition} FROM {table} GROUP BY {partition} HAVING COUNT(*) > ? LIMIT ?",
+                      (max_per_thread, max_threads))
+            groups = c.fetchall()
+        for group in groups:
+            # Mỗi nhóm một transaction ngắn để không giữ khóa ghi quá lâu
+            with pool.transaction() as c:
+                c.execute(f"DELETE FROM {table} WHERE {match} AND id NOT IN (SELECT id FROM {table} "
+                          f"WHERE {match} ORDER BY timestamp DESC, id DESC LIMIT ?)",
+                          tuple(group) + tuple(group) + (max_per_thread,))
+                deleted += c.rowcount
+        return deleted
+    except Exception as e:
+        logging.error(f"Error trimming threads in {db_type} database: {str(e)}")
+        return deleted
+
+def compact_db(min_free_ratio=COMPACT_FREE_RATIO):
+    """VACUUM cơ sở dữ liệu khi tỉ lệ trang trống vượt ``min_free_ratio``; trả về True nếu đã nén."""
+    pool = get_pool()
+    try:
+        with pool.reader() as c:
+            c.execute("PRAGMA page_count")
+            page_count = c.fetchone()[0]
+            c.execute("PRAGMA freelist_count")
+            free_count = c.fetchone()[0]
+        if not page_count or free_count / page_count < min_free_ratio:
+            return False
+        pool.vacuum()
+        logging.info(f"Compacted {DB_NAME}: reclaimed {free_count} of {page_count} pages")
+        return True
+    except Exception as e:
+        logging.error(f"Error compacting {DB_NAME}: {str(e)}")
+        return False
+
 def add_news_article(article_id, title, published):
     """Thêm bài viết tin tức."""
     try:
-        conn = sqlite3.connect(r'.\data\news.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO news_articles (article_id, title, published) VALUES (?, ?, ?)",
-                  (article_id, title, published))
-        conn.commit()
-        logging.info(f"Added news article {article_id} to news.db")
+        with get_pool().transaction() as c:
+            c.execute("INSERT INTO news_articles (article_id, title, published) VALUES (?, ?, ?)",
+                      (article_id, title, published))
+        logging.info(f"Added news article {article_id}")
     except sqlite3.IntegrityError:
-        logging.info(f"News article {article_id} already exists in news.db")
+        logging.info(f"News article {article_id} already exists")
     except Exception as e:
         logging.error(f"Error adding news article {article_id}: {str(e)}")
-    finally:
-        conn.close()
 
 def is_article_sent(article_id):
     """Kiểm tra xem bài viết đã được gửi chưa."""
     try:
-        conn = sqlite3.connect(r'.\data\news.db')
-        c = conn.cursor()
-        c.execute("SELECT 1 FROM news_articles WHERE article_id = ?", (article_id,))
-        exists = c.fetchone() is not None
-        conn.close()
+        with get_pool().reader() as c:
+            c.execute("SELECT 1 FROM news_articles WHERE article_id = ?", (article_id,))
+            exists = c.fetchone() is not None
         logging.info(f"Checked news article {article_id}: {'sent' if exists else 'not sent'}")
         return exists
     except Exception as e:
@@ -397,101 +501,80 @@ def is_article_sent(article_id):
 def add_reddit_post(post_id, subreddit, title, posted_at):
     """Thêm bài đăng Reddit vào cơ sở dữ liệu."""
     try:
-        conn = sqlite3.connect(r'.\data\reddit.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO reddit_posts (post_id, subreddit, title, posted_at) VALUES (?, ?, ?, ?)",
-                  (post_id, subreddit, title, posted_at))
-        conn.commit()
-        logging.info(f"Added Reddit post {post_id} from subreddit {subreddit} to reddit.db")
+        with get_pool().transaction() as c:
+            c.execute("INSERT INTO reddit_posts (post_id, subreddit, title, posted_at) VALUES (?, ?, ?, ?)",
+                      (post_id, subreddit, title, posted_at))
+        logging.info(f"Added Reddit post {post_id} from subreddit {subreddit}")
     except sqlite3.IntegrityError:
-        logging.info(f"Reddit post {post_id} in subreddit {subreddit} already exists in reddit.db")
+        logging.info(f"Reddit post {post_id} in subreddit {subreddit} already exists")
     except Exception as e:
         logging.error(f"Error adding Reddit post {post_id}: {str(e)}")
-    finally:
-        conn.close()
 
 def is_reddit_post_sent(post_id, subreddit):
     """Kiểm tra xem bài đăng Reddit đã được gửi chưa."""
     try:
-        conn = sqlite3.connect(r'.\data\reddit.db')
-        c = conn.cursor()
-        c.execute("SELECT 1 FROM reddit_posts WHERE post_id = ? AND subreddit = ?", (post_id, subreddit))
-        exists = c.fetchone() is not None
-        conn.close()
+        with get_pool().reader() as c:
+            c.execute("SELECT 1 FROM reddit_posts WHERE post_id = ? AND subreddit = ?", (post_id, subreddit))
+            exists = c.fetchone() is not None
         logging.info(f"Checked Reddit post {post_id} in subreddit {subreddit}: {'sent' if exists else 'not sent'}")
         return exists
     except Exception as e:
         logging.error(f"Error checking Reddit post {post_id} in subreddit {subreddit}: {str(e)}")
         return False
 
-def add_to_queue(guild_id, url, audio_url, title, duration=0):
-    """Thêm bài hát vào hàng đợi."""
-    try:
-        conn = sqlite3.connect(r'.\data\queues.db')
-        c = conn.cursor()
-        c.execute("SELECT MAX(position) FROM queues WHERE guild_id = ?", (str(guild_id),))
-        max_position = c.fetchone()[0]
-        position = (max_position + 1) if max_position is not None else 0
-        c.execute("INSERT INTO queues (guild_id, url, audio_url, title, duration, position) VALUES (?, ?, ?, ?, ?, ?)",
-                  (str(guild_id), url, audio_url, title, duration, position))
-        conn.commit()
-        logging.info(f"Added song to queue for guild {guild_id}, position {position}")
-    except Exception as e:
-        logging.error(f"Error adding to queue for guild {guild_id}: {str(e)}")
-    finally:
-        conn.close()
-
 def get_queue(guild_id):
-    """Lấy hàng đợi theo guild_id."""
+    """Lấy hàng đợi theo guild_id dưới dạng list (id, url, audio_url, title, duration, position)."""
     try:
-        conn = sqlite3.connect(r'.\data\queues.db')
-        c = conn.cursor()
-        c.execute("SELECT url, audio_url, title, duration FROM queues WHERE guild_id = ? ORDER BY position", (str(guild_id),))
-        queue = [(row[0], row[1], row[2], row[3] or 0) for row in c.fetchall()]
+        with get_pool().reader() as c:
+            c.execute("SELECT id, url, audio_url, title, duration, position FROM queues WHERE guild_id = ? ORDER BY position, id", (str(guild_id),))
+            queue = [(row[0], row[1], row[2], row[3], row[4] or 0, row[5]) for row in c.fetchall()]
         logging.info(f"Retrieved queue with {len(queue)} items for guild {guild_id}")
         return queue
     except Exception as e:
         logging.error(f"Error retrieving queue for guild {guild_id}: {str(e)}")
         return []
-    finally:
-        conn.close()
 
-def remove_from_queue(guild_id, position):
-    """Xóa bài hát khỏi hàng đợi theo vị trí."""
-    try:
-        conn = sqlite3.connect(r'.\data\queues.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM queues WHERE guild_id = ? AND position = ?", (str(guild_id), position))
-        c.execute("UPDATE queues SET position = position - 1 WHERE guild_id = ? AND position > ?", (str(guild_id), position))
-        conn.commit()
-        logging.info(f"Removed song from queue for guild {guild_id}, position {position}")
-    except Exception as e:
-        logging.error(f"Error removing from queue for guild {guild_id}: {str(e)}")
-    finally:
-        conn.close()
+def apply_queue_ops(ops):
+    """Áp dụng một loạt thao tác queue trong một transaction.
 
-def clear_queue(guild_id):
-    """Xóa toàn bộ hàng đợi của guild_id."""
+    Mỗi thao tác là ('upsert', (id, guild_id, url, audio_url, title, duration, position)),
+    ('delete', guild_id, id), ('position', guild_id, id, position) hoặc ('clear', guild_id|None).
+    """
+    if not ops:
+        return
+    with get_pool().transaction() as c:
+        for op in ops:
+            kind = op[0]
+            if kind == 'upsert':
+                c.execute("INSERT OR REPLACE INTO queues (id, guild_id, url, audio_url, title, duration, position) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          op[1])
+            elif kind == 'delete':
+                c.execute("DELETE FROM queues WHERE guild_id = ? AND id = ?", (op[1], op[2]))
+            elif kind == 'position':
+                c.execute("UPDATE queues SET position = ? WHERE guild_id = ? AND id = ?", (op[3], op[1], op[2]))
+            elif kind == 'clear':
+                if op[1] is None:
+                    c.execute("DELETE FROM queues")
+                else:
+                    c.execute("DELETE FROM queues WHERE guild_id = ?", (op[1],))
+            else:
+                raise ValueError(f"Unknown queue op: {kind}")
+    logging.info(f"Applied {len(ops)} queue ops")
+
+def add_x_user(username):
+    """Thêm người dùng X vào danh sách theo dõi."""
     try:
-        conn = sqlite3.connect(r'.\data\queues.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM queues WHERE guild_id = ?", (str(guild_id),))
-        conn.commit()
-        logging.info(f"Cleared queue for guild {guild_id}")
+        with get_pool().transaction() as c:
+            c.execute("INSERT OR IGNORE INTO x_users (username) VALUES (?)", (username,))
+        logging.info(f"Added X user {username}")
     except Exception as e:
-        logging.error(f"Error clearing queue for guild {guild_id}: {str(e)}")
-    finally:
-        conn.close()
+        logging.error(f"Error adding X user {username}: {str(e)}")
 
 def clear_news_articles():
-    """Xóa toàn bộ bài viết tin tức trong news.db."""
+    """Xóa toàn bộ bài viết tin tức."""
     try:
-        conn = sqlite3.connect(r'.\data\news.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM news_articles")
-        conn.commit()
-        logging.info("Cleared news articles in news.db")
+        with get_pool().transaction() as c:
+            c.execute("DELETE FROM news_articles")
+        logging.info("Cleared news articles")
     except Exception as e:
         logging.error(f"Error clearing news articles: {str(e)}")
-    finally:
-        conn.close()
\ No newline at end of file
@@ -6,9 +6,15 @@ from config import BOT_TOKEN
 from src.events.bot_events import setup_events
 from src.commands.music_commands import setup_music_commands
 from src.commands.debug_commands import setup_debug_commands
+from src.music.extractor import extractor
+from src.music.queue_writer import queue_writer, restore_queues
+from src.utils.http import close_sessions
+from src.utils.helpers import mental_rag
 from src.commands.commands import setup as setup_educational_commands
-from database import init_db, get_db_connection, clear_queue, clear_news_articles
+from database import close_pools
+from async_database import init_db, clear_news_articles, add_x_user as db_add_x_user, shutdown as shutdown_db_executors
 from src.utils.news import news_task
+from src.utils.chat_retention import chat_retention_task
 from src.utils.pixiv import setup as x_images_setup
 from src.utils.reddit import setup as reddit_images_setup
 
@@ -25,29 +31,11 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 queues = {}
 loop_status = {}
 
-def clear_music_queue():
-    """Xóa toàn bộ hàng đợi nhạc."""
-    try:
-        conn = get_db_connection("queues.db")
-        c = conn.cursor()
-        c.execute("DELETE FROM queues")
-        conn.commit()
-        logging.info("Cleared music queue in queues.db")
-    except Exception as e:
-        logging.error(f"Error clearing music queue: {str(e)}")
-    finally:
-        conn.close()
-
 @bot.command()
 async def add_x_user(ctx, username):
     """Thêm người dùng X để theo dõi ảnh."""
     username = username.replace("@", "")
-    from database import get_db_connection
-    conn = get_db_connection("x_users.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO x_users (username) VALUES (?)", (username,))
-    conn.commit()
-    conn.close()
+    await db_add_x_user(username)
     await ctx.send(f"Đã thêm người dùng X: @{username} để theo dõi ảnh.")
     logging.info(f"Đã thêm người dùng X: {username}")
 
@@ -55,14 +43,16 @@ async def add_x_user(ctx, username):
 async def on_ready():
     """Xử lý khi bot sẵn sàng."""
     logging.info(f"Bot đã sẵn sàng với tên: {bot.user.name}")
-    # Clear non-chatbot queues on startup
-    clear_music_queue()
-    clear_news_articles()
+    # Clear non-chatbot data on startup; music queues are restored from queues.db
+    await clear_news_articles()
     await setup_tasks()
 
 async def setup_tasks():
     """Khởi tạo các task bất đồng bộ."""
-    init_db()
+    mental_rag.start()
+    await init_db()
+    await restore_queues(bot, queues)
+    bot.loop.create_task(queue_writer.run())
     setup_events(bot, queues, loop_status)
     setup_music_commands(bot, queues, loop_status)
     setup_debug_commands(bot, queues)
@@ -70,6 +60,7 @@ async def setup_tasks():
     bot.loop.create_task(x_images_setup(bot))
     bot.loop.create_task(reddit_images_setup(bot))
     bot.loop.create_task(news_task(bot))
+    bot.loop.create_task(chat_retention_task())
     logging.info("All tasks and commands set up")
 
 async def main():
@@ -78,6 +69,13 @@ async def main():
     except Exception as e:
         logging.error(f"Error starting bot: {str(e)}")
         await bot.close()
+    finally:
+        await close_sessions()
+        extractor.shutdown()
+        mental_rag.close()
+        queue_writer.close()
+        shutdown_db_executors()
+        close_pools()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
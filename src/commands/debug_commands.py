@@ -1,14 +1,17 @@
 import discord
 from discord.ext import commands
-import yt_dlp
 import logging
 import subprocess
 import os
 import shutil
 import asyncio
 from src.music.player import get_fresh_audio_url
+from src.music.extractor import extractor
+from src.music.stream_cache import stream_cache
+from src.utils.http import get_stats as get_http_stats
 from src.music.utils import test_stream_url
-from src.utils.helpers import safe_voice_connect
+from async_database import history_cache
+from src.utils.helpers import safe_voice_connect, groq_router, xai_router, gemini_router, mental_rag, mental_answer_cache, thread_summarizers
 
 def setup_debug_commands(bot, queues):
     @bot.command(name='search', help='Tìm kiếm bài hát mà không phát (để debug)')
@@ -23,23 +26,22 @@ def setup_debug_commands(bot, queues):
         search_query = f"ytsearch5:{query}"
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(search_query, download=False)
+            info = await extractor.extract_info(search_query, ydl_opts, guild_id=str(ctx.guild.id), kind="search")
                 
-                if 'entries' in info and info['entries']:
-                    results = []
-                    for i, entry in enumerate(info['entries'][:5]):
-                        if entry:
-                            title = entry.get('title', 'Unknown')
-                            uploader = entry.get('uploader', 'Unknown')
-                            duration = entry.get('duration', 0)
-                            duration_str = f"{duration // 60}:{duration % 60:02d}" if duration > 0 else "Unknown"
-                            results.append(f"{i+1}. **{title}**\n   👤 {uploader} | ⏱️ {duration_str}")
+            if 'entries' in info and info['entries']:
+                results = []
+                for i, entry in enumerate(info['entries'][:5]):
+                    if entry:
+                        title = entry.get('title', 'Unknown')
+                        uploader = entry.get('uploader', 'Unknown')
+                        duration = entry.get('duration', 0)
+                        duration_str = f"{duration // 60}:{duration % 60:02d}" if duration > 0 else "Unknown"
+                        results.append(f"{i+1}. **{title}**\n   👤 {uploader} | ⏱️ {duration_str}")
                     
-                    result_text = f"🔍 Kết quả tìm kiếm cho '{query}':\n\n" + "\n\n".join(results)
-                    await ctx.send(result_text[:2000])
-                else:
-                    await ctx.send(f"❌ Không tìm thấy kết quả cho: '{query}'")
+                result_text = f"🔍 Kết quả tìm kiếm cho '{query}':\n\n" + "\n\n".join(results)
+                await ctx.send(result_text[:2000])
+            else:
+                await ctx.send(f"❌ Không tìm thấy kết quả cho: '{query}'")
                     
         except Exception as e:
             await ctx.send(f"❌ Lỗi khi tìm kiếm: {str(e)}")
@@ -60,9 +62,72 @@ def setup_debug_commands(bot, queues):
 📋 Queue Length: {len(queue)}
 💾 Memory Queue: {len(queues.get(guild_id, []))}
 🌐 Voice Channel: {voice_client.channel.name if voice_client and voice_client.channel else 'None'}
+🗂️ Stream Cache: {stream_cache.hits} hit / {stream_cache.misses} miss
         """
         await ctx.send(debug_info)
 
+    @bot.command(name='http_stats', help='Thống kê tái sử dụng kết nối HTTP')
+    async def http_stats(ctx):
+        stats = get_http_stats()
+        await ctx.send(
+            f"🌐 **HTTP Stats:**\n"
+            f"📨 Requests: {stats.get('requests', 0)}\n"
+            f"🔌 Kết nối mới: {stats.get('connections_created', 0)}\n"
+            f"♻️ Kết nối tái sử dụng: {stats.get('connections_reused', 0)} ({stats['reuse_ratio']:.0%})\n"
+            f"🧭 DNS cache: {stats.get('dns_cache_hits', 0)} hit / {stats.get('dns_cache_misses', 0)} miss\n"
+            f"📂 Session đang mở: {stats['open_sessions']}"
+        )
+
+    @bot.command(name='llm_stats', help='Độ trễ, hedging và circuit breaker của các model LLM')
+    async def llm_stats(ctx):
+        lines = ["🤖 **LLM Stats:**"]
+        for router in (groq_router, xai_router, gemini_router):
+            for name, stats in router.snapshot().items():
+                ttft = f"{stats['ttft']:.2f}s" if stats['ttft'] is not None else "-"
+                total = f"{stats['total']:.2f}s" if stats['total'] is not None else "-"
+                lines.append(
+                    f"`{name}` [{stats['state']}] TTFT {ttft}, tổng {total}, "
+                    f"{stats['successes']}/{stats['requests']} thành công, {stats['failures']} lỗi, {stats['hedges']} hedge"
+                )
+        await ctx.send("\n".join(lines))
+
+    @bot.command(name='rag_stats', help='Trạng thái RAG kênh mental và tỉ lệ trúng cache')
+    async def rag_stats(ctx):
+        if not mental_rag.ready:
+            await ctx.send(f"📚 RAG chưa sẵn sàng{f' (lỗi: {mental_rag.error})' if mental_rag.error else ''}")
+            return
+        stats = mental_rag.stats()
+        embeddings = stats.get("embeddings") or {}
+        lines = [
+            "📚 **RAG Stats:**",
+            f"Index: {mental_rag.instance.index.ntotal} chunk, nạp trong {mental_rag.load_seconds:.1f}s",
+            f"Truy vấn: {stats.get('queries', 0)} trong {stats.get('batches', 0)} batch (TB {stats.get('avg_batch', 0.0):.1f}), {stats.get('swaps', 0)} lần đổi bản build",
+            f"Cache embedding: {embeddings.get('hits', 0)}/{embeddings.get('hits', 0) + embeddings.get('misses', 0)} trúng ({embeddings.get('hit_rate', 0.0):.0%})",
+        ]
+        if mental_answer_cache is not None:
+            answers = mental_answer_cache.stats()
+            lines.append(
+                f"Cache câu trả lời: {answers['hits']}/{answers['hits'] + answers['misses']} trúng ({answers['hit_rate']:.0%}), "
+                f"{answers['entries']} mục, {answers['evictions']} bị loại, {answers['expirations']} hết hạn"
+            )
+        if stats.get("rerank"):
+            rerank = stats["rerank"]
+            lines.append(f"Rerank `{rerank['model']}`: {rerank['calls']} lần, bỏ qua {rerank['skipped']}, vượt ngân sách {rerank['over_budget']}, {rerank['pair_ms']:.2f}ms/cặp")
+        await ctx.send("\n".join(lines))
+
+    @bot.command(name='history_stats', help='Cache lịch sử trò chuyện và tóm tắt hội thoại')
+    async def history_stats(ctx):
+        stats = history_cache.stats()
+        lines = [
+            "💬 **History Stats:**",
+            f"Thread trong cache: {stats['threads']} ({stats['chars']:,} ký tự)",
+            f"Trúng: {stats['hits']}/{stats['hits'] + stats['misses']} ({stats['hit_rate']:.0%}), {stats['evictions']} thread bị loại",
+        ]
+        for name, summarizer in thread_summarizers.items():
+            summaries = summarizer.stats()
+            lines.append(f"Tóm tắt ({name}): {summaries['runs']} lần, {summaries['failures']} lỗi, {summaries['running']} đang chạy")
+        await ctx.send("\n".join(lines))
+
     @bot.command(name='ffmpeg_test', help='Test FFmpeg')
     async def ffmpeg_test(ctx):
         try:
@@ -85,24 +150,23 @@ def setup_debug_commands(bot, queues):
             query = f"ytsearch1:{query}"
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(query, download=False)
+            info = await extractor.extract_info(query, ydl_opts, guild_id=str(ctx.guild.id), kind="search")
                 
-                if 'entries' in info and info['entries']:
-                    entry = info['entries'][0]
-                    if entry:
-                        video_url = entry['webpage_url']
-                        title = entry.get('title', 'Unknown')
-                elif 'webpage_url' in info:
-                    video_url = info['webpage_url']
-                    title = info.get('title', 'Unknown')
-                else:
-                    await ctx.send('❌ Không tìm thấy video')
-                    return
+            if 'entries' in info and info['entries']:
+                entry = info['entries'][0]
+                if entry:
+                    video_url = entry['webpage_url']
+                    title = entry.get('title', 'Unknown')
+            elif 'webpage_url' in info:
+                video_url = info['webpage_url']
+                title = info.get('title', 'Unknown')
+            else:
+                await ctx.send('❌ Không tìm thấy video')
+                return
             
             await ctx.send(f'🔍 Testing stream cho: **{title}**')
             
-            stream_url = await get_fresh_audio_url(video_url)
+            stream_url = await get_fresh_audio_url(video_url, str(ctx.guild.id), use_cache=False)
             if not stream_url:
                 await ctx.send('❌ Không lấy được stream URL')
                 return
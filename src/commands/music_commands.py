@@ -2,12 +2,41 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import logging
-from database import clear_queue
-from src.music.player import play_song, play_playlist, play_next
+from src.music.player import play_song, play_playlist, play_next, cancel_prefetch, mark_user_stopped
+from src.music.extractor import extractor
+from src.music.queue import GuildQueue, get_guild_queue
+from src.music.queue_writer import queue_writer
 from src.music.utils import get_progress_bar
 from src.utils.helpers import safe_voice_connect
 
 def setup_music_commands(bot, queues, loop_status):
+    def shuffle_queue(guild_id):
+        queue = get_guild_queue(queues, guild_id)
+        if len(queue) < 3:
+            return '❌ Cần ít nhất 2 bài đang chờ để xáo trộn.'
+        queue_writer.reposition(guild_id, queue.shuffle(keep_head=True))
+        logging.info(f"Shuffled queue for guild {guild_id}")
+        return f'🔀 Đã xáo trộn {len(queue) - 1} bài trong queue.'
+
+    def remove_track(guild_id, index):
+        queue = get_guild_queue(queues, guild_id)
+        # Số thứ tự giống lệnh queue: 1 là bài đang phát
+        if not 2 <= index <= len(queue):
+            return f'❌ Số thứ tự không hợp lệ. Chọn từ 2 đến {len(queue)}.' if len(queue) > 1 else '❌ Không có bài nào đang chờ.'
+        track = queue.remove(queue[index - 1].id)
+        queue_writer.delete(guild_id, track.id)
+        logging.info(f"Removed {track.title} from queue for guild {guild_id}")
+        return f'🗑️ Đã xóa **{track.title}** khỏi queue.'
+
+    def move_track(guild_id, from_index, to_index):
+        queue = get_guild_queue(queues, guild_id)
+        if not (2 <= from_index <= len(queue) and 2 <= to_index <= len(queue)):
+            return f'❌ Số thứ tự không hợp lệ. Chọn từ 2 đến {len(queue)}.' if len(queue) > 1 else '❌ Không có bài nào đang chờ.'
+        track = queue[from_index - 1]
+        queue_writer.reposition(guild_id, queue.move(track.id, to_index - 1))
+        logging.info(f"Moved {track.title} to position {to_index} for guild {guild_id}")
+        return f'↕️ Đã chuyển **{track.title}** tới vị trí {to_index}.'
+
     @bot.tree.command(name="play", description="Phát nhạc từ URL YouTube/Spotify hoặc tìm kiếm theo từ khóa")
     @app_commands.describe(query="Tên bài hát, URL YouTube hoặc Spotify")
     async def play(interaction: discord.Interaction, query: str):
@@ -20,9 +49,13 @@ def setup_music_commands(bot, queues, loop_status):
         
         try:
             if "list=" in query or "playlist" in query.lower():
-                if await play_playlist(ctx, query, queues):
-                    if not voice_client.is_playing():
+                async def start_playback():
+                    if not voice_client.is_playing() and not voice_client.is_paused():
                         await play_next(ctx, voice_client, queues, bot, loop_status)
+
+                # Bắt đầu phát ngay khi chunk đầu tiên của playlist vào queue
+                if await play_playlist(ctx, query, queues, on_first_entry=start_playback):
+                    await start_playback()
                     await interaction.followup.send("🎶 Đã thêm playlist vào queue!")
             else:
                 if await play_song(ctx, query, queues):
@@ -37,9 +70,13 @@ def setup_music_commands(bot, queues, loop_status):
     async def skip(interaction: discord.Interaction):
         ctx = await bot.get_context(interaction)
         voice_client = ctx.voice_client
+        if voice_client is not None and not voice_client.is_playing() and not voice_client.is_paused() and extractor.cancel_guild(str(ctx.guild.id), kind=("stream", "prefetch")):
+            await interaction.response.send_message('⏭️ Đã bỏ qua bài hát đang tải.')
+            return
         if voice_client is None or not voice_client.is_playing():
             await interaction.response.send_message('❌ Không có bài hát nào đang phát.')
             return
+        mark_user_stopped(loop_status, str(ctx.guild.id))
         voice_client.stop()
         await interaction.response.send_message('⏭️ Đã bỏ qua bài hát hiện tại.')
         logging.info(f"Skipped current song in guild {ctx.guild.id}")
@@ -109,10 +146,13 @@ def setup_music_commands(bot, queues, loop_status):
             await interaction.response.send_message('❌ Chưa kết nối với kênh voice')
             return
         
-        voice_client.stop()
         guild_id = str(ctx.guild.id)
-        clear_queue(guild_id)
-        queues[guild_id] = []
+        mark_user_stopped(loop_status, guild_id)
+        voice_client.stop()
+        queues[guild_id] = GuildQueue(guild_id)
+        extractor.cancel_guild(guild_id)
+        cancel_prefetch(guild_id)
+        queue_writer.clear(guild_id)
         loop_status[guild_id] = {"mode": "off", "current_song": None, "start_time": None}
         await interaction.response.send_message('⏹️ Đã dừng nhạc và xóa queue.')
         logging.info(f"Stopped music and cleared queue for guild {ctx.guild.id}")
@@ -125,9 +165,13 @@ def setup_music_commands(bot, queues, loop_status):
             await interaction.response.send_message('❌ Chưa kết nối với kênh voice')
             return
         
-        clear_queue(str(ctx.guild.id))
-        queues[str(ctx.guild.id)] = []
-        loop_status[str(ctx.guild.id)] = {"mode": "off", "current_song": None, "start_time": None}
+        guild_id = str(ctx.guild.id)
+        mark_user_stopped(loop_status, guild_id)
+        queues[guild_id] = GuildQueue(guild_id)
+        extractor.cancel_guild(guild_id)
+        cancel_prefetch(guild_id)
+        queue_writer.clear(guild_id)
+        loop_status[guild_id] = {"mode": "off", "current_song": None, "start_time": None}
         await voice_client.disconnect()
         await interaction.response.send_message('👋 Đã rời khỏi kênh voice.')
         logging.info(f"Left voice channel for guild {ctx.guild.id}")
@@ -159,6 +203,20 @@ def setup_music_commands(bot, queues, loop_status):
         
         logging.info(f"Set loop mode to {mode} for guild {guild_id}")
 
+    @bot.tree.command(name="shuffle", description="Xáo trộn các bài đang chờ trong queue")
+    async def shuffle(interaction: discord.Interaction):
+        await interaction.response.send_message(shuffle_queue(str(interaction.guild_id)))
+
+    @bot.tree.command(name="remove", description="Xóa một bài khỏi queue theo số thứ tự")
+    @app_commands.describe(index="Số thứ tự trong lệnh /queue")
+    async def remove(interaction: discord.Interaction, index: int):
+        await interaction.response.send_message(remove_track(str(interaction.guild_id), index))
+
+    @bot.tree.command(name="move", description="Chuyển một bài trong queue tới vị trí khác")
+    @app_commands.describe(from_index="Số thứ tự hiện tại", to_index="Số thứ tự mới")
+    async def move(interaction: discord.Interaction, from_index: int, to_index: int):
+        await interaction.response.send_message(move_track(str(interaction.guild_id), from_index, to_index))
+
     @bot.tree.command(name="progress", description="Hiển thị thanh tiến trình bài hát đang phát")
     async def progress(interaction: discord.Interaction):
         ctx = await bot.get_context(interaction)
@@ -174,9 +232,13 @@ def setup_music_commands(bot, queues, loop_status):
         
         try:
             if "list=" in query or "playlist" in query.lower():
-                if await play_playlist(ctx, query, queues):
-                    if not voice_client.is_playing():
+                async def start_playback():
+                    if not voice_client.is_playing() and not voice_client.is_paused():
                         await play_next(ctx, voice_client, queues, bot, loop_status)
+
+                # Bắt đầu phát ngay khi chunk đầu tiên của playlist vào queue
+                if await play_playlist(ctx, query, queues, on_first_entry=start_playback):
+                    await start_playback()
                     await ctx.send("🎶 Đã thêm playlist vào queue!")
             else:
                 if await play_song(ctx, query, queues):
@@ -190,9 +252,13 @@ def setup_music_commands(bot, queues, loop_status):
     @bot.command(name='skip', help='Bỏ qua bài hát hiện tại')
     async def skip_prefix(ctx):
         voice_client = ctx.voice_client
+        if voice_client is not None and not voice_client.is_playing() and not voice_client.is_paused() and extractor.cancel_guild(str(ctx.guild.id), kind=("stream", "prefetch")):
+            await ctx.send('⏭️ Đã bỏ qua bài hát đang tải.')
+            return
         if voice_client is None or not voice_client.is_playing():
             await ctx.send('❌ Không có bài hát nào đang phát.')
             return
+        mark_user_stopped(loop_status, str(ctx.guild.id))
         voice_client.stop()
         await ctx.send('⏭️ Đã bỏ qua bài hát hiện tại.')
         logging.info(f"Skipped current song in guild {ctx.guild.id}")
@@ -257,10 +323,13 @@ def setup_music_commands(bot, queues, loop_status):
             await ctx.send('❌ Chưa kết nối với kênh voice')
             return
         
-        voice_client.stop()
         guild_id = str(ctx.guild.id)
-        clear_queue(guild_id)
-        queues[guild_id] = []
+        mark_user_stopped(loop_status, guild_id)
+        voice_client.stop()
+        queues[guild_id] = GuildQueue(guild_id)
+        extractor.cancel_guild(guild_id)
+        cancel_prefetch(guild_id)
+        queue_writer.clear(guild_id)
         loop_status[guild_id] = {"mode": "off", "current_song": None, "start_time": None}
         await ctx.send('⏹️ Đã dừng nhạc và xóa queue.')
         logging.info(f"Stopped music and cleared queue for guild {ctx.guild.id}")
@@ -272,9 +341,13 @@ def setup_music_commands(bot, queues, loop_status):
             await ctx.send('❌ Chưa kết nối với kênh voice')
             return
         
-        clear_queue(str(ctx.guild.id))
-        queues[str(ctx.guild.id)] = []
-        loop_status[str(ctx.guild.id)] = {"mode": "off", "current_song": None, "start_time": None}
+        guild_id = str(ctx.guild.id)
+        mark_user_stopped(loop_status, guild_id)
+        queues[guild_id] = GuildQueue(guild_id)
+        extractor.cancel_guild(guild_id)
+        cancel_prefetch(guild_id)
+        queue_writer.clear(guild_id)
+        loop_status[guild_id] = {"mode": "off", "current_song": None, "start_time": None}
         await voice_client.disconnect()
         await ctx.send('👋 Đã rời khỏi kênh voice.')
         logging.info(f"Left voice channel for guild {ctx.guild.id}")
@@ -299,6 +372,18 @@ def setup_music_commands(bot, queues, loop_status):
         
         logging.info(f"Set loop mode to {mode} for guild {guild_id}")
 
+    @bot.command(name='shuffle', help='Xáo trộn các bài đang chờ trong queue')
+    async def shuffle_prefix(ctx):
+        await ctx.send(shuffle_queue(str(ctx.guild.id)))
+
+    @bot.command(name='remove', help='Xóa một bài khỏi queue theo số thứ tự')
+    async def remove_prefix(ctx, index: int):
+        await ctx.send(remove_track(str(ctx.guild.id), index))
+
+    @bot.command(name='move', help='Chuyển một bài trong queue tới vị trí khác')
+    async def move_prefix(ctx, from_index: int, to_index: int):
+        await ctx.send(move_track(str(ctx.guild.id), from_index, to_index))
+
     @bot.command(name='progress', help='Hiển thị thanh tiến trình bài hát đang phát')
     async def progress_prefix(ctx):
         progress_text = await get_progress_bar(ctx, queues, loop_status)
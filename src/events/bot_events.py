@@ -5,9 +5,11 @@ import asyncio
 import json
 from datetime import datetime
 from config import MENTAL_CHANNEL_ID, GENERAL_CHANNEL_ID, WELCOME_CHANNEL_ID, NEWS_CHANNEL_ID, GROK4_CHANNEL_ID, GPT_CHANNEL_ID, GEMINI_CHANNEL_ID
-from database import get_history, add_message, is_message_exists, get_gpt_batch_job, get_queue, update_gpt_batch_job
-from src.utils.helpers import get_groq_response, get_xai_response, get_gpt_response, get_gemini_response, mental_rag, check_gpt_batch_jobs
+from async_database import add_message, is_message_exists, get_gpt_batch_job, update_gpt_batch_job
+from src.music.queue_writer import restore_queues
+from src.utils.helpers import get_groq_response, get_xai_response, get_gpt_response, get_gemini_response, mental_rag, mental_answer_cache, check_gpt_batch_jobs
 from src.utils.news import news_task
+from src.utils.discord_stream import DiscordStreamWriter
 
 def setup_events(bot, queues, loop_status):
 
@@ -21,10 +23,8 @@ def setup_events(bot, queues, loop_status):
     @bot.event
     async def on_ready():
         logging.info(f"Bot {bot.user} connected to Discord")
-        for guild in bot.guilds:
-            guild_id = str(guild.id)
-            queues[guild_id] = get_queue(guild_id)
-            logging.info(f"Loaded queue for guild {guild_id}")
+        # Queue trong bộ nhớ là nguồn chính; chỉ nạp từ SQLite cho guild chưa có
+        await restore_queues(bot, queues)
         await bot.tree.sync()
         logging.info("Bot started, queues loaded, and slash commands synced")
         bot.loop.create_task(news_task(bot))
@@ -83,7 +83,7 @@ def setup_events(bot, queues, loop_status):
                         await message.channel.send("❌ Vui lòng cung cấp batch ID: `!gpt retrieve <batch_id>`")
                         return
                     batch_id = parts[2].strip()
-                    job = get_gpt_batch_job(batch_id)
+                    job = await get_gpt_batch_job(batch_id)
                     if not job:
                         await message.channel.send(f"❌ Batch ID {batch_id} không tồn tại.")
                         return
@@ -107,7 +107,7 @@ def setup_events(bot, queues, loop_status):
                             logging.error(f"Error parsing retrieved GPT-4.1 response for batch {batch_id}: {str(e)}")
                             await message.channel.send(f"Error: Failed to parse response for batch {batch_id}")
                         if job['status'] == 'completed':
-                            update_gpt_batch_job(batch_id, "processed", response, datetime.now().isoformat())
+                            await update_gpt_batch_job(batch_id, "processed", response, datetime.now().isoformat())
                         return
                     else:
                         await message.channel.send(f"Batch job {batch_id} {job['status']}. Không thể lấy phản hồi.")
@@ -173,29 +173,29 @@ def setup_events(bot, queues, loop_status):
                     await asyncio.sleep(1)
                     return
 
-            if is_message_exists(message.id, db_type):
+            if await is_message_exists(message.id, db_type):
                 logging.info(f"Message {message.id} already processed, skipping")
                 return
 
             logging.info(f"Processing message in thread {thread.id} for {db_type}, content: {query[:50]}...")
             try:
-                add_message(thread_id=thread.id, message_id=message.id, role="user", content=query, db_type=db_type, mode=mode, user_id=str(message.author.id), batch_id=None)
+                await add_message(thread_id=thread.id, message_id=message.id, role="user", content=query, db_type=db_type, mode=mode, user_id=str(message.author.id), batch_id=None)
+                stream = DiscordStreamWriter(thread, prefix=f"**Mode: {mode or 'default'}**\n" if mode else "")
                 if db_type == 'grok4':
-                    response = await get_xai_response(thread.id, query, user_id=str(message.author.id), mode=mode)
+                    response = await get_xai_response(thread.id, query, user_id=str(message.author.id), mode=mode, stream=stream)
                 elif db_type == 'gpt':
                     response = await get_gpt_response(thread.id, query, user_id=str(message.author.id), db_type=db_type)
                 elif db_type == 'gemini':
-                    response = await get_gemini_response(thread.id, query, db_type=db_type)
+                    response = await get_gemini_response(thread.id, query, db_type=db_type, stream=stream)
                 else:
                     rag_instance = mental_rag if db_type == 'mental' else None
-                    response = await get_groq_response(thread.id, query, rag_instance, db_type=db_type)
+                    answer_cache = mental_answer_cache if db_type == 'mental' else None
+                    response = await get_groq_response(thread.id, query, rag_instance, db_type=db_type, stream=stream, answer_cache=answer_cache)
                 logging.info(f"Generated response for thread {thread.id}: {response[:100]}...")
 
-                chunks = [response[i:i+1900] for i in range(0, len(response), 1900)]
-                for i, chunk in enumerate(chunks):
-                    prefix = f"**Mode: {mode or 'default'}**\n" if i == 0 and mode else ""
-                    await thread.send(f"{prefix}{chunk}")
-                logging.info(f"Sent response in {len(chunks)} chunks to thread {thread.id}")
+                # Phần đã stream chỉ cần sửa lần cuối; lỗi hoặc phản hồi không stream (GPT batch) được gửi như cũ
+                sent = await stream.finish(response)
+                logging.info(f"Sent response in {sent} streamed messages to thread {thread.id}")
 
             except discord.errors.HTTPException as e:
                 logging.error(f"Discord API error in thread {thread.id}: {str(e)}")
@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import logging
+import threading
+import yt_dlp
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4
+PER_GUILD_LIMIT = 2
+DEFAULT_TIMEOUT = 45
+PLAYLIST_TIMEOUT = 600
+PLAYLIST_CHUNK_SIZE = 50
+
+class ExtractionCancelled(Exception):
+    """Việc trích xuất bị hủy do người dùng skip/stop."""
+
+def _extract_info(query, ydl_opts):
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(query, download=False)
+
+def _iter_playlist(url, ydl_opts, limit, emit, stop):
+    """Duyệt playlist theo từng trang (process=False) và đẩy từng entry ra ngay khi yt-dlp trả về."""
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # URL dạng watch?v=...&list=... trả về url_result trỏ tới playlist
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False)
+        entries = info.get('entries')
+        if entries is None:
+            emit(('info', info))
+            return
+        emit(('info', {k: v for k, v in info.items() if k != 'entries'}))
+        for entry in itertools.islice(entries, limit):
+            if stop.is_set():
+                break
+            emit(('entry', entry))
+
+class ExtractionService:
+    """Chạy yt-dlp trong thread pool giới hạn, chia đều giữa các guild, có timeout và hủy theo guild.
+
+    Mỗi guild chỉ được chiếm tối đa ``per_guild_limit`` worker cùng lúc, nên một playlist dài
+    của guild này không làm nghẽn việc phát nhạc của guild khác.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, per_guild_limit=PER_GUILD_LIMIT, default_timeout=DEFAULT_TIMEOUT):
+        self.max_workers = max_workers
+        self.per_guild_limit = per_guild_limit
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-dlp")
+        self._slots = None
+        self._guild_slots = {}
+        self._jobs = defaultdict(set)
+
+    def _guild_semaphore(self, guild_id):
+        if guild_id not in self._guild_slots:
+            self._guild_slots[guild_id] = asyncio.Semaphore(self.per_guild_limit)
+        return self._guild_slots[guild_id]
+
+    async def _run_in_pool(self, guild_id, func, args, timeout):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        guild_slots = self._guild_semaphore(guild_id)
+        await guild_slots.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            guild_slots.release()
+            raise
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, func, *args)
+
+        def release(_):
+            # Chỉ trả slot khi thread thực sự xong, kể cả khi người gọi đã bỏ chờ
+            self._slots.release()
+            guild_slots.release()
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def run(self, func, *args, guild_id=None, kind="extract", timeout=None):
+        """Chạy ``func(*args)`` trong pool và trả về kết quả.
+
+        ``kind`` dùng để hủy có chọn lọc (ví dụ chỉ hủy việc lấy stream khi skip).
+        Ném ``ExtractionCancelled`` nếu bị hủy qua ``cancel_guild`` và ``asyncio.TimeoutError`` khi quá hạn.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        job = asyncio.ensure_future(self._run_in_pool(guild_id, func, args, timeout))
+        entry = (kind, job)
+        self._jobs[guild_id].add(entry)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if job.cancelled() and not (current and current.cancelling()):
+                raise ExtractionCancelled(f"Extraction cancelled for guild {guild_id}")
+            raise
+        finally:
+            self._jobs[guild_id].discard(entry)
+            if not self._jobs[guild_id]:
+                del self._jobs[guild_id]
+
+    async def extract_info(self, query, ydl_opts, guild_id=None, kind="extract", timeout=None):
+        """Tương đương ``YoutubeDL(ydl_opts).extract_info(query, download=False)`` nhưng không chặn event loop."""
+        return await self.run(_extract_info, query, ydl_opts, guild_id=guild_id, kind=kind, timeout=timeout)
+
+    async def stream_playlist(self, url, ydl_opts, guild_id=None, limit=None, chunk_size=PLAYLIST_CHUNK_SIZE, timeout=PLAYLIST_TIMEOUT):
+        """Async generator trả về từng cặp ``(playlist_info, entries)`` ngay khi yt-dlp duyệt tới.
+
+        Chunk đầu tiên được trả về ngay khi có entry đầu tiên để có thể bắt đầu phát sớm,
+        các chunk sau gom tối đa ``chunk_size`` entry đã sẵn sàng.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def emit(item):
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def work():
+            try:
+                _iter_playlist(url, ydl_opts, limit, emit, stop)
+            finally:
+                emit(done)
+
+        job = asyncio.ensure_future(self.run(work, guild_id=guild_id, kind="playlist", timeout=timeout))
+        job.add_done_callback(lambda _: items.put_nowait(done))
+        playlist_info = {}
+        try:
+            finished = False
+            while not finished:
+                item = await items.get()
+                chunk = []
+                while True:
+                    if item is done:
+                        finished = True
+                        break
+                    kind, value = item
+                    if kind == 'info':
+                        playlist_info = value
+                    else:
+                        chunk.append(value)
+                    if len(chunk) >= chunk_size or items.empty():
+                        break
+                    item = items.get_nowait()
+                if chunk:
+                    yield playlist_info, chunk
+            # Ném lỗi của worker (hủy, timeout, lỗi yt-dlp) cho người gọi
+            await job
+        finally:
+            stop.set()
+            if not job.done():
+                job.cancel()
+
+    def cancel_guild(self, guild_id, kind=None):
+        """Hủy các việc trích xuất đang chờ của guild (chỉ loại ``kind`` nếu được chỉ định, nhận str hoặc tuple)."""
+        kinds = (kind,) if isinstance(kind, str) else kind
+        cancelled = 0
+        for job_kind, job in list(self._jobs.get(guild_id, ())):
+            if (kinds is None or job_kind in kinds) and not job.done():
+                job.cancel()
+                cancelled += 1
+        if cancelled:
+            logging.info(f"Cancelled {cancelled} extraction job(s) for guild {guild_id} (kind: {kinds or 'all'})")
+        return cancelled
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+extractor = ExtractionService()
@@ -1,11 +1,22 @@
 import discord
-import yt_dlp
 import logging
 import asyncio
 import time
 import sys
 import os
-from database import add_to_queue, get_queue, remove_from_queue
+from config import PLAYLIST_MAX_ENTRIES
+from src.music.extractor import extractor, ExtractionCancelled
+from src.music.stream_cache import stream_cache, video_key
+from src.music.queue import Track, get_guild_queue
+from src.music.queue_writer import queue_writer
+
+EARLY_END_SECONDS = 15
+PREFETCH_AHEAD = 2
+RETRY_DELAY = 0.5
+PROGRESS_INTERVAL = 3
+
+_resolving = {}
+_prefetch_tasks = {}
 
 def get_base_path():
     """Lấy đường dẫn gốc cho môi trường phát triển hoặc đóng gói."""
@@ -13,8 +24,7 @@ def get_base_path():
 
 async def play_song(ctx, query, queues):
     guild_id = str(ctx.guild.id)
-    if guild_id not in queues:
-        queues[guild_id] = []
+    queue = get_guild_queue(queues, guild_id)
 
     # Kiểm tra xem query có phải là URL hay không
     is_url = query.startswith(('http://', 'https://', 'www.'))
@@ -42,53 +52,86 @@ async def play_song(ctx, query, queues):
         ydl_opts['noplaylist'] = True
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(query, download=False)
-            logging.debug(f"yt-dlp info for query {query}: {info.get('formats', [])}")
+        info = await extractor.extract_info(query, ydl_opts, guild_id=guild_id, kind="search")
+        logging.debug(f"yt-dlp info for query {query}: {info.get('formats', [])}")
             
-            if 'entries' in info and info['entries']:
-                entry = info['entries'][0]
-                if entry:
-                    url = entry['webpage_url']
-                    title = entry.get('title', 'Unknown')
-                    duration = entry.get('duration', 0) or 0
-                    uploader = entry.get('uploader', 'Unknown')
+        if 'entries' in info and info['entries']:
+            entry = info['entries'][0]
+            if entry:
+                url = entry['webpage_url']
+                title = entry.get('title', 'Unknown')
+                duration = entry.get('duration', 0) or 0
+                uploader = entry.get('uploader', 'Unknown')
                     
-                    queues[guild_id].append((url, None, title, duration))
-                    add_to_queue(guild_id, url, "", title, duration)
+                track = queue.push(Track(url, None, title, duration))
+                queue_writer.upsert(guild_id, [track])
                     
-                    duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}" if duration > 0 else "Unknown"
-                    await ctx.send(f'🎵 Đã thêm vào queue:\n**{title}**\n⏱️ Thời lượng: {duration_str}\n👤 Kênh: {uploader}')
-                    logging.info(f"Added to queue: {title} (duration: {duration}s) for guild {guild_id}")
-                else:
-                    await ctx.send(f'❌ Không tìm thấy kết quả cho: "{query}"')
-                    return False
-            elif 'webpage_url' in info:
-                url = info['webpage_url']
-                title = info.get('title', 'Unknown')
-                duration = info.get('duration', 0) or 0
-                uploader = info.get('uploader', 'Unknown')
-                
-                queues[guild_id].append((url, None, title, duration))
-                add_to_queue(guild_id, url, "", title, duration)
-                
                 duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}" if duration > 0 else "Unknown"
                 await ctx.send(f'🎵 Đã thêm vào queue:\n**{title}**\n⏱️ Thời lượng: {duration_str}\n👤 Kênh: {uploader}')
                 logging.info(f"Added to queue: {title} (duration: {duration}s) for guild {guild_id}")
             else:
-                await ctx.send(f'❌ Không thể xử lý: "{query}"')
+                await ctx.send(f'❌ Không tìm thấy kết quả cho: "{query}"')
                 return False
+        elif 'webpage_url' in info:
+            url = info['webpage_url']
+            title = info.get('title', 'Unknown')
+            duration = info.get('duration', 0) or 0
+            uploader = info.get('uploader', 'Unknown')
                 
+            track = queue.push(Track(url, None, title, duration))
+            queue_writer.upsert(guild_id, [track])
+                
+            duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}" if duration > 0 else "Unknown"
+            await ctx.send(f'🎵 Đã thêm vào queue:\n**{title}**\n⏱️ Thời lượng: {duration_str}\n👤 Kênh: {uploader}')
+            logging.info(f"Added to queue: {title} (duration: {duration}s) for guild {guild_id}")
+        else:
+            await ctx.send(f'❌ Không thể xử lý: "{query}"')
+            return False
+                
+    except ExtractionCancelled:
+        logging.info(f"Cancelled adding {query} to queue for guild {guild_id}")
+        return False
+    except asyncio.TimeoutError:
+        await ctx.send(f'⏱️ Quá thời gian khi tìm "{query}". Vui lòng thử lại.')
+        logging.error(f"Timed out extracting {query} for guild {guild_id}")
+        return False
     except Exception as e:
         await ctx.send(f'❌ Lỗi khi thêm "{query}" vào queue: {str(e)}')
         logging.error(f"Error adding {query} to queue: {e}")
         return False
+    if len(queue) <= PREFETCH_AHEAD + 1:
+        schedule_prefetch(guild_id, queues)
     return True
 
-async def play_playlist(ctx, playlist_url, queues):
+def _playlist_entry_track(entry):
+    """Chuyển một entry phẳng của yt-dlp thành Track hoặc None nếu không hợp lệ."""
+    if not entry:
+        return None
+    if entry.get('url'):
+        url = entry['url']
+    elif entry.get('webpage_url'):
+        url = entry['webpage_url']
+    elif entry.get('id'):
+        url = f"https://www.youtube.com/watch?v={entry['id']}"
+    else:
+        logging.warning(f"No valid URL found for entry: {entry}")
+        return None
+
+    title = entry.get('title', 'Unknown')
+    if not url.startswith(('http://', 'https://')):
+        logging.warning(f"Invalid URL for {title}: {url}")
+        return None
+    return Track(url, None, title, entry.get('duration', 0) or 0)
+
+async def play_playlist(ctx, playlist_url, queues, on_first_entry=None, max_entries=None):
+    """Thêm playlist vào queue theo từng chunk ngay khi yt-dlp duyệt tới.
+
+    ``on_first_entry`` (coroutine function) được gọi sau khi chunk đầu tiên vào queue để phát ngay
+    mà không cần chờ hết playlist.
+    """
     guild_id = str(ctx.guild.id)
-    if guild_id not in queues:
-        queues[guild_id] = []
+    queue = get_guild_queue(queues, guild_id)
+    max_entries = max_entries or PLAYLIST_MAX_ENTRIES
 
     ydl_opts = {
         'format': 'bestaudio[ext=m4a]',  # Ưu tiên m4a
@@ -97,7 +140,7 @@ async def play_playlist(ctx, playlist_url, queues):
         'quiet': True,
         'no_warnings': True,
         'extract_flat': 'in_playlist',
-        'playlistend': 50,
+        'lazy_playlist': True,
         'retries': 3,
         'fragment_retries': 3,
         'skip_unavailable_fragments': True,
@@ -107,92 +150,96 @@ async def play_playlist(ctx, playlist_url, queues):
         'force_ipv4': True,
     }
 
+    added_count = 0
+    failed_count = 0
+    playlist_title = 'Unknown Playlist'
     try:
         processing_msg = await ctx.send("🔄 Đang xử lý playlist, vui lòng đợi...")
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
-            logging.debug(f"yt-dlp playlist info for {playlist_url}: {info}")
-            
-            if 'entries' not in info or not info['entries']:
-                await processing_msg.edit(content="❌ Không phải playlist hợp lệ hoặc playlist trống!")
-                return False
-            
-            playlist_title = info.get('title', 'Unknown Playlist')
-            total_entries = len([e for e in info['entries'] if e])
-            
-            await processing_msg.edit(content=f"📋 Đang thêm {total_entries} bài từ playlist: **{playlist_title}**")
-            
-            added_count = 0
-            failed_count = 0
-            
-            batch_size = 5
-            for i in range(0, len(info['entries']), batch_size):
-                batch = info['entries'][i:i+batch_size]
-                
-                for entry in batch:
-                    if not entry:
-                        failed_count += 1
-                        continue
-                        
-                    try:
-                        if 'url' in entry:
-                            url = entry['url']
-                        elif 'webpage_url' in entry:
-                            url = entry['webpage_url']
-                        elif 'id' in entry:
-                            url = f"https://www.youtube.com/watch?v={entry['id']}"
-                        else:
-                            logging.warning(f"No valid URL found for entry: {entry}")
-                            failed_count += 1
-                            continue
-                        
-                        title = entry.get('title', 'Unknown')
-                        duration = entry.get('duration', 0) or 0
-                        uploader = entry.get('uploader', 'Unknown')
-                        
-                        if not url or not url.startswith(('http://', 'https://')):
-                            logging.warning(f"Invalid URL for {title}: {url}")
-                            failed_count += 1
-                            continue
-                        
-                        queues[guild_id].append((url, None, title, duration))
-                        add_to_queue(guild_id, url, "", title, duration)
-                        added_count += 1
-                        
-                        duration_str = f"{duration // 60}:{duration % 60:02d}" if duration > 0 else "Unknown"
-                        logging.info(f"Added to queue from playlist: {title} (duration: {duration}s) for guild {guild_id}")
-                        
-                    except Exception as e:
-                        logging.error(f"Error processing playlist entry {entry.get('title', 'Unknown')}: {e}")
-                        failed_count += 1
-                        continue
-                
-                if (i + batch_size) % 10 == 0 or (i + batch_size) >= len(info['entries']):
-                    progress = min(i + batch_size, len(info['entries']))
-                    await processing_msg.edit(content=f"📋 Đã xử lý {progress}/{len(info['entries'])} bài từ playlist: **{playlist_title}**")
-                
-                await asyncio.sleep(0.1)
-            
-            result_msg = f'🎶 Đã thêm **{added_count}** bài hát từ playlist: **{playlist_title}**'
-            if failed_count > 0:
-                result_msg += f'\n⚠️ {failed_count} bài không thể thêm (có thể do video bị hạn chế hoặc lỗi)'
-            
-            await processing_msg.edit(content=result_msg)
-            
-            if added_count > 0:
-                return True
-            else:
-                await ctx.send("❌ Không thể thêm bài nào từ playlist này!")
+        last_progress = time.monotonic()
+
+        async for info, entries in extractor.stream_playlist(playlist_url, ydl_opts, guild_id=guild_id, limit=max_entries):
+            playlist_title = info.get('title') or playlist_title
+            tracks = []
+            for entry in entries:
+                track = _playlist_entry_track(entry)
+                if track is None:
+                    failed_count += 1
+                    continue
+                tracks.append(track)
+
+            if queues.get(guild_id) is not queue:
+                # stop/leave đã xóa queue trong lúc đang nhập playlist
+                logging.info(f"Queue was cleared during playlist import for guild {guild_id}, stopping")
                 return False
-                
+            if not tracks:
+                continue
+            queue.extend(tracks)
+            queue_writer.upsert(guild_id, tracks)
+            first_chunk = added_count == 0
+            added_count += len(tracks)
+            logging.info(f"Added {len(tracks)} songs from playlist {playlist_title} for guild {guild_id} ({added_count} total)")
+
+            if first_chunk and on_first_entry is not None:
+                await on_first_entry()
+            if first_chunk or time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await processing_msg.edit(content=f"📋 Đã thêm {added_count} bài từ playlist: **{playlist_title}**...")
+
+        if added_count == 0 and failed_count == 0:
+            await processing_msg.edit(content="❌ Không phải playlist hợp lệ hoặc playlist trống!")
+            return False
+
+        result_msg = f'🎶 Đã thêm **{added_count}** bài hát từ playlist: **{playlist_title}**'
+        if added_count + failed_count >= max_entries:
+            result_msg += f'\n📏 Đã đạt giới hạn {max_entries} bài mỗi playlist'
+        if failed_count > 0:
+            result_msg += f'\n⚠️ {failed_count} bài không thể thêm (có thể do video bị hạn chế hoặc lỗi)'
+
+        await processing_msg.edit(content=result_msg)
+
+        if added_count > 0:
+            schedule_prefetch(guild_id, queues)
+            return True
+        else:
+            await ctx.send("❌ Không thể thêm bài nào từ playlist này!")
+            return False
+
+    except ExtractionCancelled:
+        logging.info(f"Cancelled playlist extraction for {playlist_url} in guild {guild_id} after {added_count} songs")
+        return False
+    except asyncio.TimeoutError:
+        await ctx.send(f'⏱️ Quá thời gian khi xử lý playlist. Đã thêm {added_count} bài.')
+        logging.error(f"Timed out extracting playlist {playlist_url} for guild {guild_id} after {added_count} songs")
+        return added_count > 0
     except Exception as e:
         error_msg = f'❌ Lỗi khi xử lý playlist: {str(e)}'
         await ctx.send(error_msg)
         logging.error(f"Playlist error: {e}")
-        return False
+        return added_count > 0
+
+async def get_fresh_audio_url(url, guild_id=None, use_cache=True, kind="stream"):
+    if use_cache:
+        cached = stream_cache.get(url)
+        if cached:
+            logging.info(f"Using cached stream URL for {url} (format {cached.get('format_id')})")
+            return cached['url']
+
+    # Gộp các lần phân giải trùng nhau (ví dụ play_next gặp đúng bài đang được prefetch)
+    key = (guild_id, video_key(url))
+    task = _resolving.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_resolve_audio_url(url, guild_id, kind))
+        _resolving[key] = task
+        task.add_done_callback(lambda t: _forget_resolve(key, t))
+    return await asyncio.shield(task)
 
-async def get_fresh_audio_url(url):
+def _forget_resolve(key, task):
+    _resolving.pop(key, None)
+    # Đọc exception để không bị cảnh báo khi người chờ đã bị hủy trước đó
+    if not task.cancelled():
+        task.exception()
+
+async def _resolve_audio_url(url, guild_id, kind):
     ydl_opts = {
         'format': 'bestaudio[ext=m4a]',  # Ưu tiên m4a
         'quiet': False,  # Bật verbose logging để gỡ lỗi
@@ -211,24 +258,34 @@ async def get_fresh_audio_url(url):
         'cachedir': False,
     }
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            logging.debug(f"yt-dlp info for {url}: {info}")
+        info = await extractor.extract_info(url, ydl_opts, guild_id=guild_id, kind=kind, timeout=30)
+        logging.debug(f"yt-dlp info for {url}: {info}")
             
-            if 'formats' in info:
-                audio_formats = []
-                for f in info['formats']:
-                    if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
-                        audio_formats.append(f)
+        if 'formats' in info:
+            audio_formats = []
+            for f in info['formats']:
+                if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
+                    audio_formats.append(f)
                 
-                audio_formats.sort(key=lambda x: x.get('abr', 0) or 0)
+            audio_formats.sort(key=lambda x: x.get('abr', 0) or 0)
                 
-                if audio_formats:
-                    chosen_format = audio_formats[0]
-                    logging.info(f"Selected audio format: {chosen_format.get('format_id')} - {chosen_format.get('abr', 'unknown')}kbps")
-                    return chosen_format.get('url')
+            if audio_formats:
+                chosen_format = audio_formats[0]
+                logging.info(f"Selected audio format: {chosen_format.get('format_id')} - {chosen_format.get('abr', 'unknown')}kbps")
+                if chosen_format.get('url'):
+                    stream_cache.put(url, chosen_format['url'], format_id=chosen_format.get('format_id'),
+                                     abr=chosen_format.get('abr'), title=info.get('title'), duration=info.get('duration'))
+                return chosen_format.get('url')
             
-            return info.get('url')
+        if info.get('url'):
+            stream_cache.put(url, info['url'], format_id=info.get('format_id'), abr=info.get('abr'),
+                             title=info.get('title'), duration=info.get('duration'))
+        return info.get('url')
+    except ExtractionCancelled:
+        raise
+    except asyncio.TimeoutError:
+        logging.error(f"Timed out getting fresh audio URL for {url}")
+        return None
     except Exception as e:
         logging.error(f"Error getting fresh audio URL for {url}: {e}")
         return None
@@ -244,41 +301,48 @@ async def play_next(ctx, voice_client, queues, bot, loop_status):
             pass
         return
 
-    queue = queues.get(guild_id, [])
+    queue = get_guild_queue(queues, guild_id)
     if len(queue) == 0:
         if loop_status.get(guild_id, {}).get("mode") == "queue" and loop_status.get(guild_id, {}).get("current_song"):
             url, _, title, duration = loop_status[guild_id]["current_song"]
-            queues[guild_id].append((url, None, title, duration))
-            add_to_queue(guild_id, url, "", title, duration)
+            track = queue.push(Track(url, None, title, duration))
+            queue_writer.upsert(guild_id, [track])
         else:
             await ctx.send("📭 Queue đã hết. Thêm bài hát mới bằng lệnh `/play`.")
             logging.info(f"No songs left in queue for guild {guild_id}")
             return
 
-    url, _, title, duration = queue[0]
+    track = queue.head
+    url, _, title, duration = track
 
     audio_url = None
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            audio_url = await get_fresh_audio_url(url)
+            audio_url = await get_fresh_audio_url(url, guild_id, use_cache=attempt == 0)
             if audio_url:
                 break
             else:
                 logging.warning(f"Attempt {attempt + 1}: Could not get audio URL for {title}")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2)
+                    await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+        except ExtractionCancelled:
+            logging.info(f"Stopped resolving {title} for guild {guild_id}")
+            # stop/leave thay queue bằng queue mới; nếu queue vẫn là queue cũ thì đây là skip
+            if queues.get(guild_id) is queue and queue.remove(track.id):
+                queue_writer.delete(guild_id, track.id)
+                await play_next(ctx, voice_client, queues, bot, loop_status)
+            return
         except Exception as e:
             logging.error(f"Attempt {attempt + 1}: Error getting audio URL for {title}: {e}")
             if attempt < max_retries - 1:
-                await asyncio.sleep(2)
+                await asyncio.sleep(RETRY_DELAY * (attempt + 1))
 
     if not audio_url:
         await ctx.send(f'❌ Không thể lấy âm thanh cho: **{title}**. Chuyển sang bài tiếp theo.')
         logging.error(f"Could not get audio URL for {title} after {max_retries} attempts")
-        queue.pop(0)
-        remove_from_queue(guild_id, 0)
-        queues[guild_id] = queue
+        if queue.remove(track.id):
+            queue_writer.delete(guild_id, track.id)
         await play_next(ctx, voice_client, queues, bot, loop_status)
         return
 
@@ -314,25 +378,22 @@ async def play_next(ctx, voice_client, queues, bot, loop_status):
                     )
             else:
                 logging.info(f"Finished playing {title} (duration: {duration}s) in guild {guild_id}")
-            
-            try:
-                if len(queues.get(guild_id, [])) > 0:
-                    if loop_status.get(guild_id, {}).get("mode") == "song":
-                        queues[guild_id].insert(0, loop_status[guild_id]["current_song"])
-                        add_to_queue(guild_id, url, "", title, duration)
-                    else:
-                        queues[guild_id].pop(0)
-                        remove_from_queue(guild_id, 0)
-                    logging.info(f"Removed finished song from queue for guild {guild_id}")
-            except (IndexError, KeyError) as e:
-                logging.error(f"Error removing song from queue for guild {guild_id}: {e}")
-            
-            # Kiểm tra trạng thái trước khi phát bài tiếp theo
-            if not voice_client.is_playing() and not voice_client.is_paused():
-                asyncio.run_coroutine_threadsafe(
-                    delayed_play_next(ctx, voice_client, queues, bot, loop_status, 1),
-                    bot.loop
-                )
+
+            # URL hết hạn/bị chặn (403) thường làm FFmpeg thoát ngay sau vài giây mà không báo lỗi;
+            # bỏ qua khi người dùng skip/stop
+            status = loop_status.get(guild_id, {})
+            started = status.get("start_time")
+            ended_early = (not status.get("user_stopped") and duration > 0 and started
+                           and time.time() - started < min(EARLY_END_SECONDS, duration / 2))
+            if error or ended_early:
+                # invalidate lên lịch ghi file cache: chạy trên event loop, không chạy trên thread audio
+                bot.loop.call_soon_threadsafe(stream_cache.invalidate, url, "playback error" if error else "ended early, possibly 403")
+
+            # Callback chạy trên thread audio: chuyển việc cập nhật queue về event loop
+            asyncio.run_coroutine_threadsafe(
+                finish_track(ctx, voice_client, queues, bot, loop_status, queue, track),
+                bot.loop
+            )
 
         # Kiểm tra xem voice_client đang phát nhạc hay không
         if voice_client.is_playing() or voice_client.is_paused():
@@ -353,6 +414,7 @@ async def play_next(ctx, voice_client, queues, bot, loop_status):
         }
         
         voice_client.play(source, after=after_playing)
+        schedule_prefetch(guild_id, queues)
         
         duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}" if duration > 0 else "Unknown"
         await ctx.send(f'🎵 Đang phát: **{title}** ({duration_str})')
@@ -361,18 +423,66 @@ async def play_next(ctx, voice_client, queues, bot, loop_status):
     except Exception as e:
         await ctx.send(f'❌ Lỗi khi phát **{title}**: {str(e)}')
         logging.error(f"Error playing {title} in guild {guild_id}: {e}")
-        try:
-            queue.pop(0)
-            remove_from_queue(guild_id, 0)
-            queues[guild_id] = queue
-        except (IndexError, KeyError):
-            pass
+        stream_cache.invalidate(url, "audio source error")
+        if queue.remove(track.id):
+            queue_writer.delete(guild_id, track.id)
         await play_next(ctx, voice_client, queues, bot, loop_status)
 
-async def delayed_play_next(ctx, voice_client, queues, bot, loop_status, delay=1):
-    await asyncio.sleep(delay)
+async def finish_track(ctx, voice_client, queues, bot, loop_status, queue, track):
+    """Cập nhật queue sau khi một bài kết thúc rồi phát bài tiếp theo."""
+    guild_id = str(ctx.guild.id)
+    mode = loop_status.get(guild_id, {}).get("mode")
+    # Bỏ qua nếu queue đã bị stop/leave thay mới hoặc bài đã bị xóa
+    if queues.get(guild_id) is queue and track.id in queue:
+        if mode == "song":
+            logging.info(f"Looping {track.title} in guild {guild_id}")
+        elif mode == "queue":
+            queue_writer.reposition(guild_id, queue.move_to_end(track.id))
+            logging.info(f"Moved finished song to the end of the queue for guild {guild_id}")
+        else:
+            queue.remove(track.id)
+            queue_writer.delete(guild_id, track.id)
+            logging.info(f"Removed finished song from queue for guild {guild_id}")
+
+    # Kiểm tra trạng thái trước khi phát bài tiếp theo
+    if not voice_client.is_playing() and not voice_client.is_paused():
+        await delayed_play_next(ctx, voice_client, queues, bot, loop_status, 0)
+
+async def delayed_play_next(ctx, voice_client, queues, bot, loop_status, delay=0):
+    if delay:
+        await asyncio.sleep(delay)
     
     if voice_client and voice_client.is_connected():
         await play_next(ctx, voice_client, queues, bot, loop_status)
     else:
-        logging.warning(f"Voice client disconnected during delayed_play_next for guild {ctx.guild.id}")
\ No newline at end of file
+        logging.warning(f"Voice client disconnected during delayed_play_next for guild {ctx.guild.id}")
+
+def mark_user_stopped(loop_status, guild_id):
+    """Đánh dấu bài đang phát bị dừng bởi skip/stop/leave (gọi trước ``voice_client.stop()``)."""
+    loop_status.setdefault(guild_id, {})["user_stopped"] = True
+
+def schedule_prefetch(guild_id, queues, count=PREFETCH_AHEAD):
+    """Phân giải trước URL stream cho ``count`` bài kế tiếp trong queue khi bài hiện tại đang phát."""
+    previous = _prefetch_tasks.get(guild_id)
+    if previous and not previous.done():
+        previous.cancel()
+    _prefetch_tasks[guild_id] = asyncio.ensure_future(_prefetch(guild_id, queues, count))
+
+def cancel_prefetch(guild_id):
+    """Hủy tác vụ prefetch của guild (khi stop/leave)."""
+    task = _prefetch_tasks.pop(guild_id, None)
+    if task and not task.done():
+        task.cancel()
+
+async def _prefetch(guild_id, queues, count):
+    # Lấy tuần tự từng bài để chỉ chiếm một slot của guild trong extractor
+    for url, _, title, _ in get_guild_queue(queues, guild_id).peek(count + 1)[1:]:
+        if stream_cache.get(url):
+            continue
+        try:
+            if await get_fresh_audio_url(url, guild_id, kind="prefetch"):
+                logging.info(f"Prefetched stream URL for {title} in guild {guild_id}")
+        except ExtractionCancelled:
+            return
+        except Exception as e:
+            logging.error(f"Error prefetching {title} for guild {guild_id}: {e}")
@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+
+POSITION_GAP = 1024.0
+MIN_POSITION_GAP = 1e-6
+
+_id_lock = threading.Lock()
+_last_id = 0
+
+def new_track_id():
+    """Cấp ID tăng dần duy nhất (dựa trên time_ns) để ghi thẳng vào cột id của bảng queues."""
+    global _last_id
+    with _id_lock:
+        _last_id = max(_last_id + 1, time.time_ns())
+        return _last_id
+
+class Track:
+    """Một bài trong queue. Có thể unpack như tuple cũ: ``url, audio_url, title, duration = track``."""
+    __slots__ = ("id", "url", "audio_url", "title", "duration", "position", "_prev", "_next")
+
+    def __init__(self, url, audio_url=None, title="Unknown", duration=0, id=None, position=None):
+        self.id = id if id is not None else new_track_id()
+        self.url = url
+        self.audio_url = audio_url
+        self.title = title
+        self.duration = duration or 0
+        self.position = position
+        self._prev = None
+        self._next = None
+
+    def __iter__(self):
+        return iter((self.url, self.audio_url, self.title, self.duration))
+
+    def __repr__(self):
+        return f"Track(id={self.id}, title={self.title!r}, position={self.position})"
+
+    def row(self, guild_id):
+        """Bộ giá trị (id, guild_id, url, audio_url, title, duration, position) để lưu SQLite."""
+        return (self.id, str(guild_id), self.url, self.audio_url or "", self.title, self.duration, self.position)
+
+class GuildQueue:
+    """Queue nhạc của một guild: danh sách liên kết đôi + dict theo ID.
+
+    push/push_front/pop_front/remove theo ID và move_to_end đều O(1); thứ tự lưu trong SQLite
+    bằng vị trí thực có khoảng trống (``POSITION_GAP``) nên không phải đánh số lại các dòng khác.
+    """
+
+    def __init__(self, guild_id, tracks=()):
+        self.guild_id = str(guild_id)
+        self._tracks = {}
+        self._head = None
+        self._tail = None
+        for track in tracks:
+            self.push(track)
+
+    @classmethod
+    def from_rows(cls, guild_id, rows):
+        """Tạo queue từ các dòng (id, url, audio_url, title, duration, position) đã sắp theo position."""
+        queue = cls(guild_id)
+        for track_id, url, audio_url, title, duration, position in rows:
+            queue._link_last(Track(url, audio_url or None, title, duration, id=track_id, position=position))
+        return queue
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __bool__(self):
+        return bool(self._tracks)
+
+    def __contains__(self, track_id):
+        return track_id in self._tracks
+
+    def __iter__(self):
+        node = self._head
+        while node is not None:
+            yield node
+            node = node._next
+
+    def __getitem__(self, index):
+        if index == 0 and self._head is not None:
+            return self._head
+        if index == -1 and self._tail is not None:
+            return self._tail
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("queue index out of range")
+        for i, track in enumerate(self):
+            if i == index:
+                return track
+
+    @property
+    def head(self):
+        return self._head
+
+    def get(self, track_id):
+        return self._tracks.get(track_id)
+
+    def peek(self, count):
+        """Trả về ``count`` bài đầu queue mà không duyệt hết danh sách."""
+        result = []
+        node = self._head
+        while node is not None and len(result) < count:
+            result.append(node)
+            node = node._next
+        return result
+
+    def _link_last(self, track):
+        track._prev, track._next = self._tail, None
+        if self._tail is not None:
+            self._tail._next = track
+        else:
+            self._head = track
+        self._tail = track
+        self._tracks[track.id] = track
+        return track
+
+    def _link_before(self, track, node):
+        if node is None:
+            return self._link_last(track)
+        track._prev, track._next = node._prev, node
+        if node._prev is not None:
+            node._prev._next = track
+        else:
+            self._head = track
+        node._prev = track
+        self._tracks[track.id] = track
+        return track
+
+    def _unlink(self, track):
+        if track._prev is not None:
+            track._prev._next = track._next
+        else:
+            self._head = track._next
+        if track._next is not None:
+            track._next._prev = track._prev
+        else:
+            self._tail = track._prev
+        track._prev = track._next = None
+        del self._tracks[track.id]
+        return track
+
+    def push(self, track):
+        """Thêm vào cuối queue."""
+        track.position = self._tail.position + POSITION_GAP if self._tail is not None else 0.0
+        return self._link_last(track)
+
+    def push_front(self, track):
+        """Thêm vào đầu queue."""
+        track.position = self._head.position - POSITION_GAP if self._head is not None else 0.0
+        return self._link_before(track, self._head)
+
+    def extend(self, tracks):
+        return [self.push(track) for track in tracks]
+
+    def pop_front(self):
+        if self._head is None:
+            raise IndexError("pop from empty queue")
+        return self._unlink(self._head)
+
+    def remove(self, track_id):
+        """Xóa bài theo ID, trả về Track hoặc None nếu không còn trong queue."""
+        track = self._tracks.get(track_id)
+        if track is None:
+            return None
+        return self._unlink(track)
+
+    def move_to_end(self, track_id):
+        """Chuyển bài xuống cuối queue; trả về list (id, position) cần lưu."""
+        track = self._unlink(self._tracks[track_id])
+        self.push(track)
+        return [(track.id, track.position)]
+
+    def move(self, track_id, index):
+        """Chuyển bài tới vị trí ``index`` (tính sau khi đã lấy bài ra); trả về list (id, position) cần lưu.
+
+        Vị trí mới nằm giữa hai bài kề nên thường chỉ một dòng thay đổi; khi khoảng trống
+        quá nhỏ thì đánh lại vị trí cho cả queue.
+        """
+        track = self._unlink(self._tracks[track_id])
+        index = max(0, min(index, len(self)))
+        if index == len(self):
+            self.push(track)
+            return [(track.id, track.position)]
+        after = self[index]
+        before = after._prev
+        self._link_before(track, after)
+        if before is None:
+            track.position = after.position - POSITION_GAP
+        elif after.position - before.position > MIN_POSITION_GAP:
+            track.position = (before.position + after.position) / 2
+        else:
+            return self.renumber()
+        return [(track.id, track.position)]
+
+    def shuffle(self, keep_head=True):
+        """Xáo trộn queue (giữ nguyên bài đang phát nếu ``keep_head``); trả về list (id, position) cần lưu."""
+        tracks = list(self)
+        head = tracks.pop(0) if keep_head and tracks else None
+        random.shuffle(tracks)
+        self.clear()
+        if head is not None:
+            self._link_last(head)
+        for track in tracks:
+            self._link_last(track)
+        return self.renumber(start=1 if head is not None else 0)
+
+    def renumber(self, start=0):
+        """Gán lại vị trí cách đều cho các bài từ ``start``; trả về list (id, position) đã đổi."""
+        changes = []
+        base = self._head.position if start and self._head is not None else 0.0
+        for i, track in enumerate(self):
+            if i < start:
+                continue
+            track.position = base + i * POSITION_GAP
+            changes.append((track.id, track.position))
+        return changes
+
+    def clear(self):
+        self._tracks.clear()
+        self._head = self._tail = None
+
+def get_guild_queue(queues, guild_id):
+    """Lấy GuildQueue của guild trong dict ``queues``, tạo mới nếu chưa có."""
+    guild_id = str(guild_id)
+    queue = queues.get(guild_id)
+    if not isinstance(queue, GuildQueue):
+        queue = GuildQueue(guild_id, [Track(*song) for song in queue or ()])
+        queues[guild_id] = queue
+    return queue
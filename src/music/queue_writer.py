@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import database
+from async_database import run_write, get_queue
+from src.music.queue import GuildQueue
+
+JOURNAL_FILE = os.path.join(".", "data", "queue_journal.jsonl")
+FLUSH_INTERVAL = 1.0
+
+def coalesce_ops(ops):
+    """Gộp các thao tác theo từng bài: thao tác sau cùng thắng, clear xóa mọi thao tác trước đó của guild."""
+    merged = OrderedDict()
+    for op in ops:
+        kind = op[0]
+        if kind == 'clear':
+            guild_id = op[1]
+            for key in [k for k in merged if guild_id is None or k[1] == guild_id]:
+                del merged[key]
+            merged[('clear', guild_id)] = op
+            merged.move_to_end(('clear', guild_id))
+            continue
+        if kind == 'upsert':
+            key = ('track', op[1][1], op[1][0])
+        else:
+            key = ('track', op[1], op[2])
+        previous = merged.get(key)
+        if kind == 'position' and previous is not None:
+            if previous[0] == 'upsert':
+                row = list(previous[1])
+                row[6] = op[3]
+                op = ('upsert', tuple(row))
+            elif previous[0] == 'delete':
+                continue
+        merged[key] = op
+        merged.move_to_end(key)
+    return list(merged.values())
+
+class QueueWriter:
+    """Ghi trễ (write-behind) các thay đổi queue nhạc xuống queues.db.
+
+    Queue trong bộ nhớ là nguồn chính; mỗi thay đổi được ghi ngay vào journal JSONL rồi gom lại
+    và ghi vào SQLite theo chu kỳ trong một transaction. Mọi thao tác đều idempotent (id do bộ nhớ
+    cấp, INSERT OR REPLACE / DELETE / UPDATE theo id) nên phát lại journal sau khi crash là an toàn.
+    """
+
+    def __init__(self, journal_path=JOURNAL_FILE, flush_interval=FLUSH_INTERVAL):
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self._ops = []
+        self._lock = threading.Lock()
+        self._journal = None
+        self.flushed_ops = 0
+        self.flushed_batches = 0
+
+    def _open_journal(self):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self._journal
+
+    def _append(self, ops):
+        with self._lock:
+            journal = self._open_journal()
+            for op in ops:
+                journal.write(json.dumps(op, ensure_ascii=False) + "\n")
+            journal.flush()
+            self._ops.extend(ops)
+
+    def upsert(self, guild_id, tracks):
+        self._append([('upsert', track.row(guild_id)) for track in tracks])
+
+    def delete(self, guild_id, track_id):
+        self._append([('delete', str(guild_id), track_id)])
+
+    def reposition(self, guild_id, changes):
+        self._append([('position', str(guild_id), track_id, position) for track_id, position in changes])
+
+    def clear(self, guild_id=None):
+        self._append([('clear', str(guild_id) if guild_id is not None else None)])
+
+    def pending(self):
+        with self._lock:
+            return len(self._ops)
+
+    def _take(self):
+        with self._lock:
+            ops, self._ops = self._ops, []
+            return ops
+
+    def _rewrite_journal(self):
+        """Ghi lại journal chỉ với các thao tác chưa được lưu vào SQLite."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            tmp_path = f"{self.journal_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for op in self._ops:
+                    f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.journal_path)
+
+    def _commit(self, ops):
+        merged = coalesce_ops(ops)
+        database.apply_queue_ops(merged)
+        self._rewrite_journal()
+        self.flushed_ops += len(ops)
+        self.flushed_batches += 1
+        logging.debug(f"Flushed {len(ops)} queue ops as {len(merged)} writes")
+
+    async def flush(self):
+        ops = self._take()
+        if not ops:
+            return 0
+        try:
+            await run_write(self._commit, ops)
+        except Exception as e:
+            # Trả lại hàng đợi để thử lại ở chu kỳ sau; journal vẫn còn nguyên
+            with self._lock:
+                self._ops = ops + self._ops
+            logging.error(f"Error flushing queue journal: {str(e)}")
+            return 0
+        return len(ops)
+
+    async def run(self):
+        """Task nền: gom và ghi các thay đổi queue mỗi ``flush_interval`` giây."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def replay(self):
+        """Phát lại journal còn sót (sau crash) vào queues.db. Gọi trước khi đọc queue lúc khởi động."""
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return 0
+        ops = []
+        for line in lines:
+            try:
+                ops.append(tuple(json.loads(line)))
+            except json.JSONDecodeError:
+                # Dòng cuối có thể bị cắt dở khi crash
+                logging.warning(f"Skipping corrupt queue journal line: {line[:100]}")
+        ops = [(op[0], tuple(op[1])) if op[0] == 'upsert' else op for op in ops]
+        if ops:
+            database.apply_queue_ops(coalesce_ops(ops))
+            logging.info(f"Replayed {len(ops)} queue journal ops from {self.journal_path}")
+        self._rewrite_journal()
+        return len(ops)
+
+    def close(self):
+        """Ghi nốt các thay đổi còn lại khi tắt bot (chạy đồng bộ)."""
+        ops = self._take()
+        try:
+            if ops:
+                self._commit(ops)
+        except Exception as e:
+            logging.error(f"Error flushing queue journal on shutdown: {str(e)}")
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+queue_writer = QueueWriter()
+
+async def restore_queues(bot, queues):
+    """Phát lại journal rồi nạp queue từ SQLite cho các guild chưa có queue trong bộ nhớ."""
+    await run_write(queue_writer.replay)
+    for guild in bot.guilds:
+        guild_id = str(guild.id)
+        if isinstance(queues.get(guild_id), GuildQueue):
+            continue
+        queues[guild_id] = GuildQueue.from_rows(guild_id, await get_queue(guild_id))
+        logging.info(f"Loaded queue for guild {guild_id}")
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+CACHE_FILE = os.path.join(".", "data", "stream_cache.json")
+MAX_ENTRIES = 500
+EXPIRY_MARGIN = 300  # Bỏ URL sớm 5 phút để không hết hạn giữa bài
+DEFAULT_TTL = 3 * 3600  # Dùng khi URL không có tham số expire
+
+_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+def video_key(url):
+    """Lấy video ID từ URL YouTube để làm khóa cache; URL khác dùng nguyên chuỗi."""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host.endswith("youtu.be"):
+        return parsed.path.lstrip("/").split("/")[0] or url
+    if "youtube" in host:
+        video_id = parse_qs(parsed.query).get("v")
+        if video_id:
+            return video_id[0]
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live"):
+            return parts[1]
+    return url
+
+def parse_expiry(audio_url):
+    """Đọc thời điểm hết hạn (epoch) từ tham số ``expire`` của URL googlevideo."""
+    match = _EXPIRE_RE.search(audio_url or "")
+    if match:
+        return int(match.group(1))
+    return None
+
+class StreamCache:
+    """Cache URL stream đã phân giải (bộ nhớ + file JSON), theo video ID và hạn ``expire``."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES, margin=EXPIRY_MARGIN):
+        self.path = path
+        self.max_entries = max_entries
+        self.margin = margin
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._save_pending = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            now = time.time()
+            self._entries = {k: v for k, v in entries.items() if v.get("expires", 0) - self.margin > now}
+            logging.info(f"Loaded {len(self._entries)} cached stream URLs from {self.path}")
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            logging.error(f"Error loading stream cache {self.path}: {str(e)}")
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            self._save_pending = False
+            snapshot = dict(self._entries)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Error saving stream cache {self.path}: {str(e)}")
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_pending:
+                return
+            self._save_pending = True
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.save)
+        except RuntimeError:
+            self.save()
+
+    def get(self, url):
+        """Trả về entry còn hạn cho ``url`` hoặc None."""
+        key = video_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["expires"] - self.margin > time.time():
+                self.hits += 1
+                return entry
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, url, audio_url, **metadata):
+        expires = parse_expiry(audio_url) or int(time.time() + DEFAULT_TTL)
+        entry = dict(metadata, url=audio_url, expires=expires, cached_at=int(time.time()))
+        with self._lock:
+            self._entries.pop(video_key(url), None)
+            self._entries[video_key(url)] = entry
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._schedule_save()
+        return entry
+
+    def invalidate(self, url, reason=""):
+        with self._lock:
+            removed = self._entries.pop(video_key(url), None)
+        if removed:
+            logging.info(f"Invalidated cached stream URL for {url}{f' ({reason})' if reason else ''}")
+            self._schedule_save()
+        return removed is not None
+
+stream_cache = StreamCache()
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+from config import CHAT_RETENTION_DAYS, CHAT_MAX_MESSAGES_PER_THREAD
+from database import CHAT_TABLES, PRUNE_BATCH_SIZE
+from async_database import delete_expired_messages, trim_thread_history, compact_db
+
+RETENTION_INTERVAL = 3600
+
+async def prune_chat_history(db_type, max_age_days, max_per_thread):
+    """Dọn lịch sử một kênh theo từng lô (nhường thread ghi cho tin nhắn mới giữa các lô)."""
+    deleted = 0
+    if max_age_days > 0:
+        while True:
+            count = await delete_expired_messages(db_type, max_age_days)
+            deleted += count
+            if count < PRUNE_BATCH_SIZE:
+                break
+    if max_per_thread > 0:
+        while True:
+            count = await trim_thread_history(db_type, max_per_thread)
+            deleted += count
+            if count == 0:
+                break
+    if deleted:
+        logging.info(f"Pruned {deleted} messages from {db_type} chat history")
+    return deleted
+
+async def chat_retention_task(interval=RETENTION_INTERVAL):
+    """Tác vụ nền áp dụng CHAT_RETENTION_DAYS / CHAT_MAX_MESSAGES_PER_THREAD mỗi giờ."""
+    if CHAT_RETENTION_DAYS <= 0 and CHAT_MAX_MESSAGES_PER_THREAD <= 0:
+        logging.info("Chat history retention disabled")
+        return
+    logging.info(f"Starting chat retention task: {CHAT_RETENTION_DAYS} days, {CHAT_MAX_MESSAGES_PER_THREAD} messages per thread")
+    while True:
+        deleted = 0
+        for db_type in CHAT_TABLES:
+            try:
+                deleted += await prune_chat_history(db_type, CHAT_RETENTION_DAYS, CHAT_MAX_MESSAGES_PER_THREAD)
+            except Exception as e:
+                logging.error(f"Error in chat retention for {db_type}: {str(e)}", exc_info=True)
+        if deleted:
+            await compact_db()
+        await asyncio.sleep(interval)
@@ -0,0 +1,95 @@
+import logging
+import re
+from database import ConnectionPool
+
+MAX_QUERY_TERMS = 32
+TERM_RE = re.compile(r"\w+")
+
+def fts_query(text):
+    """Chuyển câu hỏi thành truy vấn FTS5: mỗi từ được đặt trong ngoặc kép, nối bằng OR (BM25 tự xếp hạng)."""
+    terms = list(dict.fromkeys(term.lower() for term in TERM_RE.findall(text)))[:MAX_QUERY_TERMS]
+    return " OR ".join(f'"{term}"' for term in terms)
+
+class ChunkStore:
+    """Text các chunk RAG trong SQLite, ``rowid`` = ID vector FAISS.
+
+    Chỉ các chunk được truy vấn mới được đọc lên (``get``), nên bộ nhớ không tăng theo kích thước corpus.
+    Dùng ``ConnectionPool`` (WAL): thread nạp index ghi, thread truy vấn đọc song song.
+
+    Bảng FTS5 ``chunks_fts`` (external content, cập nhật bằng trigger) là inverted index cho BM25.
+    ``remove_diacritics 2`` để câu hỏi gõ không dấu ("lo au") vẫn khớp "lo âu".
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        with self.pool.transaction() as c:
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+            c.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'")
+            has_fts = c.fetchone() is not None
+            c.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    text, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                END
+            """)
+            if not has_fts:
+                # Kho chunk tạo trước khi có BM25: dựng inverted index từ dữ liệu sẵn có
+                c.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    def add(self, ids, source, texts):
+        with self.pool.transaction() as c:
+            # ID không bao giờ dùng lại nên INSERT thường (REPLACE sẽ không kích hoạt trigger xóa của FTS)
+            c.executemany("INSERT INTO chunks (id, source, text) VALUES (?, ?, ?)",
+                          ((int(doc_id), source, text) for doc_id, text in zip(ids, texts)))
+
+    def remove_ids(self, ids):
+        with self.pool.transaction() as c:
+            c.executemany("DELETE FROM chunks WHERE id = ?", ((int(doc_id),) for doc_id in ids))
+
+    def get(self, ids):
+        """Trả về dict {id: text} cho các ID có trong kho."""
+        ids = list({int(doc_id) for doc_id in ids})
+        if not ids:
+            return {}
+        with self.pool.reader() as c:
+            c.execute(f"SELECT id, text FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids)
+            return dict(c.fetchall())
+
+    def search(self, query, limit):
+        """BM25 trên ``chunks_fts``: trả về danh sách ID chunk, liên quan nhất trước."""
+        match = fts_query(query)
+        if not match:
+            return []
+        with self.pool.reader() as c:
+            c.execute("SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?", (match, limit))
+            return [row[0] for row in c.fetchall()]
+
+    def count(self):
+        with self.pool.reader() as c:
+            c.execute("SELECT COUNT(*) FROM chunks")
+            return c.fetchone()[0]
+
+    def clear(self):
+        with self.pool.transaction() as c:
+            c.execute("DELETE FROM chunks")
+        logging.info(f"Cleared RAG chunk store {self.db_path}")
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,229 @@
+import json
+import logging
+import re
+from PyPDF2 import PdfReader
+
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_CHUNK_OVERLAP = 40
+MAX_CARRY_CHARS = 2000  # phần câu dở dang ở cuối trang được nối sang trang sau, tối đa chừng này ký tự
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)")
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+def split_sentences(paragraph):
+    """Tách một đoạn thành các câu theo dấu kết thúc câu (. ! ? …) theo sau là khoảng trắng."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_RE.finditer(paragraph):
+        sentence = paragraph[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = paragraph[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+def _last_boundary(text):
+    """Vị trí ngay sau ranh giới câu/đoạn cuối cùng trong ``text`` (0 nếu không có)."""
+    boundary = 0
+    for match in SENTENCE_END_RE.finditer(text):
+        boundary = match.end()
+    for match in PARAGRAPH_RE.finditer(text, boundary):
+        boundary = match.end()
+    return boundary
+
+class TokenCounter:
+    """Đếm/cắt token bằng tokenizer của model embedding (``SentenceTransformer.tokenizer``).
+
+    Không có tokenizer (hoặc tokenizer không trả offset) thì ước lượng bằng từ và dấu câu.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def for_model(cls, model):
+        return cls(getattr(model, "tokenizer", None))
+
+    def spans(self, text):
+        """Danh sách (start, end) theo ký tự của từng token trong ``text``."""
+        if self.tokenizer is not None:
+            try:
+                encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+                return [tuple(span) for span in encoded["offset_mapping"]]
+            except Exception as e:
+                logging.warning(f"Tokenizer cannot return offsets, falling back to word counting: {str(e)}")
+                self.tokenizer = None
+        return [match.span() for match in WORD_RE.finditer(text)]
+
+    def count(self, text):
+        return len(self.spans(text))
+
+class Chunker:
+    """Chia văn bản thành chunk tối đa ``max_tokens`` token theo ranh giới câu/đoạn, chồng lấn ``overlap`` token.
+
+    Câu được gom lần lượt vào chunk; chunk được đóng khi câu kế tiếp làm vượt ``max_tokens`` hoặc khi gặp
+    đoạn mới mà chunk đã đầy quá nửa. Chunk sau bắt đầu bằng các câu cuối của chunk trước (tổng không quá
+    ``overlap`` token). Câu dài hơn ``max_tokens`` bị cắt theo token thành các cửa sổ chồng lấn.
+    """
+
+    def __init__(self, counter, max_tokens=DEFAULT_CHUNK_TOKENS, overlap=DEFAULT_CHUNK_OVERLAP):
+        self.counter = counter
+        self.max_tokens = max(16, int(max_tokens))
+        self.overlap = max(0, min(int(overlap), self.max_tokens // 2))
+
+    @property
+    def signature(self):
+        """Tham số ảnh hưởng tới nội dung chunk (lưu trong manifest để biết khi nào phải chunk lại)."""
+        return {"max_tokens": self.max_tokens, "overlap": self.overlap}
+
+    def chunk_text(self, text):
+        """Chunk một văn bản (một record JSON, một tài liệu ngắn)."""
+        return list(self._pack(self._sentences(text)))
+
+    def chunk_pages(self, pages):
+        """Chunk lần lượt từng trang (generator): không ghép cả tài liệu vào bộ nhớ.
+
+        Câu bị cắt ngang cuối trang được nối với đầu trang sau trước khi tách câu.
+        """
+        return self._pack(self._page_sentences(pages))
+
+    def _page_sentences(self, pages):
+        carry = ""
+        for page in pages:
+            text = f"{carry}\n{page or ''}" if carry else (page or "")
+            cut = _last_boundary(text)
+            if len(text) - cut > MAX_CARRY_CHARS:
+                cut = len(text)
+            yield from self._sentences(text[:cut], continued=bool(carry))
+            carry = text[cut:]
+        if carry.strip():
+            yield from self._sentences(carry, continued=True)
+
+    def _sentences(self, text, continued=False):
+        """Sinh (câu, số token, có phải đầu đoạn) theo thứ tự."""
+        for number, paragraph in enumerate(PARAGRAPH_RE.split(text)):
+            # Xuống dòng đơn trong PDF thường chỉ là ngắt dòng, không phải ngắt đoạn
+            paragraph = " ".join(paragraph.split())
+            new_paragraph = not (continued and number == 0)
+            for sentence in split_sentences(paragraph):
+                for piece, count in self._fit(sentence):
+                    yield piece, count, new_paragraph
+                    new_paragraph = False
+
+    def _fit(self, sentence):
+        spans = self.counter.spans(sentence)
+        if len(spans) <= self.max_tokens:
+            return [(sentence, len(spans))]
+        pieces = []
+        step = self.max_tokens - self.overlap
+        for start in range(0, len(spans), step):
+            window = spans[start:start + self.max_tokens]
+            pieces.append((sentence[window[0][0]:window[-1][1]], len(window)))
+            if start + self.max_tokens >= len(spans):
+                break
+        return pieces
+
+    def _tail(self, current):
+        """Các câu cuối của chunk vừa đóng dùng làm phần chồng lấn cho chunk sau."""
+        tail, size = [], 0
+        for item in reversed(current):
+            if size + item[1] > self.overlap:
+                break
+            tail.insert(0, item)
+            size += item[1]
+        return tail, size
+
+    def _pack(self, sentences):
+        current, size = [], 0
+        for sentence, count, new_paragraph in sentences:
+            if current and (size + count > self.max_tokens or (new_paragraph and size >= self.max_tokens // 2)):
+                yield _join(current)
+                current, size = self._tail(current)
+                if size + count > self.max_tokens:
+                    current, size = [], 0
+            current.append((sentence, count, new_paragraph))
+            size += count
+        if current:
+            yield _join(current)
+
+def _join(items):
+    text = items[0][0]
+    for sentence, _, new_paragraph in items[1:]:
+        text += ("\n" if new_paragraph else " ") + sentence
+    return text
+
+def iter_pdf_pages(filepath):
+    """Trích text từng trang PDF (generator); trang lỗi được bỏ qua."""
+    with open(filepath, "rb") as f:
+        pdf = PdfReader(f)
+        for number, page in enumerate(pdf.pages, 1):
+            try:
+                yield page.extract_text() or ""
+            except Exception as e:
+                logging.warning(f"Error extracting page {number} of {filepath}: {str(e)}")
+
+def pdf_page_count(filepath):
+    with open(filepath, "rb") as f:
+        return len(PdfReader(f).pages)
+
+def extract_pdf_pages(task):
+    """Trích text các trang ``[start, stop)`` của một PDF; dùng làm tác vụ cho process pool.
+
+    Trả về ``(pages, error)``: lỗi mở file được trả về dạng chuỗi thay vì ném ra để thứ tự kết quả không lệch.
+    """
+    filepath, start, stop = task
+    pages = []
+    try:
+        with open(filepath, "rb") as f:
+            pdf = PdfReader(f)
+            for number in range(start, min(stop, len(pdf.pages))):
+                try:
+                    pages.append(pdf.pages[number].extract_text() or "")
+                except Exception as e:
+                    logging.warning(f"Error extracting page {number + 1} of {filepath}: {str(e)}")
+                    pages.append("")
+    except Exception as e:
+        return pages, str(e)
+    return pages, None
+
+def record_text(record):
+    """Chuyển một record JSON thành văn bản: mỗi trường của dict là một đoạn ``key: value``."""
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict):
+        return "\n\n".join(
+            f"{key}: {value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)}"
+            for key, value in record.items()
+        )
+    return json.dumps(record, ensure_ascii=False)
+
+def iter_json_records(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        yield from data
+    else:
+        yield data
+
+def iter_jsonl_records(filepath):
+    """Đọc từng dòng JSONL (generator); dòng không hợp lệ được ghi log và bỏ qua."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"Skipping invalid JSON on line {number} of {filepath}: {str(e)}")
+
+def iter_file_chunks(filepath, chunker):
+    """Chunk một file tài liệu (.pdf/.json/.jsonl) theo kiểu generator."""
+    if filepath.endswith(".pdf"):
+        yield from chunker.chunk_pages(iter_pdf_pages(filepath))
+        return
+    records = iter_jsonl_records(filepath) if filepath.endswith(".jsonl") else iter_json_records(filepath)
+    for record in records:
+        yield from chunker.chunk_text(record_text(record))
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import math
+from collections import OrderedDict
+
+from async_database import get_thread_summary, save_thread_summary, get_messages_to_summarize
+from src.utils.chunking import TokenCounter
+from src.utils.llm_providers import ProviderError
+
+HISTORY_TOKEN_BUDGET = 2000
+MESSAGE_OVERHEAD = 4  # token cho role/định dạng của mỗi message
+# Token trên mỗi từ/dấu câu, ước lượng dè dặt cho tiếng Việt (tokenizer của các API không có sẵn offline)
+PROVIDER_TOKEN_RATIOS = {"groq": 1.6, "xai": 1.5, "gemini": 1.3, "gpt": 1.4}
+DEFAULT_TOKEN_RATIO = 1.6
+SUMMARY_MIN_MESSAGES = 4  # chỉ gọi LLM khi có ít nhất chừng này tin mới rơi khỏi cửa sổ
+SUMMARY_INPUT_TOKENS = 3000  # giới hạn đoạn hội thoại đưa vào mỗi lần tóm tắt
+SUMMARY_CACHE_SIZE = 512
+SUMMARY_PROMPT = ("Summarize the earlier part of this conversation for the assistant's memory. Merge the previous summary "
+                  "(if any) with the new messages. Keep facts, user preferences, decisions and open questions; drop small "
+                  "talk. Write in the conversation's language, at most 200 words.")
+
+class ThreadSummarizer:
+    """Tóm tắt cuốn chiếu phần hội thoại cũ, lưu trong bảng ``thread_summaries``.
+
+    Tóm tắt được tính ở tác vụ nền (không làm chậm câu trả lời hiện tại) bằng ``router``: gộp tóm tắt cũ với
+    các tin đã rơi khỏi cửa sổ token kể từ lần trước (``through_id``). Tóm tắt đọc được giữ trong LRU để dựng
+    prompt không phải đọc đĩa.
+    """
+
+    def __init__(self, router, min_messages=SUMMARY_MIN_MESSAGES, input_tokens=SUMMARY_INPUT_TOKENS,
+                 max_entries=SUMMARY_CACHE_SIZE):
+        self.router = router
+        self.min_messages = min_messages
+        self.input_tokens = input_tokens
+        self.max_entries = max_entries
+        self.counter = TokenCounter()
+        self.runs = 0
+        self.failures = 0
+        self._entries = OrderedDict()  # (db_type, thread_id, user_id) -> (summary, through_id) | None
+        self._tasks = {}
+
+    @staticmethod
+    def _key(db_type, thread_id, user_id):
+        return (db_type, str(thread_id), str(user_id) if user_id else None)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        row = await get_thread_summary(*key)
+        value = (row[0], row[1]) if row else None
+        self._remember(key, value)
+        return value
+
+    async def get(self, db_type, thread_id, user_id=None):
+        """Tóm tắt hiện có của thread, hoặc None."""
+        value = await self._load(self._key(db_type, thread_id, user_id))
+        return value[0] if value else None
+
+    def schedule(self, db_type, thread_id, user_id, keep_recent):
+        """Cập nhật tóm tắt ở nền cho các tin cũ hơn ``keep_recent`` tin gần nhất (bỏ qua nếu đang chạy)."""
+        key = self._key(db_type, thread_id, user_id)
+        if key in self._tasks:
+            return
+        task = asyncio.create_task(self._refresh(key, keep_recent))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _refresh(self, key, keep_recent):
+        try:
+            current = await self._load(key)
+            summary, through_id = current if current else (None, 0)
+            rows = await get_messages_to_summarize(*key, after_id=through_id, keep_recent=keep_recent)
+            if len(rows) < self.min_messages:
+                return
+            # Luồng dài chưa tóm tắt bao giờ: gộp dần từ cũ đến mới, mỗi lần không quá input_tokens
+            batch, used = [], 0
+            for row in rows:
+                used += self.counter.count(row[2] or "") + MESSAGE_OVERHEAD
+                if batch and used > self.input_tokens:
+                    break
+                batch.append(row)
+            transcript = "\n".join(f"{role}: {content}" for _, role, content in batch)
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ]
+            new_summary = await self.router.complete(messages, retries=1, label=f"summary of thread {key[1]}")
+            await save_thread_summary(*key, new_summary, batch[-1][0])
+            self._remember(key, (new_summary, batch[-1][0]))
+            self.runs += 1
+            logging.info(f"Summarized {len(batch)} messages of thread {key[1]} ({key[0]})")
+        except ProviderError as e:
+            self.failures += 1
+            logging.error(f"Failed to summarize thread {key[1]} ({key[0]}): {str(e)}")
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Unexpected error summarizing thread {key[1]} ({key[0]}): {str(e)}", exc_info=True)
+
+    def stats(self):
+        return {"summaries": len(self._entries), "runs": self.runs, "failures": self.failures, "running": len(self._tasks)}
+
+class ContextWindow:
+    """Chọn các tin gần nhất vừa ``budget`` token (đếm theo ``provider``), kèm tóm tắt phần cũ hơn nếu có."""
+
+    def __init__(self, provider, budget=HISTORY_TOKEN_BUDGET, summarizer=None):
+        self.provider = provider
+        self.budget = budget
+        self.summarizer = summarizer
+        self.ratio = PROVIDER_TOKEN_RATIOS.get(provider, DEFAULT_TOKEN_RATIO)
+        self.counter = TokenCounter()
+
+    def count(self, message):
+        return math.ceil(self.counter.count(message["content"] or "") * self.ratio) + MESSAGE_OVERHEAD
+
+    def pack(self, history, budget):
+        """Trả về (các tin gần nhất vừa ``budget`` theo thứ tự thời gian, số tin bị bỏ)."""
+        window, used = [], 0
+        for message in reversed(history):
+            used += self.count(message)
+            if used > budget:
+                break
+            window.append(message)
+        window.reverse()
+        return window, len(history) - len(window)
+
+    async def build(self, db_type, thread_id, history, user_id=None, complete=True):
+        """Danh sách message cho prompt: [tóm tắt] + các tin gần nhất trong ngân sách.
+
+        ``complete=False`` khi ``history`` có thể chưa phải toàn bộ thread (đã chạm giới hạn đọc): phần cũ hơn
+        trên đĩa vẫn cần được tóm tắt dù mọi tin trong ``history`` đều vừa ngân sách.
+        """
+        summary = await self.summarizer.get(db_type, thread_id, user_id) if self.summarizer else None
+        prefix = [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] if summary else []
+        budget = self.budget - sum(self.count(message) for message in prefix)
+        window, dropped = self.pack(history, budget)
+        if self.summarizer and (dropped or not complete):
+            self.summarizer.schedule(db_type, thread_id, user_id, keep_recent=len(window))
+        if dropped:
+            logging.debug(f"[{self.provider}] Thread {thread_id}: kept {len(window)} of {len(history)} messages within {self.budget} tokens")
+        return prefix + window
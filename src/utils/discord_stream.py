@@ -0,0 +1,81 @@
+import logging
+import time
+
+import discord
+
+MESSAGE_LIMIT = 1900
+EDIT_INTERVAL = 1.2  # Discord cho phép khoảng 5 lần sửa tin nhắn / 5 giây mỗi kênh
+
+class DiscordStreamWriter:
+    """Đẩy phản hồi LLM vào Discord theo từng token.
+
+    Tin nhắn đầu tiên được gửi ngay khi có token đầu tiên, sau đó được sửa (edit) tối đa mỗi
+    ``edit_interval`` giây; khi vượt ``limit`` ký tự thì phần dư chuyển sang tin nhắn mới.
+    """
+
+    def __init__(self, channel, prefix="", limit=MESSAGE_LIMIT, edit_interval=EDIT_INTERVAL):
+        self.channel = channel
+        self.prefix = prefix
+        self.limit = limit
+        self.edit_interval = edit_interval
+        self.text = ""
+        self._messages = []
+        self._rendered = []
+        self._last_edit = 0.0
+
+    @property
+    def started(self):
+        return bool(self.text)
+
+    def _pages(self):
+        text = self.prefix + self.text
+        return [text[i:i + self.limit] for i in range(0, len(text), self.limit)] or [""]
+
+    async def _sync(self):
+        pages = self._pages()
+        for index, page in enumerate(pages):
+            if index < len(self._messages):
+                if self._rendered[index] != page:
+                    await self._messages[index].edit(content=page)
+                    self._rendered[index] = page
+            elif page:
+                self._messages.append(await self.channel.send(page))
+                self._rendered.append(page)
+        self._last_edit = time.monotonic()
+
+    async def write(self, text):
+        if not text:
+            return
+        first = not self.text
+        self.text += text
+        if first or time.monotonic() - self._last_edit >= self.edit_interval:
+            try:
+                await self._sync()
+            except discord.errors.HTTPException as e:
+                logging.warning(f"Failed to update streamed message in channel {self.channel.id}: {str(e)}")
+
+    async def reset(self):
+        """Xóa phần đã stream (dùng khi provider thử lại từ đầu)."""
+        if not self.text:
+            return
+        for message in self._messages:
+            try:
+                await message.delete()
+            except discord.errors.HTTPException as e:
+                logging.warning(f"Failed to delete streamed message in channel {self.channel.id}: {str(e)}")
+        self.text = ""
+        self._messages = []
+        self._rendered = []
+
+    async def finish(self, final_text=None):
+        """Gửi nốt phần còn lại; nếu ``final_text`` khác nội dung đã stream (lỗi, phản hồi không stream) thì gửi thêm."""
+        if self.text:
+            await self._sync()
+        sent = len(self._messages)
+        if final_text and final_text != self.text:
+            prefix = self.prefix if not self.text else ""
+            text = prefix + final_text
+            for i in range(0, len(text), self.limit):
+                await self.channel.send(text[i:i + self.limit])
+                sent += 1
+        return sent
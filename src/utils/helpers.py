@@ -4,13 +4,48 @@ from aiohttp import FormData
 import json
 import logging
 import asyncio
-from config import GROQ_API_KEY, XAI_API_KEY, OPENAI_API_KEY, GEMINI_API_KEY
-from database import get_history, add_message, add_gpt_batch_job, update_gpt_batch_job, get_gpt_batch_job, get_pending_gpt_batch_jobs
-from src.utils.rag import RAG
+from config import (GROQ_API_KEY, XAI_API_KEY, OPENAI_API_KEY, GEMINI_API_KEY, RAG_INDEX_TYPE, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP,
+    RAG_HYBRID, RAG_RERANK_MODEL, RAG_RERANK_BUDGET_MS,
+    RAG_ANSWER_CACHE, RAG_ANSWER_CACHE_THRESHOLD, RAG_ANSWER_CACHE_TTL, RAG_ANSWER_CACHE_SIZE,
+    HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY)
+from async_database import history_cache, get_history, add_message, add_gpt_batch_job, update_gpt_batch_job, get_pending_gpt_batch_jobs
+from src.utils.lazy_rag import LazyRAG
+from src.utils.query_cache import SemanticCache, context_key
+from src.utils.http import shared_session, LLM_TIMEOUT
+from src.utils.llm_providers import ProviderError, OpenAICompatibleProvider, GeminiProvider
+from src.utils.llm_router import LLMRouter
+from src.utils.context_window import ContextWindow, ThreadSummarizer
 import uuid
 from datetime import datetime
 
-mental_rag = RAG(embed_model="all-MiniLM-L6-v2", index_path="./data/rag_index/mental", doc_dir="./data/documents/mental_counseling")
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+XAI_URL = "https://api.x.ai/v1/chat/completions"
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+# llama3-70b là model chính: chỉ nhường cho bản 8b khi chậm hơn quá 2 lần (hoặc bị ngắt / phải hedge)
+groq_router = LLMRouter("groq", [
+    OpenAICompatibleProvider("groq/llama3-70b-8192", "llama3-70b-8192", GROQ_URL, GROQ_API_KEY),
+    OpenAICompatibleProvider("groq/llama-3.1-8b-instant", "llama-3.1-8b-instant", GROQ_URL, GROQ_API_KEY),
+], weights={"groq/llama3-70b-8192": 2.0})
+xai_router = LLMRouter("xai", [OpenAICompatibleProvider("xai/grok-4", "grok-4", XAI_URL, XAI_API_KEY)])
+gemini_router = LLMRouter("gemini", [GeminiProvider("gemini/gemini-2.5-pro", "gemini-2.5-pro", GEMINI_URL, GEMINI_API_KEY)])
+
+# Nạp nền sau khi bot đăng nhập (main.setup_tasks), không chặn lúc import
+mental_rag = LazyRAG(embed_model="all-MiniLM-L6-v2", index_path="./data/rag_index/mental", doc_dir="./data/documents/mental_counseling", index_type=RAG_INDEX_TYPE,
+                     chunk_tokens=RAG_CHUNK_TOKENS, chunk_overlap=RAG_CHUNK_OVERLAP,
+                     hybrid=RAG_HYBRID, rerank_model=RAG_RERANK_MODEL, rerank_budget_ms=RAG_RERANK_BUDGET_MS)
+# Cache câu trả lời theo ngữ nghĩa cho kênh mental (bật bằng RAG_ANSWER_CACHE)
+mental_answer_cache = SemanticCache(RAG_ANSWER_CACHE_THRESHOLD, RAG_ANSWER_CACHE_TTL, RAG_ANSWER_CACHE_SIZE) if RAG_ANSWER_CACHE else None
+
+# Lịch sử gửi cho model: các lượt gần nhất trong HISTORY_TOKEN_BUDGET token, phần cũ hơn được tóm tắt ở nền bằng
+# chính provider của kênh (hội thoại không bị gửi sang provider khác). Kênh GPT đi qua batch API nên không tóm tắt.
+HISTORY_FETCH = history_cache.capacity
+thread_summarizers = {name: ThreadSummarizer(router) for name, router in
+                      (("groq", groq_router), ("xai", xai_router), ("gemini", gemini_router))} if HISTORY_SUMMARY else {}
+groq_context = ContextWindow("groq", HISTORY_TOKEN_BUDGET, thread_summarizers.get("groq"))
+xai_context = ContextWindow("xai", HISTORY_TOKEN_BUDGET, thread_summarizers.get("xai"))
+gemini_context = ContextWindow("gemini", HISTORY_TOKEN_BUDGET, thread_summarizers.get("gemini"))
+gpt_context = ContextWindow("gpt", HISTORY_TOKEN_BUDGET)
 
 async def safe_voice_connect(ctx, timeout=10, retries=3):
     if ctx.author.voice is None:
@@ -50,318 +85,83 @@ async def safe_voice_connect(ctx, timeout=10, retries=3):
                 await ctx.send(f"❌ Không thể kết nối đến kênh voice: {str(e)}")
     return None
 
-async def get_groq_response(thread_id, message, rag_instance=None, db_type='mental', retries=2):
+async def get_groq_response(thread_id, message, rag_instance=None, db_type='mental', retries=2, stream=None, answer_cache=None):
     logging.info(f"Starting get_groq_response for thread {thread_id}, db_type: {db_type}, message: {message[:50]}...")
     try:
-        history = get_history(thread_id, limit=20, db_type=db_type)
+        history = await get_history(thread_id, limit=HISTORY_FETCH, db_type=db_type)
         logging.info(f"Retrieved {len(history)} messages from history for thread {thread_id}")
         context = message
+        cache_key = None
         if rag_instance:
             try:
-                retrieved_docs = rag_instance.retrieve(message, top_k=3)
+                retrieved_docs, query_vector = await rag_instance.aretrieve(message, top_k=3)
                 context = "\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(retrieved_docs)])
                 if context:
                     context = f"Retrieved Context:\n{context}\n\nUser Query: {message}"
                 logging.info(f"RAG retrieved {len(retrieved_docs)} documents for thread {thread_id}")
+                # Chỉ dùng cache cho câu hỏi mở đầu thread: các câu trả lời sau phụ thuộc lịch sử hội thoại
+                if answer_cache is not None and query_vector is not None and not any(msg["role"] == "assistant" for msg in history):
+                    cache_key = context_key(retrieved_docs)
+                    cached = answer_cache.lookup(query_vector, cache_key)
+                    if cached is not None:
+                        await add_message(thread_id, None, "assistant", cached, db_type)
+                        logging.info(f"Answered thread {thread_id} from semantic cache")
+                        return cached
             except Exception as e:
                 logging.error(f"RAG retrieval error for thread {thread_id}: {str(e)}")
         full_history = [
             {"role": "system", "content": "You are a helpful assistant. For the mental health channel, provide empathetic and professional counseling advice. For the general channel, offer accurate and informative responses. Use the provided context and maintain coherence with previous messages."},
             {"role": "user", "content": context}
-        ] + history[-5:]
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {GROQ_API_KEY}"
-        }
-        models = ["llama3-70b-8192", "llama-3.1-8b-instant"]
-        timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            for attempt in range(retries):
-                for model in models:
-                    data = {
-                        "model": model,
-                        "messages": full_history,
-                        "max_tokens": 8192,
-                        "stream": True,
-                        "temperature": 0.7
-                    }
-                    logging.info(f"Calling Groq API with model {model}, attempt {attempt+1} for thread {thread_id}")
-                    try:
-                        async with session.post(url, headers=headers, json=data) as response:
-                            response.raise_for_status()
-                            api_response = ""
-                            async for line in response.content:
-                                line = line.decode('utf-8').strip()
-                                if line.startswith("data: "):
-                                    chunk = line[6:]
-                                    if chunk == "[DONE]":
-                                        break
-                                    try:
-                                        chunk_data = json.loads(chunk)
-                                        if "choices" in chunk_data and chunk_data["choices"]:
-                                            delta = chunk_data["choices"][0].get("delta", {})
-                                            content = delta.get("content", "")
-                                            if content:
-                                                api_response += content
-                                    except json.JSONDecodeError as e:
-                                        logging.error(f"Chunk decode error for thread {thread_id}: {str(e)}, chunk: {chunk}")
-                            if api_response:
-                                add_message(thread_id, None, "assistant", api_response, db_type)
-                                logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
-                                return api_response
-                            else:
-                                logging.error(f"No content in streaming response for thread {thread_id}")
-                                if attempt < retries - 1:
-                                    await asyncio.sleep(2)
-                                    continue
-                                return f"Error: No content received from Groq API (thread {thread_id})"
-                    except aiohttp.ClientResponseError as e:
-                        logging.error(f"Groq API error for thread {thread_id} (model: {model}, attempt: {attempt+1}): {str(e)}, status: {e.status}, message: {e.message}")
-                        if e.status == 429:
-                            if attempt < retries - 1:
-                                await asyncio.sleep(5 * (2 ** attempt))
-                                continue
-                        if attempt < retries - 1 and model == models[0]:
-                            logging.info(f"Retrying with fallback model: {models[1]} for thread {thread_id}")
-                            continue
-                        return f"Error calling Groq API for thread {thread_id}: {str(e)}"
-                    except aiohttp.ClientConnectionError as e:
-                        logging.error(f"Connection error in Groq API call for thread {thread_id}: {str(e)}")
-                        if attempt < retries - 1:
-                            await asyncio.sleep(5 * (2 ** attempt))
-                            continue
-                        return f"Error: Connection issue in Groq API call for thread {thread_id}: {str(e)}"
-                    except asyncio.TimeoutError as e:
-                        logging.error(f"Timeout error in Groq API call for thread {thread_id}: {str(e)}")
-                        if attempt < retries - 1:
-                            await asyncio.sleep(5 * (2 ** attempt))
-                            continue
-                        return f"Error: Timeout in Groq API call for thread {thread_id}: {str(e)}"
-                    except Exception as e:
-                        logging.error(f"Unexpected error in Groq API call for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
-                        return f"Error: Unexpected issue in Grok API call for thread {thread_id}: {str(e)}"
-        logging.error(f"Failed to get Groq API response for thread {thread_id} after {retries} attempts")
-        return f"Error: Failed to get response from Groq API after retries (thread {thread_id})"
+        ] + await groq_context.build(db_type, thread_id, history, complete=len(history) < HISTORY_FETCH)
+        try:
+            api_response = await groq_router.complete(full_history, stream=stream, retries=retries, label=f"thread {thread_id}")
+        except ProviderError as e:
+            logging.error(f"Failed to get Groq API response for thread {thread_id}: {str(e)}")
+            return f"Error calling Groq API for thread {thread_id}: {str(e)}"
+        if cache_key is not None:
+            answer_cache.store(query_vector, cache_key, api_response)
+        await add_message(thread_id, None, "assistant", api_response, db_type)
+        logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
+        return api_response
     except Exception as e:
         logging.error(f"Unexpected error in get_groq_response for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
         return f"Error: Unexpected issue processing request for thread {thread_id}: {str(e)}"
 
-async def get_xai_response(thread_id, message, user_id, mode=None, retries=2):
+async def get_xai_response(thread_id, message, user_id, mode=None, retries=2, stream=None):
     logging.info(f"Starting get_xai_response for thread {thread_id}, user: {user_id}, mode: {mode}, message: {message[:50]}...")
     try:
-        history = get_history(thread_id, limit=20, db_type='grok4', user_id=user_id)
+        history = await get_history(thread_id, limit=HISTORY_FETCH, db_type='grok4', user_id=user_id)
         logging.info(f"Retrieved {len(history)} messages from history for thread {thread_id}, user {user_id}")
         full_history = [
             {"role": "system", "content": "You are Grok 4, created by xAI. Provide accurate, detailed, and helpful responses. For DeepSearch, include real-time web and X data with citations. For DeeperSearch, focus on deep reasoning with minimal sources. For Think Mode, provide step-by-step reasoning. Maintain coherence with previous messages."}
-        ] + history[-5:] + [{"role": "user", "content": message}]
-        url = "https://api.x.ai/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {XAI_API_KEY}"
-        }
-        data = {
-            "model": "grok-4",
-            "messages": full_history,
-            "max_tokens": 8192,
-            "stream": True,
-            "temperature": 0.7
-        }
-        if mode in ['deepsearch', 'deepersearch', 'think']:
-            data["mode"] = mode
-        timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            for attempt in range(retries):
-                logging.info(f"Calling xAI API with model grok-4, attempt {attempt+1}, mode: {mode} for thread {thread_id}")
-                try:
-                    async with session.post(url, headers=headers, json=data) as response:
-                        response.raise_for_status()
-                        api_response = ""
-                        async for line in response.content:
-                            line = line.decode('utf-8').strip()
-                            if line.startswith("data: "):
-                                chunk = line[6:]
-                                if chunk == "[DONE]":
-                                    break
-                                try:
-                                    chunk_data = json.loads(chunk)
-                                    if "choices" in chunk_data and chunk_data["choices"]:
-                                        delta = chunk_data["choices"][0].get("delta", {})
-                                        content = delta.get("content", "")
-                                        if content:
-                                            api_response += content
-                                except json.JSONDecodeError as e:
-                                    logging.error(f"Chunk decode error for thread {thread_id}: {str(e)}, chunk: {chunk}")
-                            if api_response:
-                                add_message(thread_id, None, "assistant", api_response, db_type='grok4', mode=mode, user_id=user_id)
-                                logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
-                                return api_response
-                            else:
-                                logging.error(f"No content in streaming response for thread {thread_id}")
-                                if attempt < retries - 1:
-                                    await asyncio.sleep(2)
-                                    continue
-                                return f"Error: No content received from xAI API (thread {thread_id})"
-                except aiohttp.ClientResponseError as e:
-                    logging.error(f"xAI API error for thread {thread_id} (attempt: {attempt+1}): {str(e)}, status: {e.status}, message: {e.message}")
-                    if e.status == 429:
-                        if attempt < retries - 1:
-                            await asyncio.sleep(5 * (2 ** attempt))
-                            continue
-                    return f"Error calling xAI API for thread {thread_id}: {str(e)}"
-                except aiohttp.ClientConnectionError as e:
-                    logging.error(f"Connection error in xAI API call for thread {thread_id}: {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(5 * (2 ** attempt))
-                        continue
-                    return f"Error: Connection issue in xAI API call for thread {thread_id}: {str(e)}"
-                except asyncio.TimeoutError as e:
-                    logging.error(f"Timeout error in xAI API call for thread {thread_id}: {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(5 * (2 ** attempt))
-                        continue
-                    return f"Error: Timeout in xAI API call for thread {thread_id}: {str(e)}"
-                except Exception as e:
-                    logging.error(f"Unexpected error in xAI API call for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
-                    return f"Error: Unexpected issue in xAI API call for thread {thread_id}: {str(e)}"
-        logging.error(f"Failed to get xAI API response for thread {thread_id} after {retries} attempts")
-        return f"Error: Failed to get response from xAI API after retries (thread {thread_id})"
+        ] + await xai_context.build('grok4', thread_id, history, user_id=user_id, complete=len(history) < HISTORY_FETCH) + [{"role": "user", "content": message}]
+        extra = {"mode": mode} if mode in ['deepsearch', 'deepersearch', 'think'] else None
+        try:
+            api_response = await xai_router.complete(full_history, stream=stream, extra=extra, retries=retries, label=f"thread {thread_id}")
+        except ProviderError as e:
+            logging.error(f"Failed to get xAI API response for thread {thread_id}: {str(e)}")
+            return f"Error calling xAI API for thread {thread_id}: {str(e)}"
+        await add_message(thread_id, None, "assistant", api_response, db_type='grok4', mode=mode, user_id=user_id)
+        logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
+        return api_response
     except Exception as e:
         logging.error(f"Unexpected error in get_xai_response for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
         return f"Error: Unexpected issue processing request for thread {thread_id}: {str(e)}"
 
-async def get_gemini_response(thread_id, message, db_type='gemini', retries=2):
+async def get_gemini_response(thread_id, message, db_type='gemini', retries=2, stream=None):
     logging.info(f"Starting get_gemini_response for thread {thread_id}, db_type: {db_type}, message: {message[:50]}...")
     try:
-        history = get_history(thread_id, limit=20, db_type=db_type)
+        history = await get_history(thread_id, limit=HISTORY_FETCH, db_type=db_type)
         logging.info(f"Retrieved {len(history)} messages from history for thread {thread_id}")
-        gemini_history = []
-        for msg in history[-5:]:
-            role = "user" if msg["role"] == "user" else "model"
-            gemini_history.append({"role": role, "parts": [{"text": msg["content"]}]})
-        gemini_history.append({"role": "user", "parts": [{"text": message}]})
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:streamGenerateContent?key={GEMINI_API_KEY}"
-        headers = {
-            "Content-Type": "application/json",
-        }
-        data = {
-            "contents": gemini_history,
-            "generationConfig": {
-                "maxOutputTokens": 8192,
-                "temperature": 0.7,
-            }
-        }
-        timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            for attempt in range(retries):
-                logging.info(f"Calling Gemini API, attempt {attempt+1} for thread {thread_id}")
-                try:
-                    async with session.post(url, headers=headers, json=data) as response:
-                        response.raise_for_status()
-                        api_response = ""
-                        buffer = ""
-                        async for line_bytes in response.content:
-                            line = line_bytes.decode('utf-8').strip()
-                            if not line:
-                                continue
-                            try:
-                                chunk_data_list = json.loads(line)
-                                for chunk_data in chunk_data_list:
-                                    if "candidates" in chunk_data and chunk_data["candidates"]:
-                                        candidate = chunk_data["candidates"][0]
-                                        if "content" in candidate and "parts" in candidate["content"]:
-                                            for part in candidate["content"]["parts"]:
-                                                if "text" in part:
-                                                    api_response += part["text"]
-                                                else:
-                                                    logging.warning(f"Gemini chunk part has no 'text' field for thread {thread_id}: {part}")
-                                        else:
-                                            logging.warning(f"Gemini chunk candidate missing 'content' or 'parts' for thread {thread_id}: {candidate}")
-                                    else:
-                                        logging.warning(f"Gemini chunk missing 'candidates' or candidates empty for thread {thread_id}: {chunk_data}")
-                                buffer = ""
-                                logging.debug(f"Successfully parsed standalone line for thread {thread_id}.")
-                            except json.JSONDecodeError:
-                                buffer += line
-                                try:
-                                    chunk_data_list = json.loads(buffer)
-                                    for chunk_data in chunk_data_list:
-                                        if "candidates" in chunk_data and chunk_data["candidates"]:
-                                            candidate = chunk_data["candidates"][0]
-                                            if "content" in candidate and "parts" in candidate["content"]:
-                                                for part in candidate["content"]["parts"]:
-                                                    if "text" in part:
-                                                        api_response += part["text"]
-                                                    else:
-                                                        logging.warning(f"Gemini chunk part has no 'text' field for thread {thread_id}: {part}")
-                                            else:
-                                                logging.warning(f"Gemini chunk candidate missing 'content' or 'parts' for thread {thread_id}: {candidate}")
-                                        else:
-                                            logging.warning(f"Gemini chunk missing 'candidates' or candidates empty for thread {thread_id}: {chunk_data}")
-                                    buffer = ""
-                                    logging.debug(f"Successfully parsed accumulated buffer for thread {thread_id}.")
-                                except json.JSONDecodeError as e:
-                                    if "Extra data" not in str(e) and "Expecting value" not in str(e) and "Expecting property name" not in str(e) and "Expecting ',' delimiter" not in str(e):
-                                        logging.warning(f"Buffer is not complete JSON yet or malformed for thread {thread_id}: '{buffer[:50]}...'. Error: {e}")
-                                    logging.debug(f"Still accumulating buffer for thread {thread_id}: '{buffer[:50]}...'")
-                                    pass
-                                except Exception as e:
-                                    logging.error(f"Error processing accumulated Gemini chunk for thread {thread_id}: {str(e)}, raw buffer: '{buffer[:100]}...'")
-                                    buffer = ""
-                        if buffer:
-                            try:
-                                chunk_data_list = json.loads(buffer)
-                                for chunk_data in chunk_data_list:
-                                    if "candidates" in chunk_data and chunk_data["candidates"]:
-                                        candidate = chunk_data["candidates"][0]
-                                        if "content" in candidate and "parts" in candidate["content"]:
-                                            for part in candidate["content"]["parts"]:
-                                                if "text" in part:
-                                                    api_response += part["text"]
-                            except json.JSONDecodeError as e:
-                                logging.warning(f"Remaining buffer is not complete JSON at end of stream for thread {thread_id}: '{buffer[:50]}...'. Error: {e}")
-                            except Exception as e:
-                                logging.error(f"Error processing remaining Gemini buffer for thread {thread_id}: {str(e)}, raw buffer: '{buffer[:100]}...'")
-                        if api_response:
-                            add_message(thread_id, None, "assistant", api_response, db_type)
-                            logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
-                            return api_response
-                        else:
-                            final_raw_response_text = ""
-                            try:
-                                if not response.content.at_eof():
-                                    final_raw_response_text = await response.text()
-                            except Exception as e:
-                                logging.warning(f"Could not get full response text for thread {thread_id}: {e}")
-                            logging.error(f"No content in streaming response from Gemini for thread {thread_id}. Final raw response (if any): {final_raw_response_text}")
-                            if attempt < retries - 1:
-                                await asyncio.sleep(2)
-                                continue
-                            return f"Error: No content received from Gemini API (thread {thread_id})"
-                except aiohttp.ClientResponseError as e:
-                    logging.error(f"Gemini API error for thread {thread_id} (attempt: {attempt+1}): {str(e)}, status: {e.status}, message: {e.message}")
-                    if e.status == 429:
-                        if attempt < retries - 1:
-                            await asyncio.sleep(5 * (2 ** attempt))
-                            continue
-                    return f"Error calling Gemini API for thread {thread_id}: {str(e)}"
-                except aiohttp.ClientConnectionError as e:
-                    logging.error(f"Connection error in Gemini API call for thread {thread_id}: {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(5 * (2 ** attempt))
-                        continue
-                    return f"Error: Connection issue in Gemini API call for thread {thread_id}: {str(e)}"
-                except asyncio.TimeoutError as e:
-                    logging.error(f"Timeout error in Gemini API call for thread {thread_id}: {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(5 * (2 ** attempt))
-                        continue
-                    return f"Error: Timeout in Gemini API call for thread {thread_id}: {str(e)}"
-                except Exception as e:
-                    logging.error(f"Unexpected error in Gemini API call for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
-                    return f"Error: Unexpected issue in Gemini API call for thread {thread_id}: {str(e)}"
-        logging.error(f"Failed to get Gemini API response for thread {thread_id} after {retries} attempts")
-        return f"Error: Failed to get response from Gemini API after retries (thread {thread_id})"
+        full_history = await gemini_context.build(db_type, thread_id, history, complete=len(history) < HISTORY_FETCH) + [{"role": "user", "content": message}]
+        try:
+            api_response = await gemini_router.complete(full_history, stream=stream, retries=retries, label=f"thread {thread_id}")
+        except ProviderError as e:
+            logging.error(f"Failed to get Gemini API response for thread {thread_id}: {str(e)}")
+            return f"Error calling Gemini API for thread {thread_id}: {str(e)}"
+        await add_message(thread_id, None, "assistant", api_response, db_type)
+        logging.info(f"Generated response for thread {thread_id}: {api_response[:100]}...")
+        return api_response
     except Exception as e:
         logging.error(f"Unexpected error in get_gemini_response for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
         return f"Error: Unexpected issue processing request for thread {thread_id}: {str(e)}"
@@ -369,11 +169,11 @@ async def get_gemini_response(thread_id, message, db_type='gemini', retries=2):
 async def get_gpt_response(thread_id, message, user_id, db_type='gpt', retries=2, file_content=None):
     logging.info(f"Starting get_gpt_response for thread {thread_id}, user: {user_id}, db_type: {db_type}, message: {message[:50]}...")
     try:
-        history = get_history(thread_id, limit=20, db_type=db_type, user_id=user_id)
+        history = await get_history(thread_id, limit=HISTORY_FETCH, db_type=db_type, user_id=user_id)
         logging.info(f"Retrieved {len(history)} messages from history for thread {thread_id}, user {user_id}")
         full_history = [
             {"role": "system", "content": "You are a helpful assistant powered by GPT-4.1, created by OpenAI. Provide accurate, detailed, and coherent responses based on the provided context and maintain conversation history."}
-        ] + history[-5:] + [{"role": "user", "content": message + (f"\n\nFile content: {file_content}" if file_content else "")}]
+        ] + await gpt_context.build(db_type, thread_id, history, user_id=user_id, complete=len(history) < HISTORY_FETCH) + [{"role": "user", "content": message + (f"\n\nFile content: {file_content}" if file_content else "")}]
         
         # Generate a unique batch ID
         batch_id = str(uuid.uuid4())
@@ -390,7 +190,7 @@ async def get_gpt_response(thread_id, message, user_id, db_type='gpt', retries=2
         }, ensure_ascii=False) + "\n"  # Ensure UTF-8 encoding and JSONL format
         
         # Store the batch job in the database
-        add_gpt_batch_job(batch_id, thread_id, user_id, request_data)
+        await add_gpt_batch_job(batch_id, thread_id, user_id, request_data)
         
         # Prepare batch job for OpenAI Batch API
         batch_request = {
@@ -404,9 +204,7 @@ async def get_gpt_response(thread_id, message, user_id, db_type='gpt', retries=2
             "Authorization": f"Bearer {OPENAI_API_KEY}",
             "Content-Type": "application/json"
         }
-        timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
-        
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with shared_session("llm", timeout=LLM_TIMEOUT, pool="llm") as session:
             # Step 1: Upload request data as a file
             try:
                 upload_url = "https://api.openai.com/v1/files"
@@ -420,11 +218,11 @@ async def get_gpt_response(thread_id, message, user_id, db_type='gpt', retries=2
                     logging.info(f"Uploaded batch request file {input_file_id} for thread {thread_id}")
             except aiohttp.ClientResponseError as e:
                 logging.error(f"Error uploading batch request file for thread {thread_id}: {str(e)}, status: {e.status}, message: {e.message}, request_data: {request_data[:100]}...")
-                update_gpt_batch_job(batch_id, "failed")
+                await update_gpt_batch_job(batch_id, "failed")
                 return f"Error: Failed to upload batch request for thread {thread_id}: {str(e)}"
             except Exception as e:
                 logging.error(f"Error uploading batch request file for thread {thread_id}: {str(e)}")
-                update_gpt_batch_job(batch_id, "failed")
+                await update_gpt_batch_job(batch_id, "failed")
                 return f"Error: Failed to upload batch request for thread {thread_id}: {str(e)}"
             
             # Step 2: Submit batch job
@@ -435,16 +233,16 @@ async def get_gpt_response(thread_id, message, user_id, db_type='gpt', retries=2
                     response.raise_for_status()
                     batch_data = await response.json()
                     batch_id = batch_data.get("id")
-                    update_gpt_batch_job(batch_id, "submitted")
+                    await update_gpt_batch_job(batch_id, "submitted")
                     logging.info(f"Submitted batch job {batch_id} for thread {thread_id}")
                     return f"Batch job submitted with ID: {batch_id}. Response will be sent to this thread when ready, or use `!gpt retrieve {batch_id}` in any thread."
             except aiohttp.ClientResponseError as e:
                 logging.error(f"Error submitting batch job for thread {thread_id}: {str(e)}, status: {e.status}, message: {e.message}")
-                update_gpt_batch_job(batch_id, "failed")
+                await update_gpt_batch_job(batch_id, "failed")
                 return f"Error: Failed to submit batch job for thread {thread_id}: {str(e)}"
             except Exception as e:
                 logging.error(f"Error submitting batch job for thread {thread_id}: {str(e)}")
-                update_gpt_batch_job(batch_id, "failed")
+                await update_gpt_batch_job(batch_id, "failed")
                 return f"Error: Failed to submit batch job for thread {thread_id}: {str(e)}"
     except Exception as e:
         logging.error(f"Unexpected error in get_gpt_response for thread {thread_id}: {str(e)}, type: {type(e).__name__}")
@@ -454,14 +252,13 @@ async def check_gpt_batch_jobs(bot, interval=300):
     """Periodically check for completed GPT-4.1 batch jobs."""
     while True:
         try:
-            pending_jobs = get_pending_gpt_batch_jobs()
+            pending_jobs = await get_pending_gpt_batch_jobs()
             logging.info(f"Checking {len(pending_jobs)} pending GPT-4.1 batch jobs")
             headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {OPENAI_API_KEY}"
             }
-            timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with shared_session("llm", timeout=LLM_TIMEOUT, pool="llm") as session:
                 for job in pending_jobs:
                     batch_id = job['batch_id']
                     thread_id = job['thread_id']
@@ -474,7 +271,7 @@ async def check_gpt_batch_jobs(bot, interval=300):
                             batch_data = await response.json()
                             status = batch_data.get("status")
                             if status in ["completed", "failed", "expired", "cancelled"]:
-                                update_gpt_batch_job(batch_id, status, batch_data.get("response_data"), datetime.now().isoformat())
+                                await update_gpt_batch_job(batch_id, status, batch_data.get("response_data"), datetime.now().isoformat())
                                 if status == "completed":
                                     # Retrieve response from output file
                                     output_file_id = batch_data.get("output_file_id")
@@ -487,7 +284,7 @@ async def check_gpt_batch_jobs(bot, interval=300):
                                                 response_data = json.loads(response_text)
                                                 api_response = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
                                                 if api_response:
-                                                    add_message(thread_id, None, "assistant", api_response, db_type='gpt', user_id=user_id, batch_id=batch_id)
+                                                    await add_message(thread_id, None, "assistant", api_response, db_type='gpt', user_id=user_id, batch_id=batch_id)
                                                     thread = bot.get_channel(int(thread_id))
                                                     if thread:
                                                         chunks = [api_response[i:i+1900] for i in range(0, len(api_response), 1900)]
@@ -507,13 +304,13 @@ async def check_gpt_batch_jobs(bot, interval=300):
                                                 thread = bot.get_channel(int(thread_id))
                                                 if thread:
                                                     await thread.send(f"Error: Failed to parse batch response for {batch_id}")
-                                        update_gpt_batch_job(batch_id, "processed", response_text, datetime.now().isoformat())
+                                        await update_gpt_batch_job(batch_id, "processed", response_text, datetime.now().isoformat())
                                     else:
                                         logging.error(f"No output file ID for completed batch {batch_id}")
                                         thread = bot.get_channel(int(thread_id))
                                         if thread:
                                             await thread.send(f"Error: No output file for batch {batch_id}")
-                                        update_gpt_batch_job(batch_id, "failed")
+                                        await update_gpt_batch_job(batch_id, "failed")
                                 elif status in ["failed", "expired", "cancelled"]:
                                     thread = bot.get_channel(int(thread_id))
                                     if thread:
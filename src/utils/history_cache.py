@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict, deque
+
+HISTORY_CACHE_MESSAGES = 50  # số tin gần nhất giữ cho mỗi thread (>= limit mà các provider dùng)
+HISTORY_CACHE_THREADS = 512
+HISTORY_CACHE_CHARS = 8_000_000  # tổng độ dài nội dung tối đa, ước lượng bộ nhớ
+
+class HistoryCache:
+    """LRU các ring buffer (``deque`` có ``maxlen``) chứa tin nhắn gần nhất của từng thread.
+
+    Khóa là (bảng, thread_id, user_id | None), khớp với các bộ lọc của ``get_history``. Tin mới được ghi
+    xuyên (``append``) trên thread ghi ngay sau khi commit, nên dựng prompt không cần đọc đĩa khi thread đã
+    nằm trong cache. Vượt ``max_threads`` hoặc ``max_chars`` thì bỏ thread ít dùng gần đây nhất.
+
+    Một lần nạp từ đĩa (``begin_load`` ... ``finish_load``) trùng với một lần ghi vào cùng thread sẽ không
+    được lưu vào cache, vì ảnh chụp đọc được có thể thiếu tin vừa ghi.
+    """
+
+    def __init__(self, capacity=HISTORY_CACHE_MESSAGES, max_threads=HISTORY_CACHE_THREADS, max_chars=HISTORY_CACHE_CHARS):
+        self.capacity = capacity
+        self.max_threads = max_threads
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (table, thread_id, user_id) -> deque[{"role", "content"}]
+        self._chars = 0
+        self._loading = {}  # (table, thread_id) -> [số lần nạp đang chạy, có ghi xen giữa]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(table, thread_id, user_id=None):
+        return (table, str(thread_id), str(user_id) if user_id else None)
+
+    def get(self, table, thread_id, user_id, limit):
+        """Trả về ``limit`` tin gần nhất (bản sao), hoặc None nếu thread chưa có trong cache."""
+        if limit > self.capacity:
+            return None
+        key = self._key(table, thread_id, user_id)
+        with self._lock:
+            messages = self._entries.get(key)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(message) for message in list(messages)[-limit:]] if limit > 0 else []
+
+    def begin_load(self, table, thread_id):
+        """Gọi trước khi đọc lịch sử từ đĩa để phát hiện tin được ghi trong lúc đọc."""
+        with self._lock:
+            loading = self._loading.setdefault((table, str(thread_id)), [0, False])
+            loading[0] += 1
+
+    def finish_load(self, table, thread_id, user_id, messages):
+        """Lưu kết quả đọc từ đĩa (tối đa ``capacity`` tin gần nhất, theo thứ tự thời gian).
+
+        Kết quả rỗng không được lưu (có thể là lỗi đọc); thread mới sẽ được nạp lại ở lần sau.
+        """
+        thread_key = (table, str(thread_id))
+        with self._lock:
+            loading = self._loading[thread_key]
+            loading[0] -= 1
+            if loading[0] == 0:
+                del self._loading[thread_key]
+            if loading[1] or not messages:
+                return
+            key = self._key(table, thread_id, user_id)
+            self._drop(key)
+            buffer = deque((dict(message) for message in messages[-self.capacity:]), maxlen=self.capacity)
+            self._entries[key] = buffer
+            self._chars += sum(len(message["content"] or "") for message in buffer)
+            self._evict()
+
+    def append(self, table, thread_id, user_id, role, content):
+        """Ghi xuyên một tin vừa lưu vào các bộ đệm của thread (không lọc và lọc theo ``user_id``)."""
+        with self._lock:
+            loading = self._loading.get((table, str(thread_id)))
+            if loading is not None:
+                loading[1] = True
+            keys = {self._key(table, thread_id), self._key(table, thread_id, user_id)}
+            for key in keys:
+                buffer = self._entries.get(key)
+                if buffer is None:
+                    continue
+                if len(buffer) == buffer.maxlen:
+                    self._chars -= len(buffer[0]["content"] or "")
+                buffer.append({"role": role, "content": content})
+                self._chars += len(content or "")
+            self._evict()
+
+    def invalidate(self, table):
+        """Bỏ mọi thread của một bảng (sau khi dọn lịch sử theo chính sách lưu trữ)."""
+        with self._lock:
+            for thread_key, loading in self._loading.items():
+                if thread_key[0] == table:
+                    loading[1] = True
+            for key in [key for key in self._entries if key[0] == table]:
+                self._drop(key)
+
+    def _drop(self, key):
+        buffer = self._entries.pop(key, None)
+        if buffer is not None:
+            self._chars -= sum(len(message["content"] or "") for message in buffer)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_threads or self._chars > self.max_chars):
+            _, buffer = self._entries.popitem(last=False)
+            self._chars -= sum(len(message["content"] or "") for message in buffer)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "threads": len(self._entries),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,101 @@
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+TOTAL_LIMIT = 100
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+# Stream LLM giữ kết nối suốt câu trả lời nên có connector riêng với giới hạn mỗi host cao hơn,
+# để các câu trả lời đồng thời không phải xếp hàng sau nhau (và không chiếm slot của reddit/pixiv/news)
+POOL_LIMITS_PER_HOST = {"default": 10, "llm": 50}
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=60, sock_connect=15)
+LLM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=600)
+
+_connectors = {}
+_sessions = {}
+_stats = defaultdict(int)
+
+async def _on_request_start(session, ctx, params):
+    _stats["requests"] += 1
+
+async def _on_connection_create_end(session, ctx, params):
+    _stats["connections_created"] += 1
+
+async def _on_connection_reuseconn(session, ctx, params):
+    _stats["connections_reused"] += 1
+
+async def _on_dns_cache_hit(session, ctx, params):
+    _stats["dns_cache_hits"] += 1
+
+async def _on_dns_cache_miss(session, ctx, params):
+    _stats["dns_cache_misses"] += 1
+
+def _trace_config():
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    trace.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace.on_dns_cache_hit.append(_on_dns_cache_hit)
+    trace.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return trace
+
+def _get_connector(pool):
+    connector = _connectors.get(pool)
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(
+            limit=TOTAL_LIMIT,
+            limit_per_host=POOL_LIMITS_PER_HOST[pool],
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _connectors[pool] = connector
+    return connector
+
+def get_session(name="default", headers=None, timeout=FETCH_TIMEOUT, pool="default"):
+    """Lấy ClientSession dùng chung theo tên (tạo mới nếu chưa có hoặc đã đóng).
+
+    Các session cùng ``pool`` dùng chung một TCPConnector nên kết nối keep-alive và DNS cache được tái
+    sử dụng giữa các provider; ``headers``/``timeout``/``pool`` chỉ áp dụng khi session được tạo.
+    Mặc định là ``FETCH_TIMEOUT`` (giới hạn tổng thời gian); session stream LLM dùng ``LLM_TIMEOUT`` và pool ``llm``.
+    Phải gọi từ bên trong event loop.
+    """
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=_get_connector(pool),
+            connector_owner=False,
+            headers=headers,
+            timeout=timeout,
+            trace_configs=[_trace_config()],
+        )
+        _sessions[name] = session
+        _stats["sessions_created"] += 1
+    return session
+
+@asynccontextmanager
+async def shared_session(name="default", headers=None, timeout=FETCH_TIMEOUT, pool="default"):
+    """Dùng thay ``async with aiohttp.ClientSession()``: trả về session dùng chung và không đóng nó khi thoát."""
+    yield get_session(name, headers=headers, timeout=timeout, pool=pool)
+
+def get_stats():
+    """Thống kê tái sử dụng kết nối kể từ khi khởi động."""
+    stats = dict(_stats)
+    created = stats.get("connections_created", 0)
+    reused = stats.get("connections_reused", 0)
+    stats["reuse_ratio"] = reused / (created + reused) if created + reused else 0.0
+    stats["open_sessions"] = sum(1 for s in _sessions.values() if not s.closed)
+    return stats
+
+async def close_sessions():
+    """Đóng mọi session và connector dùng chung khi tắt bot."""
+    for name, session in list(_sessions.items()):
+        if not session.closed:
+            await session.close()
+    _sessions.clear()
+    for connector in _connectors.values():
+        if not connector.closed:
+            await connector.close()
+    _connectors.clear()
+    logging.info(f"Closed shared HTTP sessions: {get_stats()}")
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+
+from src.utils.rag_service import RetrievalService
+
+class LazyRAG:
+    """Bọc ``RAG``: SentenceTransformer/torch, FAISS và corpus chỉ được nạp trong một thread nền khi gọi ``start()``.
+
+    Module này không import ``src.utils.rag`` ở top-level nên import ``helpers`` (và khởi động bot)
+    không phải chờ torch. Trước khi nạp xong, ``retrieve()`` trả về ``[]`` để kênh mental vẫn trả lời
+    bình thường, chỉ là không có context.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.error = None
+        self.load_seconds = None
+        self._rag = None
+        self._service = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self):
+        return self._rag is not None
+
+    @property
+    def instance(self):
+        return self._rag
+
+    def start(self):
+        """Bắt đầu nạp trong thread nền (gọi nhiều lần cũng chỉ nạp một lần)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load, name="rag-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            from src.utils.rag import RAG
+            rag = RAG(**self.kwargs)
+            self._service = RetrievalService(rag)
+            self._rag = rag
+            self.load_seconds = time.perf_counter() - start
+            logging.info(f"RAG for {self.kwargs.get('doc_dir')} ready after {self.load_seconds:.1f}s")
+        except Exception as e:
+            self.error = e
+            logging.error(f"Error loading RAG for {self.kwargs.get('doc_dir')}: {str(e)}")
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Chờ nạp xong (dùng cho script/benchmark); trả về True nếu RAG sẵn sàng."""
+        self.start()
+        self._done.wait(timeout)
+        return self.ready
+
+    def retrieve(self, query, top_k=3):
+        if self._rag is None:
+            self.start()
+            logging.info("RAG not ready yet, answering without retrieved context")
+            return []
+        return self._rag.retrieve(query, top_k)
+
+    async def aretrieve(self, query, top_k=3):
+        """Như ``retrieve`` nhưng chạy trong thread truy vấn (gom batch), không chặn event loop.
+
+        Trả về (tài liệu, vector câu hỏi); vector là None nếu RAG chưa sẵn sàng hoặc truy vấn lỗi.
+        """
+        if self._rag is None:
+            self.start()
+            logging.info("RAG not ready yet, answering without retrieved context")
+            return [], None
+        return await self._service.retrieve(query, top_k)
+
+    def stats(self):
+        return self._service.stats() if self._service is not None else {}
+
+    def close(self):
+        if self._service is not None:
+            self._service.close()
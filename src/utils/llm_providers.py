@@ -0,0 +1,108 @@
+import asyncio
+
+import aiohttp
+
+from src.utils.http import get_session, LLM_TIMEOUT
+from src.utils.stream_parser import iter_sse_json, openai_delta_text, gemini_text
+
+class ProviderError(Exception):
+    """Lỗi khi gọi một model. ``status`` là mã HTTP (None nếu lỗi kết nối/timeout)."""
+
+    def __init__(self, provider, message, status=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+    @property
+    def overloaded(self):
+        """429/5xx/lỗi mạng: model đang quá tải hoặc gặp sự cố, nên tính vào circuit breaker."""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class LLMProvider:
+    """Một model có API streaming. Lớp con chỉ cần dựng request và lấy text từ mỗi chunk."""
+
+    def __init__(self, name, model, url, api_key, max_tokens=8192, temperature=0.7, session_name="llm"):
+        self.name = name
+        self.model = model
+        self.url = url
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.session_name = session_name
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+    def build_request(self, messages, extra=None):
+        """Trả về (url, headers, json) cho danh sách message kiểu OpenAI ``{"role", "content"}``."""
+        raise NotImplementedError
+
+    def extract_text(self, payload):
+        raise NotImplementedError
+
+    async def stream(self, messages, extra=None):
+        """Async generator trả về từng đoạn text; lỗi HTTP/mạng được đổi thành ProviderError."""
+        url, headers, data = self.build_request(messages, extra)
+        session = get_session(self.session_name, timeout=LLM_TIMEOUT, pool="llm")
+        try:
+            async with session.post(url, headers=headers, json=data) as response:
+                if response.status >= 400:
+                    body = await response.text()
+                    raise ProviderError(self.name, f"HTTP {response.status}: {body[:200]}", status=response.status)
+                async for payload in iter_sse_json(response.content):
+                    text = self.extract_text(payload)
+                    if text:
+                        yield text
+        except aiohttp.ClientError as e:
+            raise ProviderError(self.name, f"{type(e).__name__}: {str(e)}") from e
+        except asyncio.TimeoutError as e:
+            raise ProviderError(self.name, "timeout") from e
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Groq, xAI và các API chat completions tương thích OpenAI."""
+
+    def build_request(self, messages, extra=None):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "stream": True,
+            "temperature": self.temperature
+        }
+        data.update(extra or {})
+        return self.url, headers, data
+
+    def extract_text(self, payload):
+        return openai_delta_text(payload)
+
+class GeminiProvider(LLMProvider):
+    """Gemini ``streamGenerateContent`` dạng SSE; message ``system`` chuyển thành ``systemInstruction``."""
+
+    def build_request(self, messages, extra=None):
+        contents = []
+        system = []
+        for message in messages:
+            if message["role"] == "system":
+                system.append({"text": message["content"]})
+                continue
+            role = "user" if message["role"] == "user" else "model"
+            contents.append({"role": role, "parts": [{"text": message["content"]}]})
+        data = {
+            "contents": contents,
+            "generationConfig": {
+                "maxOutputTokens": self.max_tokens,
+                "temperature": self.temperature,
+            }
+        }
+        if system:
+            data["systemInstruction"] = {"parts": system}
+        data.update(extra or {})
+        url = f"{self.url.rstrip('/')}/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        return url, {"Content-Type": "application/json"}, data
+
+    def extract_text(self, payload):
+        return gemini_text(payload)
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import time
+
+from src.utils.llm_providers import ProviderError
+
+FAILURE_THRESHOLD = 3      # số lỗi 429/5xx/mạng liên tiếp trước khi ngắt model
+OPEN_SECONDS = 30          # thời gian ngắt trước khi cho một request thử lại (half-open)
+EWMA_ALPHA = 0.3
+STATS_TTL = 300            # số liệu độ trễ cũ hơn thế này được coi như chưa biết (để đo lại model)
+DEFAULT_HEDGE_DELAY = 4.0  # dùng khi chưa có số liệu time-to-first-token của model chính
+HEDGE_FACTOR = 2.0
+HEDGE_MIN_DELAY = 1.0
+HEDGE_MAX_DELAY = 8.0
+MAX_IN_FLIGHT = 2
+RETRY_BACKOFF = 1.0
+
+class CircuitBreaker:
+    """Ngắt một model sau ``threshold`` lỗi quá tải liên tiếp; sau ``open_seconds`` cho đúng một request thử lại."""
+
+    def __init__(self, name, threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def available(self):
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self):
+        """Như ``available()`` nhưng giữ chỗ cho request thử ở trạng thái half-open."""
+        if not self.available():
+            return False
+        if self.state == "half_open":
+            self._probing = True
+        return True
+
+    def release(self):
+        """Request thử bị hủy (thua hedge) mà chưa có kết quả: cho request khác thử lại."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                logging.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+class ModelStats:
+    """EWMA time-to-first-token / tổng thời gian và các bộ đếm của một model."""
+
+    def __init__(self):
+        self.ttft = None
+        self.total = None
+        self.updated_at = 0.0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.hedges = 0
+
+    @staticmethod
+    def _ewma(current, value):
+        return value if current is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * current
+
+    def observe_ttft(self, seconds):
+        self.ttft = self._ewma(self.ttft, seconds)
+        self.updated_at = time.monotonic()
+
+    def observe_total(self, seconds):
+        self.total = self._ewma(self.total, seconds)
+
+    def fresh_ttft(self):
+        if self.ttft is None or time.monotonic() - self.updated_at > STATS_TTL:
+            return None
+        return self.ttft
+
+class _Race:
+    """Trạng thái một lượt gọi: attempt nào nhận được token đầu tiên thì thắng và các attempt khác bị hủy."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.winner = None
+        self.tasks = {}
+
+    def claim(self, task):
+        if self.winner is not None:
+            return self.winner is task
+        self.winner = task
+        for other in self.tasks:
+            if other is not task:
+                other.cancel()
+        return True
+
+class LLMRouter:
+    """Định tuyến request tới một nhóm model tương đương.
+
+    - Chọn model theo độ trễ (EWMA time-to-first-token chia cho ``weights``), bỏ qua model đang bị ngắt.
+    - Hedging: nếu model đầu chưa trả token sau ``hedge_delay`` giây (mặc định tự tính từ EWMA)
+      thì gọi thêm model kế tiếp; model nào ra token trước được stream tiếp, model còn lại bị hủy.
+    - Lỗi thì chuyển ngay sang model kế tiếp; hết model thì thử lại cả lượt sau ``RETRY_BACKOFF``.
+    """
+
+    def __init__(self, name, providers, weights=None, hedge_delay=None, max_in_flight=MAX_IN_FLIGHT,
+                 failure_threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.name = name
+        self.providers = list(providers)
+        self.weights = weights or {}
+        self.hedge_delay = hedge_delay
+        self.max_in_flight = max_in_flight
+        self.breakers = {p.name: CircuitBreaker(p.name, failure_threshold, open_seconds) for p in self.providers}
+        self.stats = {p.name: ModelStats() for p in self.providers}
+
+    def ranked(self):
+        """Các model khả dụng, nhanh nhất trước; model chưa có số liệu (hoặc số liệu cũ) được thử trước để đo."""
+        order = {p.name: i for i, p in enumerate(self.providers)}
+
+        def score(provider):
+            ttft = self.stats[provider.name].fresh_ttft()
+            if ttft is None:
+                return (0.0, order[provider.name])
+            return (ttft / self.weights.get(provider.name, 1.0), order[provider.name])
+
+        return sorted((p for p in self.providers if self.breakers[p.name].available()), key=score)
+
+    def _hedge_delay(self, provider):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        ttft = self.stats[provider.name].fresh_ttft()
+        if ttft is None:
+            return DEFAULT_HEDGE_DELAY
+        return min(max(ttft * HEDGE_FACTOR, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    async def _attempt(self, provider, messages, extra, race):
+        stats = self.stats[provider.name]
+        breaker = self.breakers[provider.name]
+        stats.requests += 1
+        start = time.monotonic()
+        parts = []
+        try:
+            async for text in provider.stream(messages, extra):
+                if not parts:
+                    stats.observe_ttft(time.monotonic() - start)
+                    if not race.claim(asyncio.current_task()):
+                        breaker.release()
+                        return None
+                parts.append(text)
+                if race.stream is not None:
+                    await race.stream.write(text)
+            if not parts:
+                raise ProviderError(provider.name, "no content in streaming response")
+        except ProviderError as e:
+            stats.failures += 1
+            if e.overloaded:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except asyncio.CancelledError:
+            if not parts:
+                # Thua hedge khi chưa có token: thời gian đã chờ là cận dưới của time-to-first-token
+                stats.observe_ttft(time.monotonic() - start)
+            breaker.release()
+            raise
+        stats.successes += 1
+        stats.observe_total(time.monotonic() - start)
+        breaker.record_success()
+        return "".join(parts)
+
+    async def _race(self, messages, stream, extra, label):
+        candidates = self.ranked()
+        race = _Race(stream)
+        errors = []
+        launched_at = 0.0
+
+        def launch():
+            nonlocal launched_at
+            while candidates:
+                provider = candidates.pop(0)
+                if not self.breakers[provider.name].allow():
+                    continue
+                if race.tasks:
+                    self.stats[provider.name].hedges += 1
+                logging.info(f"[{self.name}] Calling {provider.name} for {label} ({len(race.tasks) + 1} in flight)")
+                task = asyncio.create_task(self._attempt(provider, messages, extra, race))
+                race.tasks[task] = provider
+                launched_at = time.monotonic()
+                return True
+            return False
+
+        if not launch():
+            raise ProviderError(self.name, "all models unavailable (circuit open)", status=503)
+        try:
+            while race.tasks:
+                timeout = None
+                if race.winner is None and candidates and len(race.tasks) < self.max_in_flight:
+                    first = next(iter(race.tasks.values()))
+                    timeout = max(0.0, launched_at + self._hedge_delay(first) - time.monotonic())
+                done, _ = await asyncio.wait(list(race.tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.info(f"[{self.name}] No tokens yet for {label}, hedging")
+                    launch()
+                    continue
+                for task in done:
+                    provider = race.tasks.pop(task)
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if race.winner is task:
+                            return task.result()
+                        continue
+                    logging.warning(f"[{self.name}] {provider.name} failed for {label}: {str(error)}")
+                    errors.append(error)
+                    if race.winner is task:
+                        # Model thắng lỗi giữa chừng: xóa phần đã stream rồi chuyển sang model khác
+                        race.winner = None
+                        if stream is not None:
+                            await stream.reset()
+                if not race.tasks:
+                    launch()
+        finally:
+            for task in race.tasks:
+                task.cancel()
+            if race.tasks:
+                await asyncio.gather(*race.tasks, return_exceptions=True)
+        if errors:
+            raise errors[-1]
+        raise ProviderError(self.name, "all models unavailable (circuit open)", status=503)
+
+    async def complete(self, messages, stream=None, extra=None, retries=2, label=""):
+        """Gọi nhóm model và trả về toàn bộ text; ``stream`` (nếu có) nhận text của model thắng.
+
+        Raise ProviderError của lỗi cuối cùng nếu mọi lượt đều thất bại.
+        """
+        error = None
+        for attempt in range(retries):
+            if attempt:
+                await asyncio.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+            try:
+                return await self._race(messages, stream, extra, label)
+            except ProviderError as e:
+                error = e
+                logging.error(f"[{self.name}] Attempt {attempt + 1}/{retries} failed for {label}: {str(e)}")
+        raise error
+
+    def snapshot(self):
+        """Số liệu từng model cho lệnh debug."""
+        result = {}
+        for provider in self.providers:
+            stats = self.stats[provider.name]
+            breaker = self.breakers[provider.name]
+            result[provider.name] = {
+                "state": breaker.state,
+                "ttft": stats.ttft,
+                "total": stats.total,
+                "requests": stats.requests,
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "hedges": stats.hedges,
+            }
+        return result
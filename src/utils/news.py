@@ -5,9 +5,9 @@ import asyncio
 import re
 from datetime import datetime, timedelta
 import pytz
-import aiohttp
+from src.utils.http import shared_session
 from config import NEWS_CHANNEL_ID
-from database import add_news_article, get_db_connection
+from async_database import add_news_article, execute
 
 async def fetch_and_post_news(bot):
     """Lấy tin mới từ VnExpress và gửi đến kênh thông báo."""
@@ -26,7 +26,7 @@ async def fetch_and_post_news(bot):
     for attempt in range(max_retries):
         try:
             logging.debug(f"Thử tải RSS feed, lần {attempt + 1}/{max_retries}")
-            async with aiohttp.ClientSession() as session:
+            async with shared_session("news") as session:
                 async with session.get(rss_url, timeout=10) as resp:
                     if resp.status != 200:
                         logging.error(f"Không tải được RSS feed, mã lỗi: {resp.status}")
@@ -59,40 +59,13 @@ async def fetch_and_post_news(bot):
         logging.warning("Không tìm thấy bài báo nào trong RSS feed của VnExpress.")
         return False
 
-    # Kiểm tra/tạo bảng news_articles và sửa đổi cấu trúc nếu cần
+    # Xóa bài cũ hơn 24 giờ
     try:
-        conn = get_db_connection("news.db")
-        cursor = conn.cursor()
-        # Kiểm tra cấu trúc bảng
-        cursor.execute("PRAGMA table_info(news_articles)")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'article_id' not in columns or 'title' not in columns or 'published' not in columns:
-            logging.warning("Cấu trúc bảng news_articles không đúng, tạo lại bảng")
-            cursor.execute("DROP TABLE IF EXISTS news_articles")
-            cursor.execute("""
-                CREATE TABLE news_articles (
-                    id INTEGER PRIMARY KEY,
-                    article_id TEXT UNIQUE,
-                    title TEXT,
-                    published DATETIME
-                )
-            """)
-            conn.commit()
-            logging.debug("Đã tạo lại bảng news_articles với cấu trúc đúng")
-        else:
-            logging.debug("Cấu trúc bảng news_articles đã đúng")
-        
-        # Xóa bài cũ hơn 24 giờ
         cutoff_time = (datetime.now(pytz.timezone("Asia/Ho_Chi_Minh")) - timedelta(hours=24)).isoformat()
-        cursor.execute("DELETE FROM news_articles WHERE published < ?", (cutoff_time,))
-        conn.commit()
-        logging.debug(f"Đã kiểm tra/tạo bảng news_articles và xóa {cursor.rowcount} bài cũ")
+        deleted = await execute("DELETE FROM news_articles WHERE published < ?", (cutoff_time,))
+        logging.debug(f"Đã xóa {deleted} bài cũ")
     except Exception as e:
-        logging.error(f"Lỗi khi tạo bảng news_articles hoặc xóa bài cũ: {str(e)}", exc_info=True)
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        logging.error(f"Lỗi khi xóa bài cũ: {str(e)}", exc_info=True)
         return False
 
     sent_count = 0
@@ -153,7 +126,7 @@ async def fetch_and_post_news(bot):
 
                 # Gửi embed và lưu vào CSDL sau khi gửi thành công
                 await channel.send(embed=embed)
-                add_news_article(article_id, title, published)
+                await add_news_article(article_id, title, published)
                 logging.info(f"Đã gửi tin: {title}")
                 sent_count += 1
                 new_articles += 1
@@ -169,12 +142,6 @@ async def fetch_and_post_news(bot):
     except Exception as e:
         logging.error(f"Lỗi khi xử lý RSS feed: {str(e)}", exc_info=True)
         return False
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-            logging.debug("Đã đóng kết nối cơ sở dữ liệu")
 
 async def news_task(bot):
     """Tác vụ nền kiểm tra tin mới mỗi 15 phút."""
@@ -5,10 +5,11 @@ import asyncio
 from datetime import datetime
 import pytz
 from pixivpy_async import AppPixivAPI
-import aiohttp
+from src.utils.http import shared_session, FETCH_TIMEOUT
 import io
 from config import IMAGE_CHANNEL_ID, PIXIV_REFRESH_TOKEN, ADMIN_ROLE_ID
-from database import get_db_connection
+from database import get_pool
+from async_database import execute, run_read
 
 class PixivCog(commands.Cog):
     """Cog quản lý chức năng lấy và đăng ảnh từ Pixiv."""
@@ -40,6 +41,15 @@ class PixivCog(commands.Cog):
                 logging.error(f"Lỗi khi đăng nhập Pixiv: {str(e)}", exc_info=True)
                 return False
 
+    def load_pixiv_priorities(self):
+        """Đọc danh sách artist, tag ưu tiên (chạy trên thread cơ sở dữ liệu)."""
+        with get_pool().reader() as cursor:
+            cursor.execute("SELECT value FROM pixiv_priorities WHERE type = 'artist'")
+            priority_artists = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT value FROM pixiv_priorities WHERE type = 'tag'")
+            priority_tags = [row[0] for row in cursor.fetchall()]
+        return priority_artists, priority_tags
+
     async def fetch_and_post_x_images(self):
         """Lấy và đăng ảnh từ Pixiv theo độ ưu tiên."""
         logging.info("Bắt đầu lấy ảnh từ Pixiv")
@@ -55,40 +65,12 @@ class PixivCog(commands.Cog):
         if not await self.refresh_access_token(api):
             return False
 
-        # Kiểm tra/tạo bảng pixiv_priorities
-        try:
-            conn = get_db_connection("pixiv.db")
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS pixiv_priorities (
-                    type TEXT,  -- 'artist' hoặc 'tag'
-                    value TEXT, -- artist_id hoặc tag
-                    PRIMARY KEY (type, value)
-                )
-            """)
-            conn.commit()
-            logging.debug("Đã kiểm tra/tạo bảng pixiv_priorities")
-        except Exception as e:
-            logging.error(f"Lỗi khi tạo bảng pixiv_priorities: {str(e)}", exc_info=True)
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-            return False
-
-        # Lấy danh sách artist và tag ưu tiên
+        # Lấy danh sách artist, tag ưu tiên
         try:
-            cursor.execute("SELECT value FROM pixiv_priorities WHERE type = 'artist'")
-            priority_artists = [row[0] for row in cursor.fetchall()]
-            cursor.execute("SELECT value FROM pixiv_priorities WHERE type = 'tag'")
-            priority_tags = [row[0] for row in cursor.fetchall()]
+            priority_artists, priority_tags = await run_read(self.load_pixiv_priorities)
             logging.debug(f"Artist ưu tiên: {priority_artists}, Tag ưu tiên: {priority_tags}")
         except Exception as e:
             logging.error(f"Lỗi khi lấy artist/tag ưu tiên: {str(e)}", exc_info=True)
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
             return False
 
         # Lấy ảnh từ API Pixiv
@@ -132,7 +114,7 @@ class PixivCog(commands.Cog):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'image/*'
         }
-        async with aiohttp.ClientSession(headers=headers) as session:
+        async with shared_session("pixiv", headers=headers, timeout=FETCH_TIMEOUT) as session:
             for idx, illust in enumerate(prioritized_images[:5]):
                 try:
                     # Log chi tiết cấu trúc dữ liệu
@@ -182,12 +164,6 @@ class PixivCog(commands.Cog):
                     logging.error(f"Lỗi khi xử lý ảnh {illust.title}: {str(e)}", exc_info=True)
                     continue
 
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-            logging.debug("Đã đóng kết nối cơ sở dữ liệu")
-
         logging.info(f"Hoàn tất xử lý và gửi {sent_count} ảnh")
         return sent_count
 
@@ -196,31 +172,20 @@ class PixivCog(commands.Cog):
     async def add_artist(self, ctx, artist_id: str):
         """Thêm artist vào danh sách ưu tiên."""
         try:
-            conn = get_db_connection("pixiv.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO pixiv_priorities (type, value) VALUES (?, ?)", ('artist', artist_id))
-            conn.commit()
+            await execute("INSERT OR IGNORE INTO pixiv_priorities (type, value) VALUES (?, ?)", ('artist', artist_id))
             logging.info(f"Đã thêm artist {artist_id} vào pixiv_priorities bởi {ctx.author.id}")
             await ctx.send(f"Đã thêm artist {artist_id} vào danh sách ưu tiên.")
         except Exception as e:
             logging.error(f"Lỗi khi thêm artist {artist_id}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi thêm artist {artist_id}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="remove_artist")
     @commands.has_role(ADMIN_ROLE_ID)
     async def remove_artist(self, ctx, artist_id: str):
         """Xóa artist khỏi danh sách ưu tiên."""
         try:
-            conn = get_db_connection("pixiv.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM pixiv_priorities WHERE type = 'artist' AND value = ?", (artist_id,))
-            if cursor.rowcount > 0:
-                conn.commit()
+            removed = await execute("DELETE FROM pixiv_priorities WHERE type = 'artist' AND value = ?", (artist_id,)) > 0
+            if removed:
                 logging.info(f"Đã xóa artist {artist_id} khỏi pixiv_priorities bởi {ctx.author.id}")
                 await ctx.send(f"Đã xóa artist {artist_id} khỏi danh sách ưu tiên.")
             else:
@@ -229,42 +194,26 @@ class PixivCog(commands.Cog):
         except Exception as e:
             logging.error(f"Lỗi khi xóa artist {artist_id}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi xóa artist {artist_id}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="add_tag")
     @commands.has_role(ADMIN_ROLE_ID)
     async def add_tag(self, ctx, tag: str):
         """Thêm tag vào danh sách ưu tiên."""
         try:
-            conn = get_db_connection("pixiv.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO pixiv_priorities (type, value) VALUES (?, ?)", ('tag', tag))
-            conn.commit()
+            await execute("INSERT OR IGNORE INTO pixiv_priorities (type, value) VALUES (?, ?)", ('tag', tag))
             logging.info(f"Đã thêm tag {tag} vào pixiv_priorities bởi {ctx.author.id}")
             await ctx.send(f"Đã thêm tag {tag} vào danh sách ưu tiên.")
         except Exception as e:
             logging.error(f"Lỗi khi thêm tag {tag}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi thêm tag {tag}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="remove_tag")
     @commands.has_role(ADMIN_ROLE_ID)
     async def remove_tag(self, ctx, tag: str):
         """Xóa tag khỏi danh sách ưu tiên."""
         try:
-            conn = get_db_connection("pixiv.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM pixiv_priorities WHERE type = 'tag' AND value = ?", (tag,))
-            if cursor.rowcount > 0:
-                conn.commit()
+            removed = await execute("DELETE FROM pixiv_priorities WHERE type = 'tag' AND value = ?", (tag,)) > 0
+            if removed:
                 logging.info(f"Đã xóa tag {tag} khỏi pixiv_priorities bởi {ctx.author.id}")
                 await ctx.send(f"Đã xóa tag {tag} khỏi danh sách ưu tiên.")
             else:
@@ -273,11 +222,6 @@ class PixivCog(commands.Cog):
         except Exception as e:
             logging.error(f"Lỗi khi xóa tag {tag}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi xóa tag {tag}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="post_images_now")
     @commands.has_role(ADMIN_ROLE_ID)
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = 1024
+ANSWER_CACHE_SIZE = 500
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_THRESHOLD = 0.92  # cosine tối thiểu giữa hai câu hỏi để dùng lại câu trả lời
+
+def normalize_query(text):
+    """Khóa cache cho câu hỏi: Unicode NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu ở cuối."""
+    text = unicodedata.normalize("NFC", text).lower()
+    return " ".join(text.split()).rstrip(" ?!.…")
+
+def context_key(documents):
+    """Dấu vân tay của context RAG (các chunk đã truy xuất, theo thứ tự)."""
+    digest = hashlib.sha256()
+    for document in documents:
+        digest.update(document.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class EmbeddingCache:
+    """LRU vector embedding của câu hỏi, theo ``normalize_query``: câu hỏi lặp lại không phải encode lại."""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class SemanticCache:
+    """Cache câu trả lời theo độ gần nghĩa của câu hỏi (tùy chọn, mặc định tắt).
+
+    Một câu trả lời được dùng lại khi câu hỏi mới có cosine với câu hỏi đã lưu >= ``threshold`` **và** context
+    RAG truy xuất được giống hệt (``context_key``), nên tài liệu đổi thì cache tự mất hiệu lực. Mục hết hạn sau
+    ``ttl`` giây; vượt ``max_entries`` thì bỏ mục ít được dùng gần đây nhất.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # id -> (vector, context_key, answer, created)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if now - entry[3] > self.ttl]:
+            del self._entries[entry_id]
+            self.expirations += 1
+
+    def lookup(self, vector, key):
+        """Trả về câu trả lời đã lưu gần nghĩa nhất với ``vector`` (đã chuẩn hóa) cùng context ``key``, hoặc None."""
+        with self._lock:
+            self._expire(time.time())
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry[1] == key]
+            if candidates:
+                scores = np.stack([entry[0] for _, entry in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[2]
+            self.misses += 1
+            return None
+
+    def store(self, vector, key, answer):
+        with self._lock:
+            self._entries[self._next_id] = (vector, key, answer, time.time())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,95 +1,486 @@
 import os
 import json
+import hashlib
 import logging
-from PyPDF2 import PdfReader
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
+from src.utils.chunk_store import ChunkStore
+from src.utils.chunking import Chunker, TokenCounter, iter_file_chunks, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP
+from src.utils.rerank import Reranker, RERANK_BUDGET_MS
+from src.utils.query_cache import EmbeddingCache, normalize_query
+
+MANIFEST_VERSION = 3
+SUPPORTED_EXTENSIONS = (".pdf", ".json", ".jsonl")
+
+INDEX_TYPES = ("auto", "flat", "ivf_flat", "ivf_pq", "hnsw")
+ANN_THRESHOLD = 25000  # IVF cần khoảng 39 * nlist vector để train; dưới ngưỡng này dùng flat (chính xác)
+IVF_NPROBE = 16
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+EMBED_BATCH = 256  # số chunk embed mỗi lần khi nạp một file
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid")
+RRF_K = 60
+HYBRID_CANDIDATES = 20  # số ứng viên lấy từ mỗi nguồn (FAISS, BM25) trước khi trộn
+BUILDS_DIR = "builds"
+CURRENT_FILE = "CURRENT"  # con trỏ tới bản build đang dùng (build_index.py ghi)
+
+def ivf_nlist(ntotal):
+    return max(16, min(65536, int(4 * ntotal ** 0.5)))
+
+def pq_subquantizers(dimension):
+    for m in (64, 48, 32, 24, 16, 12, 8, 4):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def make_index(kind, dimension, ntotal=0):
+    """Tạo index rỗng theo loại (inner product trên vector đã chuẩn hóa = cosine).
+
+    IVF hỗ trợ ``add_with_ids``/``remove_ids`` trực tiếp; flat và HNSW được bọc ``IndexIDMap``.
+    """
+    if kind == "flat":
+        return faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+    if kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap(base)
+    quantizer = faiss.IndexFlatIP(dimension)
+    if kind == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimension, ivf_nlist(ntotal), faiss.METRIC_INNER_PRODUCT)
+    if kind == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dimension, ivf_nlist(ntotal), pq_subquantizers(dimension), 8, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index type: {kind}")
+
+def tune_index(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH):
+    """Đặt tham số tìm kiếm (nprobe cho IVF, efSearch cho HNSW); không lưu trong file index."""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = nprobe
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+    return index
+
+def build_index(kind, dimension, vectors, ids):
+    """Dựng index loại ``kind`` từ vector đã chuẩn hóa (train nếu cần)."""
+    index = make_index(kind, dimension, len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return tune_index(index)
+
+def index_vectors(index):
+    """Lấy lại (ids, vectors) từ index flat/HNSW (lưu nguyên vector)."""
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    if index.ntotal == 0:
+        return ids, np.zeros((0, index.d), dtype="float32")
+    return ids, faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+
+def read_index(path, kind, mmap=True):
+    """Đọc index từ file; ``mmap=True`` thì map file vào bộ nhớ (chỉ đọc) thay vì nạp hết vào RAM.
+
+    IVF dùng ``IO_FLAG_MMAP`` (inverted list trên đĩa); flat/HNSW cần ``IO_FLAG_MMAP_IFC`` (faiss >= 1.10),
+    bản faiss cũ hơn thì đọc bình thường.
+    """
+    flags = 0
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP if kind.startswith("ivf") else getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return tune_index(faiss.read_index(path, flags))
+    except RuntimeError as e:
+        if not flags:
+            raise
+        logging.warning(f"Cannot mmap FAISS index {path}, loading it into memory: {str(e)}")
+        return tune_index(faiss.read_index(path))
+
+def current_build(root):
+    """Thư mục bản build mà ``root/CURRENT`` đang trỏ tới (None nếu chưa có bản build offline)."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, BUILDS_DIR, name)
+    return path if name and os.path.isdir(path) else None
+
+def publish_build(root, name):
+    """Trỏ ``root/CURRENT`` sang bản build ``name`` (ghi nguyên tử); bot đang chạy tự nạp ở lần truy vấn sau."""
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name)
+    _atomic_write(os.path.join(root, CURRENT_FILE), write)
+
+def rrf_fuse(rankings, k=RRF_K):
+    """Reciprocal rank fusion: điểm mỗi ID = tổng ``1 / (k + hạng)`` qua các bảng xếp hạng."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+def normalize(embeddings):
+    embeddings = np.ascontiguousarray(np.array(embeddings, dtype="float32"))
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+def file_hash(filepath):
+    """SHA-256 nội dung file, đọc theo khối để không nạp cả file vào bộ nhớ."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _write_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    _atomic_write(path, write)
 
 class RAG:
-    def __init__(self, embed_model="all-MiniLM-L6-v2", index_path="./data/rag_index", doc_dir="./data/documents"):
+    """Chỉ mục FAISS cho thư mục tài liệu, cập nhật tăng dần theo manifest hash của từng file.
+
+    Mỗi vector có ID riêng (``IndexIDMap``) nên khi file đổi/bị xóa chỉ các vector của file đó bị
+    gỡ (``remove_ids``) và chỉ file mới/đổi được chunk + embed lại. Text chunk nằm trong ``ChunkStore``
+    (SQLite, rowid = ID vector), index được ghi nguyên tử (file tạm + ``os.replace``) rồi mới đến manifest;
+    lúc chạy index được mmap nên cả text lẫn vector đều không phải giữ hết trong RAM.
+
+    Nếu ``index_path/CURRENT`` tồn tại (corpus được dựng offline bằng ``build_index.py``), RAG mở bản build
+    được trỏ tới ở chế độ chỉ đọc (không đồng bộ ``doc_dir``) và ``refresh()`` chuyển sang bản build mới
+    khi con trỏ đổi.
+
+    ``index_type``: ``flat`` (chính xác), ``hnsw``, ``ivf_flat``, ``ivf_pq`` hoặc ``auto`` (flat, chuyển
+    sang IVF-Flat khi vượt ``ANN_THRESHOLD`` vector). IVF chỉ được train khi đủ ``ANN_THRESHOLD`` vector,
+    trước đó vẫn dùng flat.
+
+    Tài liệu được chia bằng ``Chunker`` (theo câu/đoạn, đếm bằng tokenizer của model, chồng lấn
+    ``chunk_overlap`` token); đổi tham số chunk thì index được dựng lại.
+
+    Truy vấn ``hybrid`` (mặc định) trộn kết quả FAISS với BM25 trên ``ChunkStore`` bằng reciprocal rank
+    fusion; nếu có ``rerank_model`` thì các ứng viên đầu bảng được cross-encoder xếp lại trong
+    ``rerank_budget_ms``.
+    """
+
+    def __init__(self, embed_model="all-MiniLM-L6-v2", index_path="./data/rag_index", doc_dir="./data/documents", index_type="auto",
+                 chunk_tokens=DEFAULT_CHUNK_TOKENS, chunk_overlap=DEFAULT_CHUNK_OVERLAP, sync=None, embed_batch=EMBED_BATCH,
+                 hybrid=True, rerank_model=None, rerank_budget_ms=RERANK_BUDGET_MS):
+        if index_type not in INDEX_TYPES:
+            logging.error(f"Unknown RAG index type {index_type}, using auto")
+            index_type = "auto"
+        self.index_type = index_type
+        self.embed_model_name = embed_model
         self.embed_model = SentenceTransformer(embed_model)
-        self.index_path = index_path
+        self.root_path = index_path
+        build = current_build(index_path)
+        self.index_path = build or index_path
+        self.read_only = build is not None
+        self.embed_batch = embed_batch
         self.doc_dir = doc_dir
         self.dimension = self.embed_model.get_sentence_embedding_dimension()
+        max_seq_length = getattr(self.embed_model, "max_seq_length", None)
+        if max_seq_length:
+            # Model cắt bỏ phần vượt max_seq_length (tính cả token [CLS]/[SEP])
+            chunk_tokens = min(chunk_tokens, max_seq_length - 2)
+        self.chunker = Chunker(TokenCounter.for_model(self.embed_model), chunk_tokens, chunk_overlap)
+        self.hybrid = hybrid
+        self.query_cache = EmbeddingCache()
+        self.reranker = None
+        if rerank_model:
+            try:
+                self.reranker = Reranker(rerank_model, rerank_budget_ms)
+            except Exception as e:
+                logging.error(f"Error loading rerank model {rerank_model}, retrieving without rerank: {str(e)}")
         self.index = None
-        self.documents = []
+        self.store = None
+        self.manifest = None
+        self._mmapped = False
+        self._failed_build = None
         self._initialize_index()
-        self._load_documents()
+        if sync is None:
+            sync = not self.read_only
+        if sync:
+            self.sync()
+
+    @property
+    def index_file(self):
+        return os.path.join(self.index_path, "faiss_index.bin")
+
+    @property
+    def chunks_file(self):
+        return os.path.join(self.index_path, "chunks.db")
+
+    @property
+    def manifest_file(self):
+        return os.path.join(self.index_path, "manifest.json")
+
+    def _target_kind(self, ntotal):
+        if self.index_type in ("flat", "hnsw"):
+            return self.index_type
+        if ntotal < ANN_THRESHOLD:
+            return "flat"
+        return "ivf_flat" if self.index_type == "auto" else self.index_type
+
+    def _compatible(self, kind):
+        """Index flat/HNSW giữ nguyên vector nên đổi được sang loại khác; IVF thì chỉ dùng tiếp nếu đúng loại đích."""
+        return kind in ("flat", "hnsw") or kind == self._target_kind(ANN_THRESHOLD)
+
+    def _new_index(self):
+        return tune_index(make_index(self._target_kind(0), self.dimension))
+
+    def _new_manifest(self):
+        return {"version": MANIFEST_VERSION, "model": self.embed_model_name, "metric": "ip",
+                "index": self._target_kind(0), "chunker": self.chunker.signature, "next_id": 0, "files": {}}
 
     def _initialize_index(self):
+        os.makedirs(self.index_path, exist_ok=True)
+        self.store = ChunkStore(self.chunks_file)
         try:
-            if os.path.exists(f"{self.index_path}/faiss_index.bin"):
-                self.index = faiss.read_index(f"{self.index_path}/faiss_index.bin")
-                with open(f"{self.index_path}/documents.json", "r", encoding="utf-8") as f:
-                    self.documents = json.load(f)
-            else:
-                os.makedirs(self.index_path, exist_ok=True)
-                self.index = faiss.IndexFlatL2(self.dimension)
+            if self._load_existing():
+                logging.info(f"Loaded RAG index from {self.index_path}: {self.index.ntotal} vectors, {len(self.manifest['files'])} files")
+                return
         except Exception as e:
             logging.error(f"Error initializing FAISS index: {str(e)}")
-            self.index = faiss.IndexFlatL2(self.dimension)
+        self.index = self._new_index()
+        self.manifest = self._new_manifest()
+        self._mmapped = False
+        if self.read_only:
+            logging.error(f"RAG build {self.index_path} cannot be used, answering without retrieved context until a new build is published")
+        else:
+            self.store.clear()
+
+    def _load_existing(self):
+        """Nạp index + manifest đã lưu nếu còn dùng được; trả về False nếu phải dựng lại từ đầu."""
+        if not os.path.exists(self.manifest_file):
+            if os.path.exists(self.index_file):
+                # Index cũ không có manifest/ID: không biết vector nào thuộc file nào nên dựng lại từ đầu
+                logging.info(f"Legacy RAG index at {self.index_path} has no manifest, rebuilding")
+            return False
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("model") != self.embed_model_name:
+            logging.info(f"RAG manifest at {self.index_path} is for another version/model, rebuilding")
+            return False
+        if manifest.get("chunker") != self.chunker.signature:
+            logging.info(f"RAG index at {self.index_path} was chunked with other settings, rebuilding")
+            return False
+        kind = manifest.get("index")
+        if not self._compatible(kind):
+            logging.info(f"RAG index at {self.index_path} is {kind}, configured {self.index_type}, rebuilding")
+            return False
+        index = read_index(self.index_file, kind)
+        if index.d != self.dimension:
+            logging.info(f"RAG index dimension {index.d} != {self.dimension}, rebuilding")
+            return False
+        expected = sum(len(entry["ids"]) for entry in manifest["files"].values())
+        stored = self.store.count()
+        if index.ntotal != expected or stored != expected:
+            # Crash giữa các lần ghi: index/kho chunk không khớp manifest
+            logging.warning(f"RAG index at {self.index_path} is inconsistent with its manifest ({index.ntotal}/{stored}/{expected}), rebuilding")
+            return False
+        self.index, self.manifest, self._mmapped = index, manifest, True
+        return True
 
-    def _load_documents(self):
+    def _writable(self):
+        """Index mmap chỉ đọc: nạp bản đầy đủ vào RAM trước khi thêm/xóa vector."""
+        if self._mmapped:
+            self.index = read_index(self.index_file, self.manifest["index"], mmap=False)
+            self._mmapped = False
+
+    def sync(self, chunk_files=None):
+        """Đồng bộ index với ``doc_dir``: chỉ embed file mới/đổi, gỡ vector của file đổi/bị xóa.
+
+        ``chunk_files(filepaths)`` sinh ``(filepath, chunks)`` theo đúng thứ tự (mặc định chunk tuần tự từng
+        file; ``build_index.py`` truyền bản trích PDF song song). Trả về True nếu index thay đổi.
+        """
         if not os.path.exists(self.doc_dir):
             os.makedirs(self.doc_dir, exist_ok=True)
-            return
 
-        for filename in os.listdir(self.doc_dir):
-            filepath = os.path.join(self.doc_dir, filename)
+        files = self.manifest["files"]
+        current = {}
+        for filename in sorted(os.listdir(self.doc_dir)):
+            if filename.endswith(SUPPORTED_EXTENSIONS):
+                try:
+                    current[filename] = file_hash(os.path.join(self.doc_dir, filename))
+                except Exception as e:
+                    logging.error(f"Error hashing {filename}: {str(e)}")
+
+        changed = False
+        for filename in [name for name in files if files[name]["hash"] != current.get(name)]:
+            self._remove_file(filename)
+            changed = True
+
+        pending = [os.path.join(self.doc_dir, filename) for filename in current if filename not in files]
+        if chunk_files is None:
+            chunk_files = lambda filepaths: ((filepath, iter_file_chunks(filepath, self.chunker)) for filepath in filepaths)
+        for filepath, chunks in chunk_files(pending):
+            filename = os.path.basename(filepath)
             try:
-                if filename.endswith(".pdf"):
-                    self._process_pdf(filepath)
-                elif filename.endswith(".json"):
-                    self._process_json(filepath)
-                elif filename.endswith(".jsonl"):
-                    self._process_jsonl(filepath)
+                ids = self._index_documents(chunks, filename)
+                files[filename] = {"hash": current[filename], "ids": ids}
+                changed = True
+                logging.info(f"Indexed {len(ids)} chunks from {filename}")
             except Exception as e:
                 logging.error(f"Error processing {filename}: {str(e)}")
 
-        if self.documents:
-            self._index_documents()
-
-    def _process_pdf(self, filepath):
-        with open(filepath, "rb") as f:
-            pdf = PdfReader(f)
-            text = "".join(page.extract_text() or "" for page in pdf.pages)
-            chunks = [text[i:i+512] for i in range(0, len(text), 512)]  # Chunk text to 512 chars
-            self.documents.extend(chunks)
-
-    def _process_json(self, filepath):
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                texts = [json.dumps(item, ensure_ascii=False) for item in data]
-            elif isinstance(data, dict):
-                texts = [json.dumps(data, ensure_ascii=False)]
-            else:
-                texts = [str(data)]
-            self.documents.extend(texts[:512])
-
-    def _process_jsonl(self, filepath):
-        with open(filepath, "r", encoding="utf-8") as f:
-            texts = [json.loads(line.strip()) for line in f if line.strip()]
-            texts = [json.dumps(item, ensure_ascii=False) for item in texts]
-            self.documents.extend(texts[:512])
-
-    def _index_documents(self):
-        if not self.documents:
-            return
-        embeddings = self.embed_model.encode(self.documents, show_progress_bar=False)
-        embeddings = np.array(embeddings).astype("float32")
-        self.index.add(embeddings)
-        faiss.write_index(self.index, f"{self.index_path}/faiss_index.bin")
-        with open(f"{self.index_path}/documents.json", "w", encoding="utf-8") as f:
-            json.dump(self.documents, f, ensure_ascii=False)
+        changed = self._maybe_rebuild_index() or changed
+        if changed:
+            self._save()
+        logging.info(f"RAG index for {self.doc_dir} ready: {self.index.ntotal} vectors ({'updated' if changed else 'unchanged'})")
+        return changed
+
+    def refresh(self):
+        """Chuyển sang bản build mới nếu ``CURRENT`` đã trỏ đi chỗ khác; trả về True nếu đã chuyển.
+
+        Bot khởi động khi chưa có ``CURRENT`` (index tự dựng trong ``root_path``) cũng chuyển sang bản build
+        đầu tiên được công bố, từ đó chỉ đọc. Gọi từ thread truy vấn (``RetrievalService``) nên không có
+        truy vấn nào chạy song song lúc đổi.
+        """
+        build = current_build(self.root_path)
+        if build is None or build == self.index_path or build == self._failed_build:
+            return False
+        previous = (self.index_path, self.index, self.store, self.manifest)
+        self.index_path = build
+        self.store = ChunkStore(self.chunks_file)
+        try:
+            loaded = self._load_existing()
+        except Exception as e:
+            logging.error(f"Error loading RAG build {build}: {str(e)}")
+            loaded = False
+        if not loaded:
+            self.store.close()
+            self.index_path, self.index, self.store, self.manifest = previous
+            self._failed_build = build
+            logging.error(f"Keeping RAG build {self.index_path}, {build} cannot be used")
+            return False
+        previous[2].close()
+        self.read_only = True
+        logging.info(f"Switched RAG to build {build}: {self.index.ntotal} vectors")
+        return True
+
+    def _maybe_rebuild_index(self):
+        """Chuyển flat/HNSW sang loại index đích khi corpus vượt ngưỡng (train IVF/PQ từ vector hiện có)."""
+        current = self.manifest["index"]
+        target = self._target_kind(self.index.ntotal)
+        if current == target or current not in ("flat", "hnsw"):
+            return False
+        ids, vectors = index_vectors(self.index)
+        logging.info(f"Rebuilding RAG index {current} -> {target} with {len(ids)} vectors")
+        self.index = build_index(target, self.dimension, vectors, ids)
+        self.manifest["index"] = target
+        self._mmapped = False
+        return True
+
+    def _remove_ids(self, ids):
+        self._writable()
+        if self.manifest["index"] == "hnsw":
+            # HNSW không hỗ trợ xóa: dựng lại từ các vector còn lại
+            all_ids, vectors = index_vectors(self.index)
+            keep = ~np.isin(all_ids, np.array(ids, dtype="int64"))
+            self.index = build_index("hnsw", self.dimension, vectors[keep], all_ids[keep])
+        else:
+            self.index.remove_ids(np.array(ids, dtype="int64"))
+
+    def _remove_file(self, filename):
+        entry = self.manifest["files"].pop(filename)
+        ids = entry["ids"]
+        if ids:
+            self._remove_ids(ids)
+            self.store.remove_ids(ids)
+        logging.info(f"Removed {len(ids)} stale chunks of {filename} from RAG index")
+
+    def _index_documents(self, chunks, source):
+        """Embed ``chunks`` (iterable, theo lô ``embed_batch``) và thêm vào index với ID mới; trả về danh sách ID.
+
+        Lỗi giữa chừng thì gỡ các chunk đã thêm để index không chứa file dở dang.
+        """
+        ids = []
+        batch = []
+        try:
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= self.embed_batch:
+                    ids.extend(self._add_batch(batch, source))
+                    batch = []
+            if batch:
+                ids.extend(self._add_batch(batch, source))
+        except Exception:
+            if ids:
+                self._remove_ids(ids)
+                self.store.remove_ids(ids)
+            raise
+        return ids
+
+    def _add_batch(self, chunks, source):
+        self._writable()
+        start = self.manifest["next_id"]
+        ids = list(range(start, start + len(chunks)))
+        embeddings = normalize(self.embed_model.encode(chunks, show_progress_bar=False))
+        self.index.add_with_ids(embeddings, np.array(ids, dtype="int64"))
+        self.store.add(ids, source, chunks)
+        self.manifest["next_id"] = start + len(chunks)
+        return ids
+
+    def _save(self):
+        _atomic_write(self.index_file, lambda tmp_path: faiss.write_index(self.index, tmp_path))
+        legacy_documents = os.path.join(self.index_path, "documents.json")
+        if os.path.exists(legacy_documents):
+            os.remove(legacy_documents)
+        _write_json(self.manifest_file, self.manifest)
+        # Bản vừa ghi được map lại từ đĩa, giải phóng bản trong RAM
+        self.index = read_index(self.index_file, self.manifest["index"])
+        self._mmapped = True
+
+    def embed_queries(self, queries):
+        """Vector (đã chuẩn hóa) của các câu hỏi: câu đã gặp lấy từ LRU theo ``normalize_query``, còn lại encode một lần."""
+        keys = [normalize_query(query) for query in queries]
+        vectors = [self.query_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        if missing:
+            fresh = dict(zip(missing, normalize(self.embed_model.encode(missing, show_progress_bar=False))))
+            for key, vector in fresh.items():
+                self.query_cache.put(key, vector)
+            vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return np.stack(vectors)
+
+    def search_batch(self, queries, top_k=3, mode=None, rerank=True, vectors=None):
+        """Tìm kiếm cho nhiều truy vấn một lần; trả về list kết quả theo thứ tự.
+
+        ``mode``: ``dense`` (FAISS), ``bm25`` hoặc ``hybrid`` (mặc định theo ``self.hybrid``). Phần dense encode
+        các câu chưa có trong cache một lần và gọi ``index.search`` một lần; ``vectors`` là kết quả
+        ``embed_queries(queries)`` nếu người gọi đã tính sẵn.
+        """
+        mode = mode or ("hybrid" if self.hybrid else "dense")
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if not queries or self.index.ntotal == 0:
+            return [[] for _ in queries]
+        rerank = rerank and self.reranker is not None
+        pool = max(top_k, self.reranker.pool_size) if rerank else top_k
+        depth = max(pool, HYBRID_CANDIDATES) if mode == "hybrid" else pool
+        rankings = [[] for _ in queries]
+        if mode != "bm25":
+            _, indices = self.index.search(self.embed_queries(queries) if vectors is None else vectors, depth)
+            for ranking, row in zip(rankings, indices):
+                ranking.append([int(idx) for idx in row if idx >= 0])
+        if mode != "dense":
+            for ranking, query in zip(rankings, queries):
+                ranking.append(self.store.search(query, depth))
+        candidates = [rrf_fuse(ranking)[:pool] for ranking in rankings]
+        texts = self.store.get(doc_id for ids in candidates for doc_id in ids)
+        if rerank:
+            candidates = self.reranker.rerank(list(queries), candidates, texts, top_k)
+        return [[texts[doc_id] for doc_id in ids if doc_id in texts][:top_k] for ids in candidates]
 
     def retrieve(self, query, top_k=3):
         try:
-            query_embedding = self.embed_model.encode([query], show_progress_bar=False)[0]
-            query_embedding = np.array([query_embedding]).astype("float32")
-            distances, indices = self.index.search(query_embedding, top_k)
-            return [self.documents[idx] for idx in indices[0] if idx < len(self.documents)]
+            return self.search_batch([query], top_k)[0]
         except Exception as e:
             logging.error(f"Error retrieving documents: {str(e)}")
-            return []
\ No newline at end of file
+            return []
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+BATCH_WINDOW = 0.005  # chờ tối đa 5ms để gom thêm truy vấn đồng thời
+MAX_BATCH = 32
+REFRESH_INTERVAL = 5  # giây giữa hai lần kiểm tra bản build RAG mới (build_index.py)
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+class RetrievalService:
+    """Thread riêng cho truy vấn RAG: gom các truy vấn đến gần nhau thành một batch.
+
+    Mỗi batch chỉ gọi ``encode`` một lần và ``index.search`` một lần với nhiều dòng, nên event loop
+    không bị chặn và chi phí mỗi truy vấn giảm khi nhiều người hỏi cùng lúc. Trước mỗi batch (tối đa
+    ``REFRESH_INTERVAL`` giây một lần) gọi ``rag.refresh()`` để nạp bản build mới mà không cần khởi động lại.
+    """
+
+    def __init__(self, rag, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.rag = rag
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self.swaps = 0
+        self._last_refresh = time.monotonic()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rag-retrieval", daemon=True)
+        self._thread.start()
+
+    async def retrieve(self, query, top_k=3):
+        """Trả về (tài liệu, vector câu hỏi đã chuẩn hóa) để người gọi không phải encode lại câu hỏi."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((query, top_k, loop, future))
+        return await future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = self._collect(item)
+            self._refresh()
+            queries = [query for query, _, _, _ in batch]
+            try:
+                vectors = self.rag.embed_queries(queries)
+                results = self.rag.search_batch(queries, max(top_k for _, top_k, _, _ in batch), vectors=vectors)
+            except Exception as e:
+                logging.error(f"Error retrieving documents for batch of {len(batch)}: {str(e)}")
+                vectors = [None] * len(batch)
+                results = [[] for _ in batch]
+            self.batches += 1
+            self.queries += len(batch)
+            for (query, top_k, loop, future), docs, vector in zip(batch, results, vectors):
+                try:
+                    loop.call_soon_threadsafe(_resolve, future, (docs[:top_k], vector))
+                except RuntimeError:
+                    # Event loop của người gọi đã đóng (bot đang tắt)
+                    pass
+
+    def _refresh(self):
+        if time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+            return
+        self._last_refresh = time.monotonic()
+        try:
+            if self.rag.refresh():
+                self.swaps += 1
+        except Exception as e:
+            logging.error(f"Error refreshing RAG build: {str(e)}")
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": self.queries / self.batches if self.batches else 0.0,
+            "swaps": self.swaps,
+            "embeddings": self.rag.query_cache.stats(),
+            "rerank": self.rag.reranker.stats() if getattr(self.rag, "reranker", None) else None,
+        }
+
+    def close(self):
+        self._queue.put(None)
@@ -5,10 +5,11 @@ import asyncio
 from datetime import datetime
 import pytz
 import asyncpraw
-import aiohttp
+from src.utils.http import get_session, shared_session, FETCH_TIMEOUT
 import io
 from config import IMAGE_CHANNEL_ID, ADMIN_ROLE_ID, REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
-from database import get_db_connection, add_reddit_post, is_reddit_post_sent, migrate_reddit_db
+from database import get_pool
+from async_database import add_reddit_post, is_reddit_post_sent, execute, run_write
 
 class RedditCog(commands.Cog):
     """Cog quản lý chức năng lấy và đăng ảnh từ các subreddit trên Reddit."""
@@ -19,10 +20,13 @@ class RedditCog(commands.Cog):
     async def initialize_reddit(self):
         """Khởi tạo kết nối với Reddit API."""
         try:
+            # asyncpraw đóng session của nó trong reddit.close(), nên dùng session riêng
+            # (vẫn chung connector) thay vì session "reddit" dùng để tải ảnh
             reddit = asyncpraw.Reddit(
                 client_id=REDDIT_CLIENT_ID,
                 client_secret=REDDIT_CLIENT_SECRET,
-                user_agent=REDDIT_USER_AGENT
+                user_agent=REDDIT_USER_AGENT,
+                requestor_kwargs={"session": get_session("reddit-api", timeout=FETCH_TIMEOUT)}
             )
             logging.info("Đã khởi tạo kết nối với Reddit API")
             return reddit
@@ -30,14 +34,14 @@ class RedditCog(commands.Cog):
             logging.error(f"Lỗi khi khởi tạo Reddit API: {str(e)}", exc_info=True)
             return None
 
-    async def fetch_from_subreddit(self, subreddit_name, reddit, image_channel, cursor, priority_users, priority_flairs, session):
+    async def fetch_from_subreddit(self, subreddit_name, reddit, image_channel, priority_users, priority_flairs, session):
         """Lấy và đăng ảnh từ một subreddit cụ thể."""
         posts = []
         try:
             subreddit = await reddit.subreddit(subreddit_name)
             async for submission in subreddit.new(limit=50):  # Lấy 50 bài mới nhất
                 if hasattr(submission, 'url') and submission.url.endswith(('.jpg', '.png', '.jpeg')):
-                    if not is_reddit_post_sent(submission.id, subreddit_name):
+                    if not await is_reddit_post_sent(submission.id, subreddit_name):
                         posts.append(submission)
             logging.info(f"Đã nhận được {len(posts)} bài viết hình ảnh mới từ r/{subreddit_name}")
         except asyncpraw.exceptions.RedditAPIException as e:
@@ -89,7 +93,7 @@ class RedditCog(commands.Cog):
                         await image_channel.send(embed=embed, file=file)
                         # Convert post.created_utc to ISO datetime string
                         posted_at = datetime.utcfromtimestamp(post.created_utc).isoformat()
-                        add_reddit_post(post.id, subreddit_name, post.title, posted_at)
+                        await add_reddit_post(post.id, subreddit_name, post.title, posted_at)
                         sent_count += 1
                     else:
                         logging.error(f"Không tải được ảnh từ {img_url}, mã lỗi: {resp.status}")
@@ -98,6 +102,23 @@ class RedditCog(commands.Cog):
                 logging.error(f"Lỗi khi xử lý bài viết từ r/{subreddit_name}: {str(e)}", exc_info=True)
         return sent_count
 
+    def load_reddit_settings(self):
+        """Đọc danh sách subreddit (thêm subreddit mặc định nếu trống), user, flair ưu tiên (chạy trên thread cơ sở dữ liệu)."""
+        with get_pool().transaction() as cursor:
+            # Lấy danh sách subreddit
+            cursor.execute("SELECT subreddit_name FROM reddit_subreddits")
+            subreddits = [row[0] for row in cursor.fetchall()]
+            if not subreddits:
+                subreddits = ['hentai']  # Mặc định nếu danh sách trống
+                cursor.execute("INSERT OR IGNORE INTO reddit_subreddits (subreddit_name) VALUES (?)", ('hentai',))
+
+            # Lấy danh sách user và flair ưu tiên
+            cursor.execute("SELECT value FROM reddit_priorities WHERE type = 'user'")
+            priority_users = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT value FROM reddit_priorities WHERE type = 'flair'")
+            priority_flairs = [row[0] for row in cursor.fetchall()]
+        return subreddits, priority_users, priority_flairs
+
     async def fetch_and_post_reddit_images(self):
         """Lấy và đăng ảnh từ danh sách subreddit."""
         logging.info("Bắt đầu lấy ảnh từ các subreddit")
@@ -112,70 +133,27 @@ class RedditCog(commands.Cog):
             return False
 
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            # Migrate database to ensure correct schema
-            migrate_reddit_db()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS reddit_priorities (
-                    type TEXT, value TEXT, PRIMARY KEY (type, value)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS reddit_posts (
-                    post_id TEXT, subreddit TEXT, title TEXT, posted_at DATETIME,
-                    PRIMARY KEY (post_id, subreddit)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS reddit_subreddits (
-                    subreddit_name TEXT PRIMARY KEY
-                )
-            """)
-            conn.commit()
-            logging.debug("Đã kiểm tra/tạo bảng reddit_priorities, reddit_posts, và reddit_subreddits")
-
-            # Lấy danh sách subreddit
-            cursor.execute("SELECT subreddit_name FROM reddit_subreddits")
-            subreddits = [row[0] for row in cursor.fetchall()]
-            if not subreddits:
-                subreddits = ['hentai']  # Mặc định nếu danh sách trống
-                cursor.execute("INSERT OR IGNORE INTO reddit_subreddits (subreddit_name) VALUES (?)", ('hentai',))
-                conn.commit()
-
-            # Lấy danh sách user và flair ưu tiên
-            cursor.execute("SELECT value FROM reddit_priorities WHERE type = 'user'")
-            priority_users = [row[0] for row in cursor.fetchall()]
-            cursor.execute("SELECT value FROM reddit_priorities WHERE type = 'flair'")
-            priority_flairs = [row[0] for row in cursor.fetchall()]
+            subreddits, priority_users, priority_flairs = await run_write(self.load_reddit_settings)
             logging.debug(f"Subreddits: {subreddits}, User ưu tiên: {priority_users}, Flair ưu tiên: {priority_flairs}")
         except Exception as e:
-            logging.error(f"Lỗi khi khởi tạo cơ sở dữ liệu: {str(e)}", exc_info=True)
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+            logging.error(f"Lỗi khi đọc cài đặt Reddit: {str(e)}", exc_info=True)
+            await reddit.close()
             return False
 
         headers = {'User-Agent': REDDIT_USER_AGENT}
         total_sent = 0
-        async with aiohttp.ClientSession(headers=headers) as session:
+        async with shared_session("reddit", headers=headers, timeout=FETCH_TIMEOUT) as session:
             for subreddit_name in subreddits:
-                sent = await self.fetch_from_subreddit(subreddit_name, reddit, image_channel, cursor, priority_users, priority_flairs, session)
+                sent = await self.fetch_from_subreddit(subreddit_name, reddit, image_channel, priority_users, priority_flairs, session)
                 total_sent += sent
                 await asyncio.sleep(2)  # Chờ để tránh vượt giới hạn API
 
         try:
-            cursor.execute("DELETE FROM reddit_posts WHERE posted_at < datetime('now', '-24 hours')")
-            conn.commit()
+            await execute("DELETE FROM reddit_posts WHERE posted_at < datetime('now', '-24 hours')")
             logging.debug("Đã xóa các bài viết Reddit cũ hơn 24 giờ")
         except Exception as e:
             logging.error(f"Lỗi khi xóa bài viết cũ: {str(e)}", exc_info=True)
 
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
         await reddit.close()
         logging.info(f"Hoàn tất xử lý và gửi {total_sent} ảnh")
         return total_sent > 0
@@ -185,31 +163,20 @@ class RedditCog(commands.Cog):
     async def add_reddit_user(self, ctx, username: str):
         """Thêm user Reddit vào danh sách ưu tiên."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO reddit_priorities (type, value) VALUES (?, ?)", ('user', username))
-            conn.commit()
+            await execute("INSERT OR IGNORE INTO reddit_priorities (type, value) VALUES (?, ?)", ('user', username))
             logging.info(f"Đã thêm user Reddit {username} vào reddit_priorities bởi {ctx.author.id}")
             await ctx.send(f"Đã thêm user Reddit {username} vào danh sách ưu tiên.")
         except Exception as e:
             logging.error(f"Lỗi khi thêm user Reddit {username}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi thêm user Reddit {username}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="remove_reddit_user")
     @commands.has_role(ADMIN_ROLE_ID)
     async def remove_reddit_user(self, ctx, username: str):
         """Xóa user Reddit khỏi danh sách ưu tiên."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM reddit_priorities WHERE type = 'user' AND value = ?", (username,))
-            if cursor.rowcount > 0:
-                conn.commit()
+            removed = await execute("DELETE FROM reddit_priorities WHERE type = 'user' AND value = ?", (username,)) > 0
+            if removed:
                 logging.info(f"Đã xóa user Reddit {username} khỏi reddit_priorities bởi {ctx.author.id}")
                 await ctx.send(f"Đã xóa user Reddit {username} khỏi danh sách ưu tiên.")
             else:
@@ -218,42 +185,26 @@ class RedditCog(commands.Cog):
         except Exception as e:
             logging.error(f"Lỗi khi xóa user Reddit {username}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi xóa user Reddit {username}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="add_reddit_flair")
     @commands.has_role(ADMIN_ROLE_ID)
     async def add_reddit_flair(self, ctx, flair: str):
         """Thêm flair Reddit vào danh sách ưu tiên."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO reddit_priorities (type, value) VALUES (?, ?)", ('flair', flair))
-            conn.commit()
+            await execute("INSERT OR IGNORE INTO reddit_priorities (type, value) VALUES (?, ?)", ('flair', flair))
             logging.info(f"Đã thêm flair Reddit {flair} vào reddit_priorities bởi {ctx.author.id}")
             await ctx.send(f"Đã thêm flair Reddit {flair} vào danh sách ưu tiên.")
         except Exception as e:
             logging.error(f"Lỗi khi thêm flair Reddit {flair}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi thêm flair Reddit {flair}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="remove_reddit_flair")
     @commands.has_role(ADMIN_ROLE_ID)
     async def remove_reddit_flair(self, ctx, flair: str):
         """Xóa flair Reddit khỏi danh sách ưu tiên."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM reddit_priorities WHERE type = 'flair' AND value = ?", (flair,))
-            if cursor.rowcount > 0:
-                conn.commit()
+            removed = await execute("DELETE FROM reddit_priorities WHERE type = 'flair' AND value = ?", (flair,)) > 0
+            if removed:
                 logging.info(f"Đã xóa flair Reddit {flair} khỏi reddit_priorities bởi {ctx.author.id}")
                 await ctx.send(f"Đã xóa flair Reddit {flair} khỏi danh sách ưu tiên.")
             else:
@@ -262,42 +213,26 @@ class RedditCog(commands.Cog):
         except Exception as e:
             logging.error(f"Lỗi khi xóa flair Reddit {flair}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi xóa flair Reddit {flair}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="add_subreddit")
     @commands.has_role(ADMIN_ROLE_ID)
     async def add_subreddit(self, ctx, subreddit_name: str):
         """Thêm subreddit vào danh sách theo dõi."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO reddit_subreddits (subreddit_name) VALUES (?)", (subreddit_name,))
-            conn.commit()
+            await execute("INSERT OR IGNORE INTO reddit_subreddits (subreddit_name) VALUES (?)", (subreddit_name,))
             logging.info(f"Đã thêm subreddit r/{subreddit_name} bởi {ctx.author.id}")
             await ctx.send(f"Đã thêm subreddit r/{subreddit_name} vào danh sách theo dõi.")
         except Exception as e:
             logging.error(f"Lỗi khi thêm subreddit r/{subreddit_name}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi thêm subreddit r/{subreddit_name}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="remove_subreddit")
     @commands.has_role(ADMIN_ROLE_ID)
     async def remove_subreddit(self, ctx, subreddit_name: str):
         """Xóa subreddit khỏi danh sách theo dõi."""
         try:
-            conn = get_db_connection("reddit.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM reddit_subreddits WHERE subreddit_name = ?", (subreddit_name,))
-            if cursor.rowcount > 0:
-                conn.commit()
+            removed = await execute("DELETE FROM reddit_subreddits WHERE subreddit_name = ?", (subreddit_name,)) > 0
+            if removed:
                 logging.info(f"Đã xóa subreddit r/{subreddit_name} bởi {ctx.author.id}")
                 await ctx.send(f"Đã xóa subreddit r/{subreddit_name} khỏi danh sách theo dõi.")
             else:
@@ -306,11 +241,6 @@ class RedditCog(commands.Cog):
         except Exception as e:
             logging.error(f"Lỗi khi xóa subreddit r/{subreddit_name}: {str(e)}", exc_info=True)
             await ctx.send(f"Lỗi khi xóa subreddit r/{subreddit_name}: {str(e)}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @commands.command(name="post_reddit_images_now")
     @commands.has_role(ADMIN_ROLE_ID)
@@ -0,0 +1,76 @@
+import logging
+import time
+
+RERANK_BUDGET_MS = 150
+RERANK_POOL = 20  # số ứng viên tối đa mỗi câu hỏi đưa vào cross-encoder
+EWMA_ALPHA = 0.3
+
+class Reranker:
+    """Xếp hạng lại ứng viên bằng ``CrossEncoder`` trong giới hạn thời gian ``budget_ms`` cho mỗi batch.
+
+    Thời gian chấm một cặp (câu hỏi, chunk) được ước lượng bằng EWMA; mỗi batch chỉ đưa vào cross-encoder
+    số ứng viên đầu bảng vừa với ngân sách (phần còn lại giữ thứ tự cũ). Không đủ ngân sách cho ``top_k``
+    ứng viên thì bỏ qua bước rerank.
+    """
+
+    def __init__(self, model_name, budget_ms=RERANK_BUDGET_MS, pool_size=RERANK_POOL):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name)
+        self.budget = budget_ms / 1000
+        self.pool_size = pool_size
+        self.pair_seconds = None
+        self.calls = 0
+        self.skipped = 0
+        self.over_budget = 0
+        # Chạy thử để có ước lượng ban đầu (lần gọi đầu của model thường chậm hơn hẳn)
+        self._score([("warmup", "warmup")] * 4)
+
+    def _score(self, pairs):
+        start = time.perf_counter()
+        scores = self.model.predict(pairs, show_progress_bar=False)
+        elapsed = time.perf_counter() - start
+        per_pair = elapsed / len(pairs)
+        self.pair_seconds = per_pair if self.pair_seconds is None else EWMA_ALPHA * per_pair + (1 - EWMA_ALPHA) * self.pair_seconds
+        return scores, elapsed
+
+    def depth(self, num_queries):
+        """Số ứng viên mỗi câu hỏi được chấm lại trong ngân sách."""
+        if not self.pair_seconds:
+            return self.pool_size
+        return min(self.pool_size, int(self.budget / (self.pair_seconds * num_queries)))
+
+    def rerank(self, queries, candidates, texts, top_k):
+        """``candidates``: danh sách ID theo thứ tự hiện tại cho từng câu hỏi; trả về danh sách đã xếp lại."""
+        depth = self.depth(len(queries))
+        if depth < top_k:
+            self.skipped += 1
+            logging.debug(f"Skipping rerank: budget fits {depth} candidates per query, need {top_k}")
+            return candidates
+        heads = [[doc_id for doc_id in ids if doc_id in texts][:depth] for ids in candidates]
+        pairs = [(query, texts[doc_id]) for query, head in zip(queries, heads) for doc_id in head]
+        if not pairs:
+            return candidates
+        scores, elapsed = self._score(pairs)
+        self.calls += 1
+        if elapsed > self.budget:
+            self.over_budget += 1
+            logging.debug(f"Rerank of {len(pairs)} pairs took {elapsed * 1000:.0f}ms (budget {self.budget * 1000:.0f}ms)")
+        reranked = []
+        offset = 0
+        for ids, head in zip(candidates, heads):
+            head_scores = scores[offset:offset + len(head)]
+            offset += len(head)
+            order = [doc_id for _, doc_id in sorted(zip(head_scores, head), key=lambda item: -item[0])]
+            scored = set(head)
+            reranked.append(order + [doc_id for doc_id in ids if doc_id not in scored])
+        return reranked
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "skipped": self.skipped,
+            "over_budget": self.over_budget,
+            "pair_ms": (self.pair_seconds or 0.0) * 1000,
+        }
@@ -0,0 +1,104 @@
+import json
+import logging
+
+SSE_DONE = "[DONE]"
+
+class SSEDecoder:
+    """Bộ giải mã Server-Sent Events tăng dần.
+
+    ``feed()`` nhận từng khối bytes bất kỳ (không cần trùng ranh giới dòng) và trả về danh sách
+    chuỗi ``data`` của các sự kiện đã hoàn chỉnh. Mỗi byte chỉ được quét một lần.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data = []
+
+    def _line(self, line):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if not line:
+            if not self._data:
+                return None
+            event, self._data = "\n".join(self._data), []
+            return event
+        if line.startswith(b":"):
+            return None
+        field, _, value = line.partition(b":")
+        if field == b"data":
+            if value.startswith(b" "):
+                value = value[1:]
+            self._data.append(value.decode("utf-8"))
+        return None
+
+    def feed(self, chunk):
+        search = len(self._buffer)
+        self._buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", max(start, search))
+            if end < 0:
+                break
+            event = self._line(bytes(self._buffer[start:end]))
+            if event is not None:
+                events.append(event)
+            start = end + 1
+        if start:
+            del self._buffer[:start]
+        return events
+
+    def close(self):
+        """Trả về các sự kiện còn lại khi stream kết thúc không có dòng trống cuối."""
+        events = []
+        if self._buffer:
+            event = self._line(bytes(self._buffer))
+            self._buffer.clear()
+            if event is not None:
+                events.append(event)
+        if self._data:
+            events.append("\n".join(self._data))
+            self._data = []
+        return events
+
+def decode_json_events(events):
+    """Parse JSON cho từng sự kiện SSE, bỏ qua ``[DONE]`` và ghi log các sự kiện lỗi."""
+    for event in events:
+        if event == SSE_DONE:
+            continue
+        try:
+            yield json.loads(event)
+        except json.JSONDecodeError as e:
+            logging.error(f"SSE chunk decode error: {str(e)}, chunk: {event[:200]}")
+
+async def iter_sse_json(content):
+    """Duyệt các payload JSON từ một ``aiohttp.StreamReader`` trả về SSE (dừng ở ``data: [DONE]``)."""
+    decoder = SSEDecoder()
+    async for chunk in content.iter_any():
+        events = decoder.feed(chunk)
+        for payload in decode_json_events(events):
+            yield payload
+        if SSE_DONE in events:
+            return
+    for payload in decode_json_events(decoder.close()):
+        yield payload
+
+def openai_delta_text(payload):
+    """Lấy phần text mới từ một chunk streaming kiểu OpenAI (Groq, xAI)."""
+    choices = payload.get("choices")
+    if not choices:
+        return ""
+    return choices[0].get("delta", {}).get("content") or ""
+
+def gemini_text(payload):
+    """Ghép các ``parts[].text`` của candidate đầu tiên trong một chunk Gemini."""
+    candidates = payload.get("candidates")
+    if not candidates:
+        logging.warning(f"Gemini chunk missing 'candidates' or candidates empty: {str(payload)[:200]}")
+        return ""
+    parts = candidates[0].get("content", {}).get("parts")
+    if not parts:
+        # Chunk cuối thường chỉ có finishReason / usageMetadata
+        logging.debug(f"Gemini chunk candidate missing 'content' or 'parts': {str(candidates[0])[:200]}")
+        return ""
+    return "".join(part.get("text", "") for part in parts)